@@ -75,6 +75,31 @@ if __name__ == "__main__":
         default=24,
         help="The number of requests to make to the coding LLM in parallel.",
     )
+    parser.add_argument(
+        "-j",
+        "--concurrency",
+        type=int,
+        default=1,
+        help="The number of pipelines to run at the same time (1 runs them one after the other).",
+    )
+    parser.add_argument(
+        "--priorities",
+        type=str,
+        default="0",
+        help="The priority of each pipeline, higher ones start first and go first for API requests and render workers. (either a single number or a comma-separated list of numbers)",
+    )
+    parser.add_argument(
+        "--quotas",
+        type=str,
+        default="0",
+        help="The most API requests each pipeline may have in flight, 0 for no limit. (either a single number or a comma-separated list of numbers)",
+    )
+    parser.add_argument(
+        "--batch_api",
+        action="store_true",
+        default=False,
+        help="Send the LLM requests through the batch APIs of OpenAI and Anthropic (cheaper, but batches may take up to 24 hours).",
+    )
     parser.add_argument(
         "-f",
         "--force",
@@ -113,6 +138,7 @@ if __name__ == "__main__":
     print("Seed:", args.seed)
     print("Batch Size:", args.batch_size)
     print("Code Batch Size:", args.code_batch_size)
+    print("Concurrency:", args.concurrency)
     print("Name:", args.name)
     print("Types:", args.types)
 
@@ -1,9 +1,13 @@
 import os
+from functools import partial
 
 from pipeline.utils.anthropic_support import CustomAnthropic
+from pipeline.utils.openai_support import CustomOpenAI
+from pipeline.utils.scheduler import PipelineJob, get_scheduler
+from pipeline.utils.response_cache import get_response_cache
+from pipeline.utils.batch_api import BatchOpenAI, BatchAnthropic, BATCH_API_MAX_REQUESTS
 
 from datadreamer import DataDreamer
-from datadreamer.llms import OpenAI
 from datadreamer.steps import concat
 
 from .matplotlib_chart_pipeline import MatplotlibChartPipeline
@@ -39,38 +43,63 @@ from .asymptote_graphic_pipeline import AsymptoteGraphicPipeline
 from .html_document_point_pipeline import HTMLDocumentPointPipeline
 from .html_screen_pipeline import HTMLScreenPipeline
 
+def _per_pipeline(value, num_pipelines, type):
+    # Either a single value for every pipeline or a comma-separated list with one value per pipeline
+    if "," in value:
+        values = [type(v.strip()) for v in value.split(",")]
+        assert len(values) == num_pipelines
+        return values
+    return [type(value)] * num_pipelines
+
+
 def run_datadreamer_session(args):
     if args.qa:
         os.environ["GENERATE_QA"] = "true"
     else:
         os.environ["GENERATE_QA"] = "false"
  
+    # With the batch APIs, the prompts of a step are submitted together as batches instead of one request each
+    OpenAILLM, AnthropicLLM = (BatchOpenAI, BatchAnthropic) if args.batch_api else (CustomOpenAI, CustomAnthropic)
+    batch_size = max(args.batch_size, BATCH_API_MAX_REQUESTS) if args.batch_api else args.batch_size
+    code_batch_size = max(args.code_batch_size, BATCH_API_MAX_REQUESTS) if args.batch_api else args.code_batch_size
+
     with DataDreamer("./session_output"):
-        # Load GPT-4
-        gpt_4o = OpenAI(
-            model_name="gpt-4o",
-            api_key=args.openai_api_key,
-            system_prompt="You are a helpful data scientist.",
-        )
+        def load_llms(pipeline_name, priority):
+            # Every pipeline gets its own LLMs (with their own request threads), tagged so the scheduler
+            # can share the rate limit of each model between the pipelines running at the same time
+            # Load GPT-4
+            gpt_4o = OpenAILLM(
+                model_name="gpt-4o",
+                api_key=args.openai_api_key,
+                system_prompt="You are a helpful data scientist.",
+            )
 
-        gpt_4o_mini = OpenAI(
-            model_name="gpt-4o-mini",
-            api_key=args.openai_api_key,
-            system_prompt="You are a helpful data scientist.",
-        )
+            gpt_4o_mini = OpenAILLM(
+                model_name="gpt-4o-mini",
+                api_key=args.openai_api_key,
+                system_prompt="You are a helpful data scientist.",
+            )
 
-        claude_sonnet = CustomAnthropic(
-            model_name="claude-3-7-sonnet-20250219",
-            api_key=args.anthropic_api_key,
-        )
+            claude_sonnet = AnthropicLLM(
+                model_name="claude-3-7-sonnet-20250219",
+                api_key=args.anthropic_api_key,
+            )
+
+            for model in (gpt_4o, gpt_4o_mini, claude_sonnet):
+                model.pipeline_name = pipeline_name
+                model.priority = priority
+                # The requests the batch APIs fail are sent again as usual, as many at a time as without `--batch_api`
+                model.sync_batch_size = min(args.batch_size, args.code_batch_size)
 
-        if args.llm == "gpt-4o": llm = gpt_4o
-        elif args.llm == "claude-3-7-sonnet-20250219": llm = claude_sonnet
-        elif args.llm == "gpt-4o-mini": llm = gpt_4o_mini
+            if args.llm == "gpt-4o": llm = gpt_4o
+            elif args.llm == "claude-3-7-sonnet-20250219": llm = claude_sonnet
+            elif args.llm == "gpt-4o-mini": llm = gpt_4o_mini
 
-        if args.code_llm == "gpt-4o": code_llm = gpt_4o
-        elif args.code_llm == "claude-sonnet": code_llm = claude_sonnet
-        elif args.code_llm == "gpt-4o-mini": code_llm = gpt_4o_mini
+            if args.code_llm == "gpt-4o": code_llm = gpt_4o
+            elif args.code_llm == "claude-sonnet": code_llm = claude_sonnet
+            elif args.code_llm == "gpt-4o-mini": code_llm = gpt_4o_mini
+
+            return llm, code_llm
 
         # Choose which pipelines to run
         pipelines = {
@@ -107,24 +136,25 @@ def run_datadreamer_session(args):
         }
 
         # Choose how many visualizes per pipeline
-        if "," in args.num:
-            nums = [int(n.strip()) for n in args.num.strip(",")]
-            assert len(nums) == len(pipelines)
-        else:
-            nums = [int(args.num)] * len(pipelines)
+        nums = _per_pipeline(args.num, len(pipelines), int)
+
+        # Pipelines with a higher priority start first and go first for API requests and render workers
+        priorities = _per_pipeline(args.priorities, len(pipelines), int)
+        # The most API requests each pipeline may have in flight (0 for no limit)
+        quotas = _per_pipeline(args.quotas, len(pipelines), int)
         
         # Get figure types
         figure_types = [figure_type.strip() for figure_type in args.types.split(",")]
 
-        # Run each selected pipeline
-        synthetic_visuals = [
-            pipeline(
+        def run_pipeline(pipeline_name, pipeline, num, priority):
+            llm, code_llm = load_llms(pipeline_name, priority)
+            return pipeline(
                 pipeline_name,
                 args={
                     "llm": llm,
                     "code_llm": code_llm,
-                    "batch_size": args.batch_size,
-                    "code_batch_size": args.code_batch_size,
+                    "batch_size": batch_size,
+                    "code_batch_size": code_batch_size,
                     "n": num,
                     "seed": args.seed,
                     "figure_types": figure_types,
@@ -132,8 +162,22 @@ def run_datadreamer_session(args):
                 },
                 force=args.force,
             )
-            for num, (pipeline_name, pipeline) in zip(nums, pipelines.items())
+
+        # Run the selected pipelines at the same time, sharing the API rate limits and the render workers
+        jobs = [
+            PipelineJob(
+                name=pipeline_name,
+                run=partial(run_pipeline, pipeline_name, pipeline, num, priority),
+                priority=priority,
+                quota=quota or None,
+            )
+            for num, priority, quota, (pipeline_name, pipeline) in zip(nums, priorities, quotas, pipelines.items())
         ]
+        synthetic_visuals = get_scheduler().run(jobs, max_concurrent_pipelines=args.concurrency)
+
+        # Report how many requests were answered from the response cache
+        if get_response_cache() is not None:
+            print("LLM response cache:", get_response_cache().stats())
 
         # Combine results from each pipeline
         scifi_dataset = concat(
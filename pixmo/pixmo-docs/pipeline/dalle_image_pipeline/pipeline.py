@@ -5,6 +5,7 @@ from .generate_image_topics import GenerateImageTopics
 from .generate_image_description import GenerateImageDescription
 from .generate_image import GenerateImage
 from .generate_qa import GenerateImageQA
+from ..utils.streaming import run_streaming
 
 
 class DALLEImagePipeline(SuperStep):
@@ -45,45 +46,27 @@ class DALLEImagePipeline(SuperStep):
         )
         
 
-        # Generate Descriptions
-        generated_data = GenerateImageDescription(
-            "Generate Descriptions",
-            inputs={
-                "metadata": generated_image_topics.output["metadata"],
-                "topic": generated_image_topics.output["topic"],
-            },
-            args={
-                "llm": self.args["llm"],
-                "batch_size": self.args["batch_size"],
-            },
-        )
-
-        # Generate Images
-        generated_images = GenerateImage(
-            "Generate Image",
-            inputs={
-                "metadata": generated_data.output["metadata"],
-                "topic": generated_data.output["topic"],
-                "data": generated_data.output["data"],
-            },
-            args={
-                "llm": self.args["llm"],
-                "batch_size": self.args["batch_size"],
-            },
-        )
+        def run_stages(topics, suffix):
+            # Generate Descriptions
+            generated_data = GenerateImageDescription(
+                f"Generate Descriptions{suffix}",
+                inputs={
+                    "metadata": topics.output["metadata"],
+                    "topic": topics.output["topic"],
+                },
+                args={
+                    "llm": self.args["llm"],
+                    "batch_size": self.args["batch_size"],
+                },
+            )
 
-        if not self.args["qa"]:
-            return generated_images.output
-        else:
-            # Generate Q&A
-            generated_qa = GenerateImageQA(
-                "Generate Q&A",
+            # Generate Images
+            generated_images = GenerateImage(
+                f"Generate Image{suffix}",
                 inputs={
-                    "metadata": generated_images.output["metadata"],
-                    "topic": generated_images.output["topic"],
-                    "data": generated_images.output["data"],
-                    "code": generated_images.output["code"],
-                    "image": generated_images.output["image"],
+                    "metadata": generated_data.output["metadata"],
+                    "topic": generated_data.output["topic"],
+                    "data": generated_data.output["data"],
                 },
                 args={
                     "llm": self.args["llm"],
@@ -91,8 +74,30 @@ class DALLEImagePipeline(SuperStep):
                 },
             )
 
-            # Return result
-            return generated_qa.output
+            if not self.args["qa"]:
+                return generated_images
+            else:
+                # Generate Q&A
+                generated_qa = GenerateImageQA(
+                    f"Generate Q&A{suffix}",
+                    inputs={
+                        "metadata": generated_images.output["metadata"],
+                        "topic": generated_images.output["topic"],
+                        "data": generated_images.output["data"],
+                        "code": generated_images.output["code"],
+                        "image": generated_images.output["image"],
+                    },
+                    args={
+                        "llm": self.args["llm"],
+                        "batch_size": self.args["batch_size"],
+                    },
+                )
+
+                # Return result
+                return generated_qa
+
+        # Run the stages after the topics, shard by shard when streaming is enabled
+        return run_streaming(generated_image_topics, run_stages, name="Combine Shards").output
 
     @property
     def version(self):
@@ -1,5 +1,3 @@
-import os
-import tempfile
 import platform
 import subprocess
 import json
@@ -7,25 +5,25 @@ import random
 import warnings
 import pandas as pd
 from io import StringIO
-import signal
 
 from PIL import Image
-from .render_docx import render_docx
+from .render_docx import render_docx, docx_to_bytes
 from datasets.fingerprint import Hasher
 from datadreamer.steps import DataSource, SuperStep, Prompt, zipped
 
 from ..prompts.document_prompts import GENERATE_DOCUMENT_CODE_DOCX_PROMPT
 from ..utils.utils import extract_code, process_image
+from ..utils.sandbox import get_sandbox_pool, SANDBOX_TIMEOUT
+from ..utils.workspace import get_workspace
+from ..utils.scheduler import render_slots
 
-NUM_RENDER_WORKERS = 1
+NUM_RENDER_WORKERS = 4
 
 
-class TimeoutException(Exception):
-    pass
-
-
-def timeout_handler(signum, frame):
-    raise TimeoutException()
+def generate_docx(namespace, data):
+    # Runs in a sandbox worker, after the generated code was executed in `namespace`
+    # Only the saved document comes back, it is rendered by the LibreOffice pool of the map worker
+    return docx_to_bytes(namespace["generate_document"](json.loads(data)))
 
 
 class GenerateDocument(SuperStep):
@@ -95,43 +93,30 @@ class GenerateDocument(SuperStep):
         ).save(name="Save combine with inputs")
 
         # Generate Images
-        def execute_code_and_generate_image(row, timeout=20):
-            original_dir = os.getcwd()
-            os.chdir(tempfile.mkdtemp())
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(timeout)  # set the timeout
-            
+        def execute_code_and_generate_image(row, timeout=SANDBOX_TIMEOUT):
             try:
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    exec(row["code"], globals())
-                    document = generate_document(json.loads(row["data"])) # noqa: F821
-                    image = render_docx(document)
-                    
-                    globals().pop("generate_document", None)
-                    
-                    if not isinstance(image, Image.Image):
-                        raise TypeError()
-                    
-                    row["image"] = process_image(image)
-            except TimeoutException:
-                print(f"Error: Code execution exceeded {timeout} seconds.")
-                row["image"] = None
+                # Run the generated code in an isolated worker process, which is killed if it runs for too long
+                docx_bytes = get_sandbox_pool().run(row["code"], generate_docx, row["data"], timeout=timeout, cwd=get_workspace().directory("row"))
+                image = render_docx(docx_bytes)
+
+                if not isinstance(image, Image.Image):
+                    raise TypeError()
+
+                row["image"] = process_image(image)
             except Exception as e:
                 print(f"Error: {e}")
                 row["image"] = None
-            finally:
-                signal.alarm(0)  # disable the alarm
-                os.chdir(original_dir)
             
             return row
 
-        code_and_images = combined.map(
-            execute_code_and_generate_image,
-            lazy=False,
-            save_num_proc=NUM_RENDER_WORKERS,
-            name="Generate Images",
-        )
+        # Hold render workers shared with the other pipelines running at the same time
+        with render_slots(NUM_RENDER_WORKERS):
+            code_and_images = combined.map(
+                execute_code_and_generate_image,
+                lazy=False,
+                save_num_proc=NUM_RENDER_WORKERS,
+                name="Generate Images",
+            )
 
         # Remove any invalid images
         filtered = code_and_images.filter(
@@ -1,11 +1,9 @@
-import subprocess
-import tempfile
-import os
 import random
-from pdf2image import convert_from_bytes
-from shutil import rmtree
+from io import BytesIO
 from PIL import ImageOps
-from docx2pdf import convert
+
+from ..utils.render import rasterize_pdf
+from ..utils.office import get_office_pool
 
 
 def crop_whitespace(image):
@@ -34,31 +32,26 @@ def crop_whitespace(image):
     return image
 
 
-def render_docx(docx_object):
-    # Create temporary directory as current directory
-    temp_dir = "./"
-
-    # Prepare paths
-    docx_file = os.path.join(temp_dir, "temp.docx")
-    pdf_file = os.path.join(temp_dir, "temp.pdf")
+def docx_to_bytes(docx_object):
+    # Serialize a python-docx Document in memory
+    buffer = BytesIO()
+    docx_object.save(buffer)
+    return buffer.getvalue()
 
-    # Save the docx object to a file
-    docx_object.save(docx_file)
 
-    # Convert DOCX to PDF
-    convert(docx_file, pdf_file)
+def render_docx(docx_object):
+    # docx_object is a python-docx Document, or the bytes of a saved one
+    docx_bytes = docx_object if isinstance(docx_object, bytes) else docx_to_bytes(docx_object)
 
-    # Convert PDF to image
-    images = convert_from_bytes(open(pdf_file, "rb").read())
+    # Convert DOCX to PDF with a headless LibreOffice, in memory
+    pdf_bytes = get_office_pool().convert(docx_bytes, extension="docx", convert_to="pdf")
 
-    # Cleanup temporary files
-    os.remove(docx_file)
-    os.remove(pdf_file)
-    rmtree(temp_dir, ignore_errors=True)
+    # Convert the first page of the PDF to an image
+    image = rasterize_pdf(pdf_bytes)
 
-    # Return the PIL image (assuming single-page document)
-    if images:
-        return crop_whitespace(images[0])  # Return the first page as a PIL image
+    # Return the PIL image of the first page
+    if image is not None:
+        return crop_whitespace(image)
 
     raise RuntimeError("DOCX did not generate anything.")
 
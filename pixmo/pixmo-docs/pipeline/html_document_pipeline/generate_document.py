@@ -1,5 +1,3 @@
-import os
-import tempfile
 import platform
 import subprocess
 import json
@@ -7,7 +5,6 @@ import random
 import warnings
 import pandas as pd
 from io import StringIO
-import signal
 
 from PIL import Image
 from datasets.fingerprint import Hasher
@@ -15,17 +12,11 @@ from datadreamer.steps import DataSource, SuperStep, Prompt, zipped
 
 from ..prompts.document_prompts import GENERATE_DOCUMENT_CODE_HTML_PROMPT
 from ..utils.utils import extract_html, process_image
-from ..utils.render import render_html
+from ..utils.render import render_html_batch
+from ..utils.scheduler import render_slots
 
-NUM_RENDER_WORKERS = 4
-
-
-class TimeoutException(Exception):
-    pass
-
-
-def timeout_handler(signum, frame):
-    raise TimeoutException()
+NUM_RENDER_WORKERS = 2
+RENDER_BATCH_SIZE = 32
 
 
 class GenerateDocument(SuperStep):
@@ -94,40 +85,35 @@ class GenerateDocument(SuperStep):
             combined_inputs, generated_code, name="Combine with inputs"
         ).save(name="Save combine with inputs")
 
-        # Generate Images
-        def execute_code_and_generate_image(row, timeout=20):
-            original_dir = os.getcwd()
-            os.chdir(tempfile.mkdtemp())
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(timeout)  # set the timeout
-            
-            try:
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    image = render_html(row["code"])
-                    
+        # Generate Images, rendering each chunk of rows concurrently in one browser
+        def execute_code_and_generate_images(rows):
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                images = render_html_batch(rows["code"])
+
+            rows["image"] = []
+            for image in images:
+                try:
                     if not isinstance(image, Image.Image):
                         raise TypeError()
-                    
-                    row["image"] = process_image(image, max_size=(3840, 2160), aspect_ratio_threshold=6)
-            except TimeoutException:
-                print(f"Error: Code execution exceeded {timeout} seconds.")
-                row["image"] = None
-            except Exception as e:
-                print(f"Error: {e}")
-                row["image"] = None
-            finally:
-                signal.alarm(0)  # disable the alarm
-                os.chdir(original_dir)
-            
-            return row
-
-        code_and_images = combined.map(
-            execute_code_and_generate_image,
-            lazy=False,
-            save_num_proc=NUM_RENDER_WORKERS,
-            name="Generate Images",
-        )
+
+                    rows["image"].append(process_image(image, max_size=(3840, 2160), aspect_ratio_threshold=6))
+                except Exception as e:
+                    print(f"Error: {e}")
+                    rows["image"].append(None)
+
+            return rows
+
+        # Hold render workers shared with the other pipelines running at the same time
+        with render_slots(NUM_RENDER_WORKERS):
+            code_and_images = combined.map(
+                execute_code_and_generate_images,
+                batched=True,
+                batch_size=RENDER_BATCH_SIZE,
+                lazy=False,
+                save_num_proc=NUM_RENDER_WORKERS,
+                name="Generate Images",
+            )
 
         # Remove any invalid images
         filtered = code_and_images.filter(
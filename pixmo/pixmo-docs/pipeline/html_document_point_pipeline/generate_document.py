@@ -1,5 +1,3 @@
-import os
-import tempfile
 import platform
 import subprocess
 import json
@@ -8,7 +6,6 @@ import warnings
 import pandas as pd
 from io import StringIO
 import hashlib
-import signal
 
 from PIL import Image
 from datasets.fingerprint import Hasher
@@ -16,19 +13,13 @@ from datadreamer.steps import DataSource, SuperStep, Prompt, zipped
 
 from ..prompts.document_prompts import GENERATE_DOCUMENT_CODE_HTML_PROMPT
 from ..utils.utils import extract_html, process_image, insert_point_style_to_html
-from ..utils.render import render_html
+from ..utils.render import render_html_batch
+from ..utils.scheduler import render_slots
 
-NUM_RENDER_WORKERS = 4
+NUM_RENDER_WORKERS = 2
+RENDER_BATCH_SIZE = 32
 POINT_COLOR = "#72A0C1"
 
-class TimeoutException(Exception):
-    pass
-
-
-def timeout_handler(signum, frame):
-    raise TimeoutException()
-
-
 class GenerateDocument(SuperStep):
     CONFIG_HASH = Hasher.hash([GENERATE_DOCUMENT_CODE_HTML_PROMPT])
 
@@ -95,43 +86,38 @@ class GenerateDocument(SuperStep):
             combined_inputs, generated_code, name="Combine with inputs"
         ).save(name="Save combine with inputs")
 
-        # Generate Images
-        def execute_code_and_generate_image(row, timeout=20):
-            original_dir = os.getcwd()
-            os.chdir(tempfile.mkdtemp())
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(timeout)  # set the timeout
-            
-            try:
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    # add additional style to the code
-                    row["code"] = insert_point_style_to_html(row["code"], color=POINT_COLOR)
-
-                    image = render_html(row["code"], random_width=False)
-                    
+        # Generate Images, rendering each chunk of rows concurrently in one browser
+        def execute_code_and_generate_images(rows):
+            # add additional style to the code
+            rows["code"] = [insert_point_style_to_html(code, color=POINT_COLOR) for code in rows["code"]]
+
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                images = render_html_batch(rows["code"], random_width=False)
+
+            rows["image"] = []
+            for image in images:
+                try:
                     if not isinstance(image, Image.Image):
                         raise TypeError()
-                    
-                    row["image"] = image
-            except TimeoutException:
-                print(f"Error: Code execution exceeded {timeout} seconds.")
-                row["image"] = None
-            except Exception as e:
-                print(f"Error: {e}")
-                row["image"] = None
-            finally:
-                signal.alarm(0)  # disable the alarm
-                os.chdir(original_dir)
-            
-            return row
-
-        code_and_images = combined.map(
-            execute_code_and_generate_image,
-            lazy=False,
-            save_num_proc=NUM_RENDER_WORKERS,
-            name="Generate Images",
-        )
+
+                    rows["image"].append(image)
+                except Exception as e:
+                    print(f"Error: {e}")
+                    rows["image"].append(None)
+
+            return rows
+
+        # Hold render workers shared with the other pipelines running at the same time
+        with render_slots(NUM_RENDER_WORKERS):
+            code_and_images = combined.map(
+                execute_code_and_generate_images,
+                batched=True,
+                batch_size=RENDER_BATCH_SIZE,
+                lazy=False,
+                save_num_proc=NUM_RENDER_WORKERS,
+                name="Generate Images",
+            )
 
         # Remove any invalid images
         filtered = code_and_images.filter(
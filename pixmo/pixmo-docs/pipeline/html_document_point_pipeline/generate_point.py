@@ -1,5 +1,6 @@
 import tempfile
 import os
+import re
 import hashlib
 import json
 import random
@@ -13,11 +14,55 @@ import faulthandler
 import signal
 
 from ..utils.render import render_html
-from ..utils.utils import is_json_valid, extract_point_html, extract_points, process_image, modify_html, draw_points
+from ..utils.utils import (
+    is_json_valid, extract_point_html, extract_points, process_image, modify_html, draw_points,
+    find_unused_colors, tag_point_lines, insert_point_colors_to_html,
+)
+from ..utils.scheduler import render_slots
 from ..prompts.document_prompts import GENERATE_DOCUMENT_POINT_PROMPT, POINT_INTENTS, INTENT_PREFIXES
 
 NUM_RENDER_WORKERS = 16
 POINT_COLOR = "#72A0C1"
+# Render the points of all intents in one page, each intent in its own color, instead of one page per intent
+MULTI_POINT_RENDER = True
+
+
+def render_points_in_one_layout(code, point_data, colors):
+    """
+    Adds the points of all intents to the HTML at once, renders it a single time, and
+    separates the points of each intent by their color.
+
+    :param code: The HTML code (with the point style already inserted).
+    :param point_data: The point data of each intent, with their `modified_lines`.
+    :param colors: One color per intent that is not used by the page.
+    :return: The point coordinates of each intent, or None for the intents whose points could not be
+        separated from the single render (e.g. two intents edit the same line, or their points overlap).
+    """
+    modified_html = code
+    for i, point in enumerate(point_data):
+        modified_html = modify_html(modified_html, tag_point_lines(point.get("modified_lines", []), i))
+
+    point_image = render_html(insert_point_colors_to_html(modified_html, colors), random_width=False)
+
+    # the number of points each intent asked for, and how many of them actually made it into the page
+    requested_counts, inserted_counts = [], []
+    for i, point in enumerate(point_data):
+        marker = re.compile(rf"location-point-{i}\b")
+        requested_counts.append(sum(len(marker.findall(modified)) for _, modified in tag_point_lines(point.get("modified_lines", []), i)))
+        inserted_counts.append(len(marker.findall(modified_html)))
+
+    # separate the points of all intents in one pass over the image
+    extracted_coordinates = extract_points(point_image, point_color=colors, max_points=inserted_counts)
+
+    point_coordinates = []
+    for coordinates, num_requested, num_inserted in zip(extracted_coordinates, requested_counts, inserted_counts):
+        if num_requested == 0 or num_inserted < num_requested or coordinates is None or len(coordinates[0]) < num_inserted:
+            point_coordinates.append(None)
+        else:
+            point_coordinates.append(coordinates)
+
+    return point_coordinates
+
 
 class GenerateDocumentPoint(SuperStep):
     CONFIG_HASH = Hasher.hash([GENERATE_DOCUMENT_POINT_PROMPT])
@@ -125,11 +170,27 @@ class GenerateDocumentPoint(SuperStep):
                 return row
 
             # Result was not in cache, compute it
+            # Pick one color per intent that is not used by the page, as far from each other as possible
+            colors = find_unused_colors(row["image"], len(row["point_data"]), exclude=[POINT_COLOR])
+
+            layout_coordinates = [None] * len(row["point_data"])
+            if MULTI_POINT_RENDER and len(row["point_data"]) > 0:
+                try:
+                    layout_coordinates = render_points_in_one_layout(row["code"], row["point_data"], colors)
+                except Exception:
+                    pass
+
             for i in range(len(row["point_data"])):
+                # Fall back to rendering this intent on its own if the single render could not separate its points
+                if layout_coordinates[i] is not None:
+                    row["point_data"][i]["point_coordinates"] = layout_coordinates[i]
+                    continue
+
                 try:
-                    modified_html = modify_html(row["code"], row["point_data"][i]["modified_lines"])
-                    point_image = render_html(modified_html, random_width=False)
-                    point_coordinates = extract_points(point_image, point_color=POINT_COLOR)
+                    modified_html = modify_html(row["code"], tag_point_lines(row["point_data"][i]["modified_lines"], i))
+                    point_image = render_html(insert_point_colors_to_html(modified_html, colors), random_width=False)
+                    num_inserted = len(re.findall(rf"location-point-{i}\b", modified_html))
+                    point_coordinates = extract_points(point_image, point_color=colors[i], max_points=num_inserted)
                     row["point_data"][i]["point_coordinates"] = point_coordinates
                 except Exception as e:
                     row["point_data"][i]["point_coordinates"] = None
@@ -152,12 +213,14 @@ class GenerateDocumentPoint(SuperStep):
                 cache_db.commit()
             return row
         
-        combined_processed = combined.map(
-            process_point,
-            lazy=False,
-            save_num_proc=NUM_RENDER_WORKERS,
-            name="Process Point Data",
-        )
+        # Hold render workers shared with the other pipelines running at the same time
+        with render_slots(NUM_RENDER_WORKERS):
+            combined_processed = combined.map(
+                process_point,
+                lazy=False,
+                save_num_proc=NUM_RENDER_WORKERS,
+                name="Process Point Data",
+            )
 
         # Remove any invalid rows
         filtered = combined_processed.filter(
@@ -5,6 +5,7 @@ from .generate_screen_topics import GenerateScreenTopics
 from .generate_screen_data import GenerateScreenData
 from .generate_screen import GenerateScreen
 from .generate_qa import GenerateScreenQA
+from ..utils.streaming import run_streaming
 
 
 class HTMLScreenPipeline(SuperStep):
@@ -44,45 +45,13 @@ class HTMLScreenPipeline(SuperStep):
             },
         )
 
-        # Generate Data
-        generated_data = GenerateScreenData(
-            "Generate Data",
-            inputs={
-                "metadata": generated_screen_topics.output["metadata"],
-                "topic": generated_screen_topics.output["topic"],
-            },
-            args={
-                "llm": self.args["llm"],
-                "batch_size": self.args["batch_size"],
-            },
-        )
-
-        # Generate Screens
-        generated_screens = GenerateScreen(
-            "Generate Code",
-            inputs={
-                "metadata": generated_data.output["metadata"],
-                "topic": generated_data.output["topic"],
-                "data": generated_data.output["data"],
-            },
-            args={
-                "llm": self.args["code_llm"],
-                "batch_size": self.args["code_batch_size"],
-            },
-        )
-
-        if not self.args["qa"]:
-            return generated_screens.output
-        else:
-            # Generate Q&A
-            generated_qa = GenerateScreenQA(
-                "Generate Q&A",
+        def run_stages(topics, suffix):
+            # Generate Data
+            generated_data = GenerateScreenData(
+                f"Generate Data{suffix}",
                 inputs={
-                    "metadata": generated_screens.output["metadata"],
-                    "topic": generated_screens.output["topic"],
-                    "data": generated_screens.output["data"],
-                    "code": generated_screens.output["code"],
-                    "image": generated_screens.output["image"],
+                    "metadata": topics.output["metadata"],
+                    "topic": topics.output["topic"],
                 },
                 args={
                     "llm": self.args["llm"],
@@ -90,8 +59,44 @@ class HTMLScreenPipeline(SuperStep):
                 },
             )
 
-            # Return result
-            return generated_qa.output
+            # Generate Screens
+            generated_screens = GenerateScreen(
+                f"Generate Code{suffix}",
+                inputs={
+                    "metadata": generated_data.output["metadata"],
+                    "topic": generated_data.output["topic"],
+                    "data": generated_data.output["data"],
+                },
+                args={
+                    "llm": self.args["code_llm"],
+                    "batch_size": self.args["code_batch_size"],
+                },
+            )
+
+            if not self.args["qa"]:
+                return generated_screens
+            else:
+                # Generate Q&A
+                generated_qa = GenerateScreenQA(
+                    f"Generate Q&A{suffix}",
+                    inputs={
+                        "metadata": generated_screens.output["metadata"],
+                        "topic": generated_screens.output["topic"],
+                        "data": generated_screens.output["data"],
+                        "code": generated_screens.output["code"],
+                        "image": generated_screens.output["image"],
+                    },
+                    args={
+                        "llm": self.args["llm"],
+                        "batch_size": self.args["batch_size"],
+                    },
+                )
+
+                # Return result
+                return generated_qa
+
+        # Run the stages after the topics, shard by shard when streaming is enabled
+        return run_streaming(generated_screen_topics, run_stages, name="Combine Shards").output
 
     @property
     def version(self):
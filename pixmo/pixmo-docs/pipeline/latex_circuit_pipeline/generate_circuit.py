@@ -1,5 +1,3 @@
-import os
-import tempfile
 import platform
 import subprocess
 import json
@@ -7,7 +5,6 @@ import random
 import warnings
 import pandas as pd
 from io import StringIO
-import signal
 
 from PIL import Image
 from datasets.fingerprint import Hasher
@@ -16,18 +13,11 @@ from datadreamer.steps import DataSource, SuperStep, Prompt, zipped
 from ..prompts.misc_prompts import GENERATE_CIRCUIT_CODE_LATEX_PROMPT
 from ..utils.utils import extract_latex, process_image
 from ..utils.render import render_latex, crop_whitespace
+from ..utils.scheduler import render_slots
 
 NUM_RENDER_WORKERS = 4
 
 
-class TimeoutException(Exception):
-    pass
-
-
-def timeout_handler(signum, frame):
-    raise TimeoutException()
-
-
 class GenerateCircuit(SuperStep):
     CONFIG_HASH = Hasher.hash([GENERATE_CIRCUIT_CODE_LATEX_PROMPT])
 
@@ -95,39 +85,34 @@ class GenerateCircuit(SuperStep):
 
         # Generate Images
         def execute_code_and_generate_image(row, timeout=20):
-            original_dir = os.getcwd()
-            os.chdir(tempfile.mkdtemp())
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(timeout)  # set the timeout
-            
             try:
                 with warnings.catch_warnings():
                     warnings.simplefilter("ignore")
-                    image = render_latex(row["code"])
+                    # The compilers get `timeout` seconds in total, in subprocesses (the map may run in any thread)
+                    image = render_latex(row["code"], timeout=timeout)
                     
                     if not isinstance(image, Image.Image):
                         raise TypeError()
                     
                     row["image"] = process_image(image, major_px_threshold=0.98)
                     
-            except TimeoutException:
+            except TimeoutError:
                 print(f"Error: Code execution exceeded {timeout} seconds.")
                 row["image"] = None
             except Exception as e:
                 print(f"Error: {e}")
                 row["image"] = None
-            finally:
-                signal.alarm(0)  # disable the alarm
-                os.chdir(original_dir)
             
             return row
 
-        code_and_images = combined.map(
-            execute_code_and_generate_image,
-            lazy=False,
-            save_num_proc=NUM_RENDER_WORKERS,
-            name="Generate Images",
-        )
+        # Hold render workers shared with the other pipelines running at the same time
+        with render_slots(NUM_RENDER_WORKERS):
+            code_and_images = combined.map(
+                execute_code_and_generate_image,
+                lazy=False,
+                save_num_proc=NUM_RENDER_WORKERS,
+                name="Generate Images",
+            )
 
         # Remove any invalid images
         filtered = code_and_images.filter(
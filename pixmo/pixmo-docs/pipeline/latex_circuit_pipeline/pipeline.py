@@ -5,6 +5,7 @@ from .generate_circuit_topics import GenerateCircuitTopics
 from .generate_circuit_data import GenerateCircuitData
 from .generate_circuit import GenerateCircuit
 from .generate_qa import GenerateCircuitQA
+from ..utils.streaming import run_streaming
 
 
 class LaTeXCircuitPipeline(SuperStep):
@@ -44,45 +45,13 @@ class LaTeXCircuitPipeline(SuperStep):
             },
         )
 
-        # Generate Data
-        generated_data = GenerateCircuitData(
-            "Generate Data",
-            inputs={
-                "metadata": generated_circuit_topics.output["metadata"],
-                "topic": generated_circuit_topics.output["topic"],
-            },
-            args={
-                "llm": self.args["llm"],
-                "batch_size": self.args["batch_size"],
-            },
-        )
-
-        # Generate Circuits
-        generated_circuits = GenerateCircuit(
-            "Generate Code",
-            inputs={
-                "metadata": generated_data.output["metadata"],
-                "topic": generated_data.output["topic"],
-                "data": generated_data.output["data"],
-            },
-            args={
-                "llm": self.args["code_llm"],
-                "batch_size": self.args["code_batch_size"],
-            },
-        )
-
-        if not self.args["qa"]:
-            return generated_circuits.output
-        else:
-            # Generate Q&A
-            generated_qa = GenerateCircuitQA(
-                "Generate Q&A",
+        def run_stages(topics, suffix):
+            # Generate Data
+            generated_data = GenerateCircuitData(
+                f"Generate Data{suffix}",
                 inputs={
-                    "metadata": generated_circuits.output["metadata"],
-                    "topic": generated_circuits.output["topic"],
-                    "data": generated_circuits.output["data"],
-                    "code": generated_circuits.output["code"],
-                    "image": generated_circuits.output["image"],
+                    "metadata": topics.output["metadata"],
+                    "topic": topics.output["topic"],
                 },
                 args={
                     "llm": self.args["llm"],
@@ -90,8 +59,44 @@ class LaTeXCircuitPipeline(SuperStep):
                 },
             )
 
-            # Return result
-            return generated_qa.output
+            # Generate Circuits
+            generated_circuits = GenerateCircuit(
+                f"Generate Code{suffix}",
+                inputs={
+                    "metadata": generated_data.output["metadata"],
+                    "topic": generated_data.output["topic"],
+                    "data": generated_data.output["data"],
+                },
+                args={
+                    "llm": self.args["code_llm"],
+                    "batch_size": self.args["code_batch_size"],
+                },
+            )
+
+            if not self.args["qa"]:
+                return generated_circuits
+            else:
+                # Generate Q&A
+                generated_qa = GenerateCircuitQA(
+                    f"Generate Q&A{suffix}",
+                    inputs={
+                        "metadata": generated_circuits.output["metadata"],
+                        "topic": generated_circuits.output["topic"],
+                        "data": generated_circuits.output["data"],
+                        "code": generated_circuits.output["code"],
+                        "image": generated_circuits.output["image"],
+                    },
+                    args={
+                        "llm": self.args["llm"],
+                        "batch_size": self.args["batch_size"],
+                    },
+                )
+
+                # Return result
+                return generated_qa
+
+        # Run the stages after the topics, shard by shard when streaming is enabled
+        return run_streaming(generated_circuit_topics, run_stages, name="Combine Shards").output
 
     @property
     def version(self):
@@ -1,12 +1,10 @@
 import os
-import tempfile
 import platform
 import subprocess
 import json
 import warnings
 import pandas as pd
 from io import StringIO
-import signal
 
 from PIL import Image
 from datasets.fingerprint import Hasher
@@ -15,6 +13,8 @@ from datadreamer.steps import DataSource, SuperStep, Prompt, zipped
 from ..prompts.document_prompts import GENERATE_DOCUMENT_CODE_LATEX_PROMPT
 from ..utils.utils import extract_latex, process_image
 from ..utils.render import render_latex
+from ..utils.workspace import get_workspace
+from ..utils.scheduler import render_slots
 
 NUM_RENDER_WORKERS = 4
 
@@ -22,21 +22,20 @@ NUM_RENDER_WORKERS = 4
 def check_pdflatex():
     from pylatex import Document, Command, NoEscape
 
-    # Create temporary directory
-    temp_dir = tempfile.mkdtemp()
-
-    try:
-        doc = Document("basic")
-        doc.preamble.append(Command("title", "Awesome Title"))
-        doc.append(NoEscape(r"\maketitle"))
-        doc.append(r"This is a test document to check if pdflatex is available.")
-        doc.generate_pdf(
-            os.path.join(temp_dir, "test_document"), clean=True, clean_tex=True
-        )
-    except Exception as e:
-        raise RuntimeError(
-            f"Your system must have pdflatex installed to run this pipeline: {e}"
-        )
+    # Compile the test document in the scratch directory of this worker
+    with get_workspace().job("check") as temp_dir:
+        try:
+            doc = Document("basic")
+            doc.preamble.append(Command("title", "Awesome Title"))
+            doc.append(NoEscape(r"\maketitle"))
+            doc.append(r"This is a test document to check if pdflatex is available.")
+            doc.generate_pdf(
+                os.path.join(temp_dir, "test_document"), clean=True, clean_tex=True
+            )
+        except Exception as e:
+            raise RuntimeError(
+                f"Your system must have pdflatex installed to run this pipeline: {e}"
+            )
 
 
 def check_tools():
@@ -54,14 +53,6 @@ def check_tools():
         )
 
 
-class TimeoutException(Exception):
-    pass
-
-
-def timeout_handler(signum, frame):
-    raise TimeoutException()
-
-
 class GenerateDocument(SuperStep):
     CONFIG_HASH = Hasher.hash([GENERATE_DOCUMENT_CODE_LATEX_PROMPT])
 
@@ -134,38 +125,33 @@ class GenerateDocument(SuperStep):
 
         # Generate Images
         def execute_code_and_generate_image(row, timeout=20):
-            original_dir = os.getcwd()
-            os.chdir(tempfile.mkdtemp())
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(timeout)  # set the timeout
-            
             try:
                 with warnings.catch_warnings():
                     warnings.simplefilter("ignore")
-                    image = render_latex(row["code"])
+                    # The compilers get `timeout` seconds in total, in subprocesses (the map may run in any thread)
+                    image = render_latex(row["code"], timeout=timeout)
                     
                     if not isinstance(image, Image.Image):
                         raise TypeError()
                     
                     row["image"] = process_image(image)
-            except TimeoutException:
+            except TimeoutError:
                 print(f"Error: Code execution exceeded {timeout} seconds.")
                 row["image"] = None
             except Exception as e:
                 print(f"Error: {e}")
                 row["image"] = None
-            finally:
-                signal.alarm(0)  # disable the alarm
-                os.chdir(original_dir)
             
             return row
 
-        code_and_images = combined.map(
-            execute_code_and_generate_image,
-            lazy=False,
-            save_num_proc=NUM_RENDER_WORKERS,
-            name="Generate Images",
-        )
+        # Hold render workers shared with the other pipelines running at the same time
+        with render_slots(NUM_RENDER_WORKERS):
+            code_and_images = combined.map(
+                execute_code_and_generate_image,
+                lazy=False,
+                save_num_proc=NUM_RENDER_WORKERS,
+                name="Generate Images",
+            )
 
         # Remove any invalid images
         filtered = code_and_images.filter(
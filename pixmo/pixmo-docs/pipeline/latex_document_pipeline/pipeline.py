@@ -5,6 +5,7 @@ from .generate_document_topics import GenerateDocumentTopics
 from .generate_document_data import GenerateDocumentData
 from .generate_document import GenerateDocument
 from .generate_qa import GenerateDocumentQA
+from ..utils.streaming import run_streaming
 
 
 class LaTeXDocumentPipeline(SuperStep):
@@ -44,45 +45,13 @@ class LaTeXDocumentPipeline(SuperStep):
             },
         )
 
-        # Generate Data
-        generated_data = GenerateDocumentData(
-            "Generate Data",
-            inputs={
-                "metadata": generated_document_topics.output["metadata"],
-                "topic": generated_document_topics.output["topic"],
-            },
-            args={
-                "llm": self.args["llm"],
-                "batch_size": self.args["batch_size"],
-            },
-        )
-
-        # Generate Documents
-        generated_documents = GenerateDocument(
-            "Generate Code",
-            inputs={
-                "metadata": generated_data.output["metadata"],
-                "topic": generated_data.output["topic"],
-                "data": generated_data.output["data"],
-            },
-            args={
-                "llm": self.args["code_llm"],
-                "batch_size": self.args["code_batch_size"],
-            },
-        )
-
-        if not self.args["qa"]:
-            return generated_documents.output
-        else:
-            # Generate Q&A
-            generated_qa = GenerateDocumentQA(
-                "Generate Q&A",
+        def run_stages(topics, suffix):
+            # Generate Data
+            generated_data = GenerateDocumentData(
+                f"Generate Data{suffix}",
                 inputs={
-                    "metadata": generated_documents.output["metadata"],
-                    "topic": generated_documents.output["topic"],
-                    "data": generated_documents.output["data"],
-                    "code": generated_documents.output["code"],
-                    "image": generated_documents.output["image"],
+                    "metadata": topics.output["metadata"],
+                    "topic": topics.output["topic"],
                 },
                 args={
                     "llm": self.args["llm"],
@@ -90,8 +59,44 @@ class LaTeXDocumentPipeline(SuperStep):
                 },
             )
 
-            # Return result
-            return generated_qa.output
+            # Generate Documents
+            generated_documents = GenerateDocument(
+                f"Generate Code{suffix}",
+                inputs={
+                    "metadata": generated_data.output["metadata"],
+                    "topic": generated_data.output["topic"],
+                    "data": generated_data.output["data"],
+                },
+                args={
+                    "llm": self.args["code_llm"],
+                    "batch_size": self.args["code_batch_size"],
+                },
+            )
+
+            if not self.args["qa"]:
+                return generated_documents
+            else:
+                # Generate Q&A
+                generated_qa = GenerateDocumentQA(
+                    f"Generate Q&A{suffix}",
+                    inputs={
+                        "metadata": generated_documents.output["metadata"],
+                        "topic": generated_documents.output["topic"],
+                        "data": generated_documents.output["data"],
+                        "code": generated_documents.output["code"],
+                        "image": generated_documents.output["image"],
+                    },
+                    args={
+                        "llm": self.args["llm"],
+                        "batch_size": self.args["batch_size"],
+                    },
+                )
+
+                # Return result
+                return generated_qa
+
+        # Run the stages after the topics, shard by shard when streaming is enabled
+        return run_streaming(generated_document_topics, run_stages, name="Combine Shards").output
 
     @property
     def version(self):
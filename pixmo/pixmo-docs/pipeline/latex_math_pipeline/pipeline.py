@@ -5,6 +5,7 @@ from .generate_math_topics import GenerateMathTopics
 from .generate_math_data import GenerateMathData
 from .generate_math import GenerateMath
 from .generate_qa import GenerateMathQA
+from ..utils.streaming import run_streaming
 
 
 class LaTeXMathPipeline(SuperStep):
@@ -44,45 +45,13 @@ class LaTeXMathPipeline(SuperStep):
             },
         )
 
-        # Generate Data
-        generated_data = GenerateMathData(
-            "Generate Data",
-            inputs={
-                "metadata": generated_math_topics.output["metadata"],
-                "topic": generated_math_topics.output["topic"],
-            },
-            args={
-                "llm": self.args["llm"],
-                "batch_size": self.args["batch_size"],
-            },
-        )
-
-        # Generate Maths
-        generated_maths = GenerateMath(
-            "Generate Code",
-            inputs={
-                "metadata": generated_data.output["metadata"],
-                "topic": generated_data.output["topic"],
-                "data": generated_data.output["data"],
-            },
-            args={
-                "llm": self.args["code_llm"],
-                "batch_size": self.args["code_batch_size"],
-            },
-        )
-
-        if not self.args["qa"]:
-            return generated_maths.output
-        else:
-            # Generate Q&A
-            generated_qa = GenerateMathQA(
-                "Generate Q&A",
+        def run_stages(topics, suffix):
+            # Generate Data
+            generated_data = GenerateMathData(
+                f"Generate Data{suffix}",
                 inputs={
-                    "metadata": generated_maths.output["metadata"],
-                    "topic": generated_maths.output["topic"],
-                    "data": generated_maths.output["data"],
-                    "code": generated_maths.output["code"],
-                    "image": generated_maths.output["image"],
+                    "metadata": topics.output["metadata"],
+                    "topic": topics.output["topic"],
                 },
                 args={
                     "llm": self.args["llm"],
@@ -90,8 +59,44 @@ class LaTeXMathPipeline(SuperStep):
                 },
             )
 
-            # Return result
-            return generated_qa.output
+            # Generate Maths
+            generated_maths = GenerateMath(
+                f"Generate Code{suffix}",
+                inputs={
+                    "metadata": generated_data.output["metadata"],
+                    "topic": generated_data.output["topic"],
+                    "data": generated_data.output["data"],
+                },
+                args={
+                    "llm": self.args["code_llm"],
+                    "batch_size": self.args["code_batch_size"],
+                },
+            )
+
+            if not self.args["qa"]:
+                return generated_maths
+            else:
+                # Generate Q&A
+                generated_qa = GenerateMathQA(
+                    f"Generate Q&A{suffix}",
+                    inputs={
+                        "metadata": generated_maths.output["metadata"],
+                        "topic": generated_maths.output["topic"],
+                        "data": generated_maths.output["data"],
+                        "code": generated_maths.output["code"],
+                        "image": generated_maths.output["image"],
+                    },
+                    args={
+                        "llm": self.args["llm"],
+                        "batch_size": self.args["batch_size"],
+                    },
+                )
+
+                # Return result
+                return generated_qa
+
+        # Run the stages after the topics, shard by shard when streaming is enabled
+        return run_streaming(generated_math_topics, run_stages, name="Combine Shards").output
 
     @property
     def version(self):
@@ -1,5 +1,4 @@
 import os
-import tempfile
 import platform
 import subprocess
 import json
@@ -7,7 +6,6 @@ import random
 import warnings
 import pandas as pd
 from io import StringIO
-import signal
 
 from PIL import Image
 from datasets.fingerprint import Hasher
@@ -15,17 +13,11 @@ from datadreamer.steps import DataSource, SuperStep, Prompt, zipped
 
 from ..prompts.misc_prompts import GENERATE_MUSIC_CODE_LILYPOND_PROMPT
 from ..utils.utils import extract_lilypond, process_image
-from ..utils.render import render_music, crop_whitespace
+from ..utils.render import render_music_batch, crop_whitespace
+from ..utils.scheduler import render_slots
 
-NUM_RENDER_WORKERS = 1
-
-
-class TimeoutException(Exception):
-    pass
-
-
-def timeout_handler(signum, frame):
-    raise TimeoutException()
+NUM_RENDER_WORKERS = 4
+RENDER_BATCH_SIZE = 32
 
 
 class GenerateMusic(SuperStep):
@@ -95,40 +87,34 @@ class GenerateMusic(SuperStep):
         ).save(name="Save combine with inputs")
 
         # Generate Images
-        def execute_code_and_generate_image(row, timeout=20):
-            original_dir = os.getcwd()
-            os.chdir(tempfile.mkdtemp())
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(timeout)  # set the timeout
-            
-            try:
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    image = render_music(row["code"])
-                    
+        def execute_code_and_generate_images(rows):
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                images = render_music_batch(rows["code"])
+
+            rows["image"] = []
+            for image in images:
+                try:
                     if not isinstance(image, Image.Image):
                         raise TypeError()
 
-                    row["image"] = crop_whitespace(process_image(image, major_px_threshold=0.98))
-                    
-            except TimeoutException:
-                print(f"Error: Code execution exceeded {timeout} seconds.")
-                row["image"] = None
-            except Exception as e:
-                print(f"Error: {e}")
-                row["image"] = None
-            finally:
-                signal.alarm(0)  # disable the alarm
-                os.chdir(original_dir)
-            
-            return row
-
-        code_and_images = combined.map(
-            execute_code_and_generate_image,
-            lazy=False,
-            save_num_proc=NUM_RENDER_WORKERS,
-            name="Generate Images",
-        )
+                    rows["image"].append(crop_whitespace(process_image(image, major_px_threshold=0.98)))
+                except Exception as e:
+                    print(f"Error: {e}")
+                    rows["image"].append(None)
+
+            return rows
+
+        # Hold render workers shared with the other pipelines running at the same time
+        with render_slots(NUM_RENDER_WORKERS):
+            code_and_images = combined.map(
+                execute_code_and_generate_images,
+                batched=True,
+                batch_size=RENDER_BATCH_SIZE,
+                lazy=False,
+                save_num_proc=NUM_RENDER_WORKERS,
+                name="Generate Images",
+            )
 
         # Remove any invalid images
         filtered = code_and_images.filter(
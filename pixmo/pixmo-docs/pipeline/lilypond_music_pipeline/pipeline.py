@@ -5,6 +5,7 @@ from .generate_music_topics import GenerateMusicTopics
 from .generate_music_data import GenerateMusicData
 from .generate_music import GenerateMusic
 from .generate_qa import GenerateMusicQA
+from ..utils.streaming import run_streaming
 
 
 class LilyPondMusicPipeline(SuperStep):
@@ -44,45 +45,13 @@ class LilyPondMusicPipeline(SuperStep):
             },
         )
 
-        # Generate Data
-        generated_data = GenerateMusicData(
-            "Generate Data",
-            inputs={
-                "metadata": generated_music_topics.output["metadata"],
-                "topic": generated_music_topics.output["topic"],
-            },
-            args={
-                "llm": self.args["llm"],
-                "batch_size": self.args["batch_size"],
-            },
-        )
-
-        # Generate Musics
-        generated_musics = GenerateMusic(
-            "Generate Code",
-            inputs={
-                "metadata": generated_data.output["metadata"],
-                "topic": generated_data.output["topic"],
-                "data": generated_data.output["data"],
-            },
-            args={
-                "llm": self.args["code_llm"],
-                "batch_size": self.args["code_batch_size"],
-            },
-        )
-
-        if not self.args["qa"]:
-            return generated_musics.output
-        else:
-            # Generate Q&A
-            generated_qa = GenerateMusicQA(
-                "Generate Q&A",
+        def run_stages(topics, suffix):
+            # Generate Data
+            generated_data = GenerateMusicData(
+                f"Generate Data{suffix}",
                 inputs={
-                    "metadata": generated_musics.output["metadata"],
-                    "topic": generated_musics.output["topic"],
-                    "data": generated_musics.output["data"],
-                    "code": generated_musics.output["code"],
-                    "image": generated_musics.output["image"],
+                    "metadata": topics.output["metadata"],
+                    "topic": topics.output["topic"],
                 },
                 args={
                     "llm": self.args["llm"],
@@ -90,8 +59,44 @@ class LilyPondMusicPipeline(SuperStep):
                 },
             )
 
-            # Return result
-            return generated_qa.output
+            # Generate Musics
+            generated_musics = GenerateMusic(
+                f"Generate Code{suffix}",
+                inputs={
+                    "metadata": generated_data.output["metadata"],
+                    "topic": generated_data.output["topic"],
+                    "data": generated_data.output["data"],
+                },
+                args={
+                    "llm": self.args["code_llm"],
+                    "batch_size": self.args["code_batch_size"],
+                },
+            )
+
+            if not self.args["qa"]:
+                return generated_musics
+            else:
+                # Generate Q&A
+                generated_qa = GenerateMusicQA(
+                    f"Generate Q&A{suffix}",
+                    inputs={
+                        "metadata": generated_musics.output["metadata"],
+                        "topic": generated_musics.output["topic"],
+                        "data": generated_musics.output["data"],
+                        "code": generated_musics.output["code"],
+                        "image": generated_musics.output["image"],
+                    },
+                    args={
+                        "llm": self.args["llm"],
+                        "batch_size": self.args["batch_size"],
+                    },
+                )
+
+                # Return result
+                return generated_qa
+
+        # Run the stages after the topics, shard by shard when streaming is enabled
+        return run_streaming(generated_music_topics, run_stages, name="Combine Shards").output
 
     @property
     def version(self):
@@ -1,5 +1,3 @@
-import os
-import tempfile
 import platform
 import subprocess
 import json
@@ -7,7 +5,6 @@ import random
 import warnings
 import pandas as pd
 from io import StringIO
-import signal
 
 from PIL import Image
 from datasets.fingerprint import Hasher
@@ -15,16 +12,21 @@ from datadreamer.steps import DataSource, SuperStep, Prompt, zipped
 
 from ..prompts.table_prompts import GENERATE_TABLE_CODE_MATPLOTLIB_PROMPT
 from ..utils.utils import extract_code, process_image
+from ..utils.sandbox import get_sandbox_pool, SANDBOX_TIMEOUT
+from ..utils.workspace import get_workspace
+from ..utils.scheduler import render_slots
 
-NUM_RENDER_WORKERS = 1
+NUM_RENDER_WORKERS = 4
 
 
-class TimeoutException(Exception):
-    pass
+def generate_image(namespace, data):
+    # Runs in a sandbox worker, after the generated code was executed in `namespace`
+    image = namespace["generate_table"](pd.read_csv(StringIO(data)))
 
+    if not isinstance(image, Image.Image):
+        raise TypeError()
 
-def timeout_handler(signum, frame):
-    raise TimeoutException()
+    return process_image(image)
 
 
 class GenerateTable(SuperStep):
@@ -101,41 +103,24 @@ class GenerateTable(SuperStep):
         ).save(name="Save combine with inputs")
 
         # Generate Images
-        def execute_code_and_generate_image(row, timeout=20):
-            original_dir = os.getcwd()
-            os.chdir(tempfile.mkdtemp())
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(timeout)  # set the timeout
-            
+        def execute_code_and_generate_image(row, timeout=SANDBOX_TIMEOUT):
             try:
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    exec(row["code"], globals())
-                    image = generate_table(pd.read_csv(StringIO(row["data"]))) # noqa: F821
-                    globals().pop("generate_table", None)
-                    
-                    if not isinstance(image, Image.Image):
-                        raise TypeError()
-                    
-                    row["image"] = process_image(image)
-            except TimeoutException:
-                print(f"Error: Code execution exceeded {timeout} seconds.")
-                row["image"] = None
+                # Run the generated code in an isolated worker process, which is killed if it runs for too long
+                row["image"] = get_sandbox_pool().run(row["code"], generate_image, row["data"], timeout=timeout, cwd=get_workspace().directory("row"))
             except Exception as e:
                 print(f"Error: {e}")
                 row["image"] = None
-            finally:
-                signal.alarm(0)  # disable the alarm
-                os.chdir(original_dir)
             
             return row
 
-        code_and_images = combined.map(
-            execute_code_and_generate_image,
-            lazy=False,
-            save_num_proc=NUM_RENDER_WORKERS,
-            name="Generate Images",
-        )
+        # Hold render workers shared with the other pipelines running at the same time
+        with render_slots(NUM_RENDER_WORKERS):
+            code_and_images = combined.map(
+                execute_code_and_generate_image,
+                lazy=False,
+                save_num_proc=NUM_RENDER_WORKERS,
+                name="Generate Images",
+            )
 
         # Remove any invalid images
         filtered = code_and_images.filter(
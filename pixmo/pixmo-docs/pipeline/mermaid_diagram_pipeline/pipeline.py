@@ -4,6 +4,7 @@ from .generate_diagram_topics import GenerateDiagramTopics
 from .generate_diagram_data import GenerateDiagramData
 from .generate_diagram import GenerateDiagram
 from .generate_qa import GenerateDiagramQA
+from ..utils.streaming import run_streaming
 
 
 class MermaidDiagramPipeline(SuperStep):
@@ -43,45 +44,13 @@ class MermaidDiagramPipeline(SuperStep):
             },
         )
 
-        # Generate Data
-        generated_data = GenerateDiagramData(
-            "Generate Data",
-            inputs={
-                "metadata": generated_diagram_topics.output["metadata"],
-                "topic": generated_diagram_topics.output["topic"],
-            },
-            args={
-                "llm": self.args["llm"],
-                "batch_size": self.args["batch_size"],
-            },
-        )
-
-        # Generate Diagrams
-        generated_diagrams = GenerateDiagram(
-            "Generate Code",
-            inputs={
-                "metadata": generated_data.output["metadata"],
-                "topic": generated_data.output["topic"],
-                "data": generated_data.output["data"],
-            },
-            args={
-                "llm": self.args["code_llm"],
-                "batch_size": self.args["code_batch_size"],
-            },
-        )
-
-        if not self.args["qa"]:
-            return generated_diagrams.output
-        else:
-            # Generate Q&A
-            generated_qa = GenerateDiagramQA(
-                "Generate Q&A",
+        def run_stages(topics, suffix):
+            # Generate Data
+            generated_data = GenerateDiagramData(
+                f"Generate Data{suffix}",
                 inputs={
-                    "metadata": generated_diagrams.output["metadata"],
-                    "topic": generated_diagrams.output["topic"],
-                    "data": generated_diagrams.output["data"],
-                    "code": generated_diagrams.output["code"],
-                    "image": generated_diagrams.output["image"],
+                    "metadata": topics.output["metadata"],
+                    "topic": topics.output["topic"],
                 },
                 args={
                     "llm": self.args["llm"],
@@ -89,8 +58,44 @@ class MermaidDiagramPipeline(SuperStep):
                 },
             )
 
-            # Return result
-            return generated_qa.output
+            # Generate Diagrams
+            generated_diagrams = GenerateDiagram(
+                f"Generate Code{suffix}",
+                inputs={
+                    "metadata": generated_data.output["metadata"],
+                    "topic": generated_data.output["topic"],
+                    "data": generated_data.output["data"],
+                },
+                args={
+                    "llm": self.args["code_llm"],
+                    "batch_size": self.args["code_batch_size"],
+                },
+            )
+
+            if not self.args["qa"]:
+                return generated_diagrams
+            else:
+                # Generate Q&A
+                generated_qa = GenerateDiagramQA(
+                    f"Generate Q&A{suffix}",
+                    inputs={
+                        "metadata": generated_diagrams.output["metadata"],
+                        "topic": generated_diagrams.output["topic"],
+                        "data": generated_diagrams.output["data"],
+                        "code": generated_diagrams.output["code"],
+                        "image": generated_diagrams.output["image"],
+                    },
+                    args={
+                        "llm": self.args["llm"],
+                        "batch_size": self.args["batch_size"],
+                    },
+                )
+
+                # Return result
+                return generated_qa
+
+        # Run the stages after the topics, shard by shard when streaming is enabled
+        return run_streaming(generated_diagram_topics, run_stages, name="Combine Shards").output
 
     @property
     def version(self):
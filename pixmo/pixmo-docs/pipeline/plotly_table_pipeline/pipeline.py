@@ -5,6 +5,7 @@ from .generate_table_topics import GenerateTableTopics
 from .generate_table_data import GenerateTableData
 from .generate_table import GenerateTable
 from .generate_qa import GenerateTableQA
+from ..utils.streaming import run_streaming
 
 
 class PlotlyTablePipeline(SuperStep):
@@ -44,45 +45,13 @@ class PlotlyTablePipeline(SuperStep):
             },
         )
 
-        # Generate Data
-        generated_data = GenerateTableData(
-            "Generate Data",
-            inputs={
-                "metadata": generated_table_topics.output["metadata"],
-                "topic": generated_table_topics.output["topic"],
-            },
-            args={
-                "llm": self.args["llm"],
-                "batch_size": self.args["batch_size"],
-            },
-        )
-
-        # Generate Tables
-        generated_tables = GenerateTable(
-            "Generate Code",
-            inputs={
-                "metadata": generated_data.output["metadata"],
-                "topic": generated_data.output["topic"],
-                "data": generated_data.output["data"],
-            },
-            args={
-                "llm": self.args["code_llm"],
-                "batch_size": self.args["code_batch_size"],
-            },
-        )
-
-        if not self.args["qa"]:
-            return generated_tables.output
-        else:
-            # Generate Q&A
-            generated_qa = GenerateTableQA(
-                "Generate Q&A",
+        def run_stages(topics, suffix):
+            # Generate Data
+            generated_data = GenerateTableData(
+                f"Generate Data{suffix}",
                 inputs={
-                    "metadata": generated_tables.output["metadata"],
-                    "topic": generated_tables.output["topic"],
-                    "data": generated_tables.output["data"],
-                    "code": generated_tables.output["code"],
-                    "image": generated_tables.output["image"],
+                    "metadata": topics.output["metadata"],
+                    "topic": topics.output["topic"],
                 },
                 args={
                     "llm": self.args["llm"],
@@ -90,8 +59,44 @@ class PlotlyTablePipeline(SuperStep):
                 },
             )
 
-            # Return result
-            return generated_qa.output
+            # Generate Tables
+            generated_tables = GenerateTable(
+                f"Generate Code{suffix}",
+                inputs={
+                    "metadata": generated_data.output["metadata"],
+                    "topic": generated_data.output["topic"],
+                    "data": generated_data.output["data"],
+                },
+                args={
+                    "llm": self.args["code_llm"],
+                    "batch_size": self.args["code_batch_size"],
+                },
+            )
+
+            if not self.args["qa"]:
+                return generated_tables
+            else:
+                # Generate Q&A
+                generated_qa = GenerateTableQA(
+                    f"Generate Q&A{suffix}",
+                    inputs={
+                        "metadata": generated_tables.output["metadata"],
+                        "topic": generated_tables.output["topic"],
+                        "data": generated_tables.output["data"],
+                        "code": generated_tables.output["code"],
+                        "image": generated_tables.output["image"],
+                    },
+                    args={
+                        "llm": self.args["llm"],
+                        "batch_size": self.args["batch_size"],
+                    },
+                )
+
+                # Return result
+                return generated_qa
+
+        # Run the stages after the topics, shard by shard when streaming is enabled
+        return run_streaming(generated_table_topics, run_stages, name="Combine Shards").output
 
     @property
     def version(self):
@@ -5,6 +5,7 @@ from .generate_chemical_topics import GenerateChemicalTopics
 from .generate_chemical_data import GenerateChemicalData
 from .generate_chemical import GenerateChemical
 from .generate_qa import GenerateChemicalQA
+from ..utils.streaming import run_streaming
 
 
 class RdkitChemicalPipeline(SuperStep):
@@ -44,45 +45,13 @@ class RdkitChemicalPipeline(SuperStep):
             },
         )
 
-        # Generate Data
-        generated_data = GenerateChemicalData(
-            "Generate Data",
-            inputs={
-                "metadata": generated_chemical_topics.output["metadata"],
-                "topic": generated_chemical_topics.output["topic"],
-            },
-            args={
-                "llm": self.args["llm"],
-                "batch_size": self.args["batch_size"],
-            },
-        )
-
-        # Generate Chemicals
-        generated_chemicals = GenerateChemical(
-            "Generate Code",
-            inputs={
-                "metadata": generated_data.output["metadata"],
-                "topic": generated_data.output["topic"],
-                "data": generated_data.output["data"],
-            },
-            args={
-                "llm": self.args["code_llm"],
-                "batch_size": self.args["code_batch_size"],
-            },
-        )
-
-        if not self.args["qa"]:
-            return generated_chemicals.output
-        else:
-            # Generate Q&A
-            generated_qa = GenerateChemicalQA(
-                "Generate Q&A",
+        def run_stages(topics, suffix):
+            # Generate Data
+            generated_data = GenerateChemicalData(
+                f"Generate Data{suffix}",
                 inputs={
-                    "metadata": generated_chemicals.output["metadata"],
-                    "topic": generated_chemicals.output["topic"],
-                    "data": generated_chemicals.output["data"],
-                    "code": generated_chemicals.output["code"],
-                    "image": generated_chemicals.output["image"],
+                    "metadata": topics.output["metadata"],
+                    "topic": topics.output["topic"],
                 },
                 args={
                     "llm": self.args["llm"],
@@ -90,8 +59,44 @@ class RdkitChemicalPipeline(SuperStep):
                 },
             )
 
-            # Return result
-            return generated_qa.output
+            # Generate Chemicals
+            generated_chemicals = GenerateChemical(
+                f"Generate Code{suffix}",
+                inputs={
+                    "metadata": generated_data.output["metadata"],
+                    "topic": generated_data.output["topic"],
+                    "data": generated_data.output["data"],
+                },
+                args={
+                    "llm": self.args["code_llm"],
+                    "batch_size": self.args["code_batch_size"],
+                },
+            )
+
+            if not self.args["qa"]:
+                return generated_chemicals
+            else:
+                # Generate Q&A
+                generated_qa = GenerateChemicalQA(
+                    f"Generate Q&A{suffix}",
+                    inputs={
+                        "metadata": generated_chemicals.output["metadata"],
+                        "topic": generated_chemicals.output["topic"],
+                        "data": generated_chemicals.output["data"],
+                        "code": generated_chemicals.output["code"],
+                        "image": generated_chemicals.output["image"],
+                    },
+                    args={
+                        "llm": self.args["llm"],
+                        "batch_size": self.args["batch_size"],
+                    },
+                )
+
+                # Return result
+                return generated_qa
+
+        # Run the stages after the topics, shard by shard when streaming is enabled
+        return run_streaming(generated_chemical_topics, run_stages, name="Combine Shards").output
 
     @property
     def version(self):
@@ -5,6 +5,7 @@ from .generate_graphic_topics import GenerateGraphicTopics
 from .generate_graphic_data import GenerateGraphicData
 from .generate_graphic import GenerateGraphic
 from .generate_qa import GenerateGraphicQA
+from ..utils.streaming import run_streaming
 
 
 class SVGGraphicPipeline(SuperStep):
@@ -44,45 +45,13 @@ class SVGGraphicPipeline(SuperStep):
             },
         )
 
-        # Generate Data
-        generated_data = GenerateGraphicData(
-            "Generate Data",
-            inputs={
-                "metadata": generated_graphic_topics.output["metadata"],
-                "topic": generated_graphic_topics.output["topic"],
-            },
-            args={
-                "llm": self.args["llm"],
-                "batch_size": self.args["batch_size"],
-            },
-        )
-
-        # Generate Graphics
-        generated_graphics = GenerateGraphic(
-            "Generate Code",
-            inputs={
-                "metadata": generated_data.output["metadata"],
-                "topic": generated_data.output["topic"],
-                "data": generated_data.output["data"],
-            },
-            args={
-                "llm": self.args["code_llm"],
-                "batch_size": self.args["code_batch_size"],
-            },
-        )
-
-        if not self.args["qa"]:
-            return generated_graphics.output
-        else:
-            # Generate Q&A
-            generated_qa = GenerateGraphicQA(
-                "Generate Q&A",
+        def run_stages(topics, suffix):
+            # Generate Data
+            generated_data = GenerateGraphicData(
+                f"Generate Data{suffix}",
                 inputs={
-                    "metadata": generated_graphics.output["metadata"],
-                    "topic": generated_graphics.output["topic"],
-                    "data": generated_graphics.output["data"],
-                    "code": generated_graphics.output["code"],
-                    "image": generated_graphics.output["image"],
+                    "metadata": topics.output["metadata"],
+                    "topic": topics.output["topic"],
                 },
                 args={
                     "llm": self.args["llm"],
@@ -90,8 +59,44 @@ class SVGGraphicPipeline(SuperStep):
                 },
             )
 
-            # Return result
-            return generated_qa.output
+            # Generate Graphics
+            generated_graphics = GenerateGraphic(
+                f"Generate Code{suffix}",
+                inputs={
+                    "metadata": generated_data.output["metadata"],
+                    "topic": generated_data.output["topic"],
+                    "data": generated_data.output["data"],
+                },
+                args={
+                    "llm": self.args["code_llm"],
+                    "batch_size": self.args["code_batch_size"],
+                },
+            )
+
+            if not self.args["qa"]:
+                return generated_graphics
+            else:
+                # Generate Q&A
+                generated_qa = GenerateGraphicQA(
+                    f"Generate Q&A{suffix}",
+                    inputs={
+                        "metadata": generated_graphics.output["metadata"],
+                        "topic": generated_graphics.output["topic"],
+                        "data": generated_graphics.output["data"],
+                        "code": generated_graphics.output["code"],
+                        "image": generated_graphics.output["image"],
+                    },
+                    args={
+                        "llm": self.args["llm"],
+                        "batch_size": self.args["batch_size"],
+                    },
+                )
+
+                # Return result
+                return generated_qa
+
+        # Run the stages after the topics, shard by shard when streaming is enabled
+        return run_streaming(generated_graphic_topics, run_stages, name="Combine Shards").output
 
     @property
     def version(self):
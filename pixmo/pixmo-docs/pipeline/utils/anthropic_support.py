@@ -16,6 +16,10 @@ from tenacity import (
 
 from datadreamer.utils.import_utils import ignore_litellm_warnings
 
+from .scheduler import get_scheduler
+from .rate_limiter import run_rate_limited, estimate_tokens, used_tokens
+from .response_cache import cached_request
+
 class CustomAnthropic(Anthropic):
 
     @cached_property
@@ -55,11 +59,24 @@ class CustomAnthropic(Anthropic):
         #     stop=stop_any(lambda _: not self.retry_on_fail),  # type: ignore[arg-type]
         #     reraise=True,
         # )
+        def _retrying_request(func, **kwargs):
+            def request():
+                # Every attempt waits for a request slot shared with the other pipelines
+                with get_scheduler().llm_slot(self):
+                    response = func(**kwargs)
+                headers = getattr(response, "_hidden_params", {}).get("additional_headers")
+                return response, headers, used_tokens(response)
+
+            # Paced under the rate limits of the model, the 429s are waited out by the limiter instead of the retries
+            return run_rate_limited(self.model_name, request, estimate_tokens(kwargs), (RateLimitError,))
+
+        _retrying_request.__wrapped__.__module__ = None  # type: ignore[attr-defined]
+        _retrying_request.__wrapped__.__qualname__ = f"{self.__class__.__name__}.run"  # type: ignore[attr-defined]
+
         def _retry_wrapper(func, **kwargs):
-            return func(**kwargs)
+            # Looked up once per request, outside the retries, so retrying doesn't count as another sample
+            return cached_request(self.model_name, kwargs, lambda: _retrying_request(func, **kwargs))
 
-        _retry_wrapper.__wrapped__.__module__ = None  # type: ignore[attr-defined]
-        _retry_wrapper.__wrapped__.__qualname__ = f"{self.__class__.__name__}.run"  # type: ignore[attr-defined]
         return _retry_wrapper
 
     @cached_property
@@ -84,7 +101,8 @@ class CustomAnthropic(Anthropic):
                                 content="I will not provide any information or assistance related to that."
                             )
                         )
-                    ]
+                    ],
+                    error=True,
                 )
 
         
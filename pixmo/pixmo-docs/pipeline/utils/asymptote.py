@@ -0,0 +1,171 @@
+import os
+import atexit
+import signal
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from .workspace import get_workspace
+
+# The number of Asymptote processes a worker process runs at the same time
+ASYMPTOTE_CONCURRENCY = int(os.environ.get("ASYMPTOTE_CONCURRENCY", 2))
+# The number of figures compiled by a single Asymptote invocation (amortizes its startup)
+ASYMPTOTE_GROUP_SIZE = int(os.environ.get("ASYMPTOTE_GROUP_SIZE", 8))
+# The longest time (in seconds) a single figure may take to compile
+ASYMPTOTE_TIMEOUT = 20
+
+
+class AsymptoteError(RuntimeError):
+    pass
+
+
+class AsymptoteTimeout(AsymptoteError):
+    pass
+
+
+class AsymptoteCompileError(AsymptoteError):
+    pass
+
+
+def run_asymptote(file_names, resolution, cwd, timeout):
+    """
+    Compiles Asymptote files to PNG with one invocation, killing it (and everything it started, e.g.
+    Ghostscript) if it runs for too long.
+
+    :param file_names: The names of the `.asy` files in `cwd`.
+    :param resolution: The `-render` resolution.
+    :param cwd: The directory with the files, the PNGs are written next to them.
+    :param timeout: The longest time (in seconds) the invocation may take.
+    :return: The output of Asymptote.
+    :raises AsymptoteTimeout: If the invocation took longer than `timeout`.
+    :raises AsymptoteCompileError: If Asymptote exited with an error.
+    """
+    process = subprocess.Popen(
+        ["asy", "-f", "png", "-render", str(resolution), *file_names],
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        start_new_session=True,
+    )
+    try:
+        stdout, _ = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass  # The group already exited
+        process.communicate()
+        raise AsymptoteTimeout(f"Asymptote rendering exceeded {timeout} seconds.")
+
+    stdout = stdout.decode("utf-8", errors="replace")
+    if process.returncode != 0:
+        raise AsymptoteCompileError(f"Error encountered during Asymptote rendering:\n{stdout[-2000:]}")
+    return stdout
+
+
+class AsymptoteRenderer:
+    """
+    Renders Asymptote figures with a bounded number of concurrent `asy` processes, several figures per process.
+
+    When the invocation of a group fails (a compile error or a timeout in any of its figures), the figures
+    without an output are split in halves that are compiled again, down to single figures, so every figure
+    gets its own result and error while a single bad figure costs about log2(group size) more invocations.
+
+    :param concurrency: The number of `asy` processes to run at the same time.
+    :param group_size: The number of figures compiled by a single invocation.
+    """
+
+    def __init__(self, concurrency=ASYMPTOTE_CONCURRENCY, group_size=ASYMPTOTE_GROUP_SIZE):
+        self.concurrency = concurrency
+        self.group_size = group_size
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="asymptote")
+
+    def _render_group(self, codes, resolution, timeout):
+        # Runs in one of the threads, in the scratch directory of that thread
+        with get_workspace().job("asymptote") as temp_dir:
+            file_names = []
+            for index, code in enumerate(codes):
+                file_names.append(f"figure{index}.asy")
+                with open(os.path.join(temp_dir, file_names[-1]), "w") as file:
+                    file.write(code)
+
+            def read_output(file_name):
+                output_image = os.path.join(temp_dir, file_name[:-len(".asy")] + ".png")
+                if not os.path.exists(output_image): return None
+                with open(output_image, "rb") as file:
+                    return file.read()
+
+            errors = {}
+
+            def compile_figures(names):
+                # Every invocation gets the time of a single figure
+                try:
+                    run_asymptote(names, resolution, temp_dir, timeout)
+                    return
+                except AsymptoteError as e:
+                    error = e
+                missing = [name for name in names if read_output(name) is None]
+                if len(names) == 1:
+                    errors[names[0]] = error
+                elif len(missing) == 1:
+                    compile_figures(missing)
+                elif missing:
+                    # Bisect the figures it didn't finish, so one bad figure doesn't fail (or time out) the others
+                    compile_figures(missing[:len(missing) // 2])
+                    compile_figures(missing[len(missing) // 2:])
+
+            compile_figures(file_names)
+
+            results = []
+            for file_name in file_names:
+                image_data = read_output(file_name)
+                if image_data is None:
+                    results.append(errors.get(file_name, AsymptoteError("Asymptote did not generate an image.")))
+                else:
+                    results.append(image_data)
+            return results
+
+    def render_batch(self, figures, timeout=ASYMPTOTE_TIMEOUT):
+        """
+        Renders a batch of figures.
+
+        :param figures: A list of `(asymptote_code, resolution)` tuples.
+        :param timeout: The longest time (in seconds) a single figure may take to compile.
+        :return: A list with the PNG bytes of each figure, or the exception raised while rendering it.
+        """
+        # Figures can only share an invocation if they share the resolution
+        groups = []
+        by_resolution = {}
+        for index, (code, resolution) in enumerate(figures):
+            by_resolution.setdefault(resolution, []).append(index)
+        for resolution, indices in by_resolution.items():
+            for start in range(0, len(indices), self.group_size):
+                groups.append((resolution, indices[start:start + self.group_size]))
+
+        futures = [
+            (indices, self.executor.submit(self._render_group, [figures[index][0] for index in indices], resolution, timeout))
+            for resolution, indices in groups
+        ]
+
+        results = [None] * len(figures)
+        for indices, future in futures:
+            for index, result in zip(indices, future.result()):
+                results[index] = result
+        return results
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_ASYMPTOTE_RENDERER = None
+_ASYMPTOTE_RENDERER_PID = None
+
+
+def get_asymptote_renderer():
+    # The thread pool of a parent process does not exist after a fork
+    global _ASYMPTOTE_RENDERER, _ASYMPTOTE_RENDERER_PID
+    if _ASYMPTOTE_RENDERER is None or _ASYMPTOTE_RENDERER_PID != os.getpid():
+        _ASYMPTOTE_RENDERER = AsymptoteRenderer()
+        _ASYMPTOTE_RENDERER_PID = os.getpid()
+        atexit.register(_ASYMPTOTE_RENDERER.close)
+    return _ASYMPTOTE_RENDERER
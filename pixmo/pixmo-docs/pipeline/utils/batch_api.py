@@ -0,0 +1,340 @@
+import os
+import json
+import time
+import hashlib
+
+from datadreamer import DataDreamer
+from datadreamer.llms.llm import _check_max_new_tokens_possible, _check_temperature_and_top_p
+from datadreamer.llms.openai import _is_chat_model
+
+from .openai_support import CustomOpenAI
+from .anthropic_support import CustomAnthropic
+from .response_cache import get_response_cache
+
+# The number of requests in a submitted batch (OpenAI takes up to 50,000, Anthropic up to 100,000)
+BATCH_API_MAX_REQUESTS = int(os.environ.get("BATCH_API_MAX_REQUESTS", 10000))
+# The time (in seconds) between two checks of a batch
+BATCH_API_POLL_INTERVAL = int(os.environ.get("BATCH_API_POLL_INTERVAL", 30))
+# The longest time (in seconds) to wait for a batch, the providers finish them within 24 hours
+BATCH_API_TIMEOUT = int(os.environ.get("BATCH_API_TIMEOUT", 25 * 60 * 60))
+# Where the requests, ids and results of the batches are kept (by default, in the DataDreamer session)
+BATCH_API_DIR = os.environ.get("BATCH_API_DIR")
+# The Anthropic API (e.g. the stand-in of `batch_api_server.py`)
+ANTHROPIC_BASE_URL = os.environ.get("ANTHROPIC_BASE_URL", "https://api.anthropic.com")
+ANTHROPIC_VERSION = "2023-06-01"
+# Anthropic requires `max_tokens`
+ANTHROPIC_DEFAULT_MAX_TOKENS = 4096
+
+
+class BatchAPIError(RuntimeError):
+    pass
+
+
+def _batch_dir():
+    directory = BATCH_API_DIR or os.path.join(DataDreamer.get_output_folder_path(), ".batches")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+class OpenAIBatches:
+    """
+    Submits requests to OpenAI's Batch API: the requests are uploaded as a JSONL file, and the results
+    downloaded as one once the batch is done.
+
+    :param client: The `openai.OpenAI` client.
+    """
+
+    name = "openai"
+
+    def __init__(self, client):
+        self.client = client
+
+    def request_line(self, custom_id, body):
+        return {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}
+
+    def submit(self, requests_file):
+        with open(requests_file, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id, endpoint="/v1/chat/completions", completion_window="24h"
+        )
+        return batch.id
+
+    def poll(self, batch_id):
+        # Whether the batch is done, and its status
+        batch = self.client.batches.retrieve(batch_id)
+        return batch.status in ("completed", "failed", "expired", "cancelled"), batch.status
+
+    def results(self, batch_id):
+        # The generated texts (or None, for failed requests) by custom id
+        batch = self.client.batches.retrieve(batch_id)
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id is None:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                response = result.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[result["custom_id"]] = [choice["message"]["content"] for choice in response["body"]["choices"]]
+                else:
+                    results[result["custom_id"]] = None
+        return results
+
+    def close(self):
+        pass
+
+
+class AnthropicBatches:
+    """
+    Submits requests to Anthropic's Message Batches API.
+
+    :param api_key: The Anthropic API key.
+    """
+
+    name = "anthropic"
+
+    def __init__(self, api_key):
+        import httpx
+
+        self.client = httpx.Client(
+            base_url=ANTHROPIC_BASE_URL,
+            headers={"x-api-key": api_key or os.environ.get("ANTHROPIC_API_KEY", ""), "anthropic-version": ANTHROPIC_VERSION},
+            timeout=300,
+        )
+
+    def request_line(self, custom_id, body):
+        return {"custom_id": custom_id, "params": body}
+
+    def submit(self, requests_file):
+        with open(requests_file) as f:
+            requests = [json.loads(line) for line in f]
+        response = self.client.post("/v1/messages/batches", json={"requests": requests})
+        response.raise_for_status()
+        return response.json()["id"]
+
+    def poll(self, batch_id):
+        response = self.client.get(f"/v1/messages/batches/{batch_id}")
+        response.raise_for_status()
+        status = response.json()["processing_status"]
+        return status == "ended", status
+
+    def results(self, batch_id):
+        response = self.client.get(f"/v1/messages/batches/{batch_id}/results")
+        response.raise_for_status()
+        results = {}
+        for line in response.text.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            if result["result"]["type"] == "succeeded":
+                content = result["result"]["message"]["content"]
+                results[result["custom_id"]] = ["".join(block.get("text", "") for block in content)]
+            else:
+                results[result["custom_id"]] = None
+        return results
+
+    def close(self):
+        self.client.close()
+
+
+def run_batches(provider, requests):
+    """
+    Runs requests through the batch API of a provider: writes them to JSONL files of up to
+    `BATCH_API_MAX_REQUESTS` requests, submits them, polls until they are done and maps the results back
+    by custom id.
+
+    The files, batch ids and results are kept in `BATCH_API_DIR` under the hash of the requests, so a run
+    that was interrupted resumes waiting for the batches it already submitted instead of submitting them
+    again.
+
+    :param provider: An `OpenAIBatches` or `AnthropicBatches`.
+    :param requests: A list of `(custom_id, body)` tuples.
+    :return: The generated texts (or None, for failed requests) by custom id.
+    """
+    directory = _batch_dir()
+    pending = {}
+    for start in range(0, len(requests), BATCH_API_MAX_REQUESTS):
+        chunk = requests[start:start + BATCH_API_MAX_REQUESTS]
+        content = "".join(
+            json.dumps(provider.request_line(custom_id, body), sort_keys=True) + "\n" for custom_id, body in chunk
+        )
+        name = f"{provider.name}-{hashlib.sha256(content.encode('utf-8')).hexdigest()[:32]}"
+        requests_file = os.path.join(directory, f"{name}.jsonl")
+        batch_file = os.path.join(directory, f"{name}.batch")
+        if not os.path.exists(requests_file):
+            with open(requests_file, "w") as f:
+                f.write(content)
+        if os.path.exists(batch_file):
+            with open(batch_file) as f:
+                batch_id = f.read().strip()
+        else:
+            batch_id = provider.submit(requests_file)
+            with open(batch_file, "w") as f:
+                f.write(batch_id)
+            print(f"Submitted batch {batch_id} with {len(chunk)} requests.")
+        pending[name] = batch_id
+
+    results = {}
+    deadline = time.monotonic() + BATCH_API_TIMEOUT
+    while pending:
+        for name, batch_id in list(pending.items()):
+            results_file = os.path.join(_batch_dir(), f"{name}.results.json")
+            if not os.path.exists(results_file):
+                done, status = provider.poll(batch_id)
+                if not done:
+                    continue
+                print(f"Batch {batch_id} is {status}.")
+                with open(results_file, "w") as f:
+                    json.dump(provider.results(batch_id), f)
+            with open(results_file) as f:
+                results.update(json.load(f))
+            del pending[name]
+
+        if pending:
+            if time.monotonic() > deadline:
+                raise BatchAPIError(f"Batches {', '.join(pending.values())} did not finish within {BATCH_API_TIMEOUT} seconds.")
+            time.sleep(BATCH_API_POLL_INTERVAL)
+    return results
+
+
+def run_with_batch_api(llm, provider, prompts, bodies, n, run_failed):
+    """
+    Generates the texts of a batch of prompts with the batch API, except for the ones in the response cache.
+    Requests the batch API fails are sent again with `run_failed`, under the cache keys they already have.
+
+    :param llm: The LLM.
+    :param provider: An `OpenAIBatches` or `AnthropicBatches`.
+    :param prompts: The prompts.
+    :param bodies: The body of the request of each prompt.
+    :param n: The number of generations per prompt.
+    :param run_failed: A function generating the texts of a list of prompts without the batch API.
+    :return: The generated texts, like `_run_batch()`.
+    """
+    cache = get_response_cache()
+    texts, keys, requests = [None] * len(prompts), [None] * len(prompts), []
+    for index, body in enumerate(bodies):
+        if cache is not None:
+            keys[index] = cache.next_key(llm.model_name, body)
+            texts[index] = cache.get(keys[index])
+        if texts[index] is None:
+            requests.append((f"request-{index}", body))
+
+    if requests:
+        try:
+            results = run_batches(provider, requests)
+        finally:
+            provider.close()
+        for custom_id, _ in requests:
+            index = int(custom_id.split("-")[1])
+            texts[index] = results.get(custom_id)
+            if texts[index] is not None and cache is not None:
+                cache.put(keys[index], texts[index])
+
+    failed = [index for index, generations in enumerate(texts) if generations is None]
+    if failed:
+        print(f"Sending {len(failed)} requests that failed in the batch without the batch API.")
+        if cache is not None:
+            # They were already counted as samples, the same samples are requested again
+            for index in failed:
+                cache.reserve(llm.model_name, bodies[index], keys[index])
+        for index, generations in zip(failed, run_failed([prompts[index] for index in failed])):
+            texts[index] = generations if n > 1 else [generations]
+
+    texts = [[text.strip() for text in generations] for generations in texts]
+    return [generations[0] for generations in texts] if n == 1 else texts
+
+
+class BatchOpenAI(CustomOpenAI):
+    """
+    `CustomOpenAI`, sending the prompts of each batch (of `batch_size` prompts) to OpenAI's Batch API,
+    which is cheaper and has its own (larger) rate limits, but may take up to 24 hours per batch.
+    """
+
+    # The number of requests sent at the same time without the batch API (set to `--batch_size`)
+    sync_batch_size = 24
+
+    def _run_batch(self, max_length_func, inputs, max_new_tokens=None, temperature=1.0, top_p=0.0, n=1, stop=None,
+                   repetition_penalty=None, logit_bias=None, batch_size=BATCH_API_MAX_REQUESTS, seed=None, **kwargs):
+        run_kwargs = dict(
+            max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p, n=n, stop=stop,
+            repetition_penalty=repetition_penalty, logit_bias=logit_bias, batch_size=min(batch_size, self.sync_batch_size),
+            seed=seed, **kwargs,
+        )
+
+        def run_failed(prompts):
+            return super(BatchOpenAI, self)._run_batch(max_length_func, prompts, **run_kwargs)
+
+        if not _is_chat_model(self.model_name):
+            return run_failed(inputs)
+
+        # The same requests as `OpenAI._run_batch()` makes
+        max_new_tokens = _check_max_new_tokens_possible(
+            self=self, max_length_func=max_length_func, prompts=inputs, max_new_tokens=max_new_tokens
+        )
+        temperature, top_p = _check_temperature_and_top_p(temperature=temperature, top_p=top_p)
+        optional_kwargs = dict(
+            max_tokens=max_new_tokens, stop=stop, presence_penalty=repetition_penalty, logit_bias=logit_bias, seed=seed
+        )
+        optional_kwargs = {kw: value for kw, value in optional_kwargs.items() if value is not None}
+        extra_kwargs = {kw: value for kw, value in kwargs.items() if kw != "system_prompt"}
+        bodies = [
+            {
+                "model": self.model_name,
+                "messages": [
+                    {"role": "system", "content": f"{kwargs['system_prompt']}"},
+                    {"role": "user", "content": prompt},
+                ],
+                "temperature": temperature,
+                "top_p": top_p,
+                "n": n,
+                **optional_kwargs,
+                **extra_kwargs,
+            }
+            for prompt in inputs
+        ]
+        return run_with_batch_api(self, OpenAIBatches(self.client), inputs, bodies, n, run_failed)
+
+
+class BatchAnthropic(CustomAnthropic):
+    """
+    `CustomAnthropic`, sending the prompts of each batch (of `batch_size` prompts) to Anthropic's Message
+    Batches API, which is cheaper and has its own (larger) rate limits, but may take up to 24 hours per batch.
+    """
+
+    # The number of requests sent at the same time without the batch API (set to `--batch_size`)
+    sync_batch_size = 24
+
+    def _run_batch(self, max_length_func, inputs, max_new_tokens=None, temperature=1.0, top_p=0.0, n=1, stop=None,
+                   repetition_penalty=None, logit_bias=None, batch_size=BATCH_API_MAX_REQUESTS, seed=None, **kwargs):
+        assert n == 1, f"Only `n` = 1 is supported for {type(self).__name__}"
+
+        def run_failed(prompts):
+            return super(BatchAnthropic, self)._run_batch(
+                max_length_func, prompts, max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p, n=n,
+                stop=stop, repetition_penalty=repetition_penalty, logit_bias=logit_bias,
+                batch_size=min(batch_size, self.sync_batch_size), seed=seed, **kwargs,
+            )
+
+        # The same requests as `LiteLLM._run_batch()` makes through LiteLLM
+        max_new_tokens = _check_max_new_tokens_possible(
+            self=self, max_length_func=max_length_func, prompts=inputs, max_new_tokens=max_new_tokens
+        )
+        temperature, top_p = _check_temperature_and_top_p(
+            temperature=temperature, top_p=top_p, supports_zero_temperature=False, supports_zero_top_p=False
+        )
+        stop_sequences = [stop] if isinstance(stop, str) else stop
+        bodies = [
+            {
+                "model": self.model_name,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": max_new_tokens or ANTHROPIC_DEFAULT_MAX_TOKENS,
+                "temperature": temperature,
+                "top_p": top_p,
+                **({"stop_sequences": stop_sequences} if stop_sequences else {}),
+            }
+            for prompt in inputs
+        ]
+        return run_with_batch_api(self, AnthropicBatches(self.api_key), inputs, bodies, n, run_failed)
@@ -0,0 +1,208 @@
+"""
+A local stand-in for the batch APIs of OpenAI and Anthropic, to try the batch mode (`main.py --batch_api`)
+without sending requests to the providers. Every request gets a made-up response that repeats the start
+of its prompt.
+
+    python pipeline/utils/batch_api_server.py --port 8000
+    export OPENAI_BASE_URL=http://127.0.0.1:8000/v1 ANTHROPIC_BASE_URL=http://127.0.0.1:8000
+
+Only the endpoints used by `batch_api.py` are implemented, with the state kept in memory.
+"""
+import re
+import json
+import time
+import uuid
+import email
+import threading
+from argparse import ArgumentParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def stand_in_text(messages):
+    # The made-up response to a conversation
+    prompt = str(messages[-1]["content"]) if messages else ""
+    return f"Stand-in response to: {prompt[:200]}"
+
+
+class BatchAPIState:
+    """
+    The files and batches of the stand-in server.
+
+    :param delay: The time (in seconds) a batch takes to finish.
+    :param fail_every: Make every n-th request of a batch fail (0 for never), to exercise the retries.
+    """
+
+    def __init__(self, delay=0.0, fail_every=0):
+        self.delay = delay
+        self.fail_every = fail_every
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def is_done(self, batch):
+        return time.time() >= batch["created_at"] + self.delay
+
+    def should_fail(self, index):
+        return self.fail_every > 0 and (index + 1) % self.fail_every == 0
+
+
+class BatchAPIHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        content = (json.dumps(body) if content_type == "application/json" else body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if path == "/v1/files":
+            # A multipart upload of the JSONL file with the requests
+            message = email.message_from_bytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + self._body(), policy=HTTP
+            )
+            content = next(
+                part.get_payload(decode=True) for part in message.iter_parts() if part.get_param("name", header="content-disposition") == "file"
+            )
+            file_id = f"file-{uuid.uuid4().hex}"
+            with self.state.lock:
+                self.state.files[file_id] = content.decode("utf-8")
+            return self._send(200, {"id": file_id, "object": "file", "purpose": "batch", "bytes": len(content)})
+
+        if path == "/v1/batches":
+            request = json.loads(self._body())
+            batch_id = f"batch_{uuid.uuid4().hex}"
+            with self.state.lock:
+                self.state.batches[batch_id] = {
+                    "provider": "openai", "input_file_id": request["input_file_id"], "created_at": time.time(),
+                }
+            return self._send(200, self._openai_batch(batch_id))
+
+        if path == "/v1/messages/batches":
+            request = json.loads(self._body())
+            batch_id = f"msgbatch_{uuid.uuid4().hex}"
+            with self.state.lock:
+                self.state.batches[batch_id] = {
+                    "provider": "anthropic", "requests": request["requests"], "created_at": time.time(),
+                }
+            return self._send(200, self._anthropic_batch(batch_id))
+
+        self._send(404, {"error": {"message": f"Unknown endpoint {path}"}})
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        match = re.fullmatch(r"/v1/batches/([\w-]+)", path)
+        if match and match.group(1) in self.state.batches:
+            return self._send(200, self._openai_batch(match.group(1)))
+
+        match = re.fullmatch(r"/v1/files/([\w-]+)/content", path)
+        if match and match.group(1) in self.state.files:
+            return self._send(200, self.state.files[match.group(1)], content_type="application/jsonl")
+
+        match = re.fullmatch(r"/v1/messages/batches/([\w-]+)", path)
+        if match and match.group(1) in self.state.batches:
+            return self._send(200, self._anthropic_batch(match.group(1)))
+
+        match = re.fullmatch(r"/v1/messages/batches/([\w-]+)/results", path)
+        if match and match.group(1) in self.state.batches:
+            return self._send(200, self._anthropic_results(match.group(1)), content_type="application/jsonl")
+
+        self._send(404, {"error": {"message": f"Unknown endpoint {path}"}})
+
+    def _openai_batch(self, batch_id):
+        batch = self.state.batches[batch_id]
+        done = self.state.is_done(batch)
+        if done and "output_file_id" not in batch:
+            # Write the results once the batch is done, like the Batch API
+            output, errors = [], []
+            requests = self.state.files[batch["input_file_id"]].splitlines()
+            for index, line in enumerate(request for request in requests if request.strip()):
+                request = json.loads(line)
+                if self.state.should_fail(index):
+                    errors.append({"custom_id": request["custom_id"], "response": {"status_code": 500, "body": {}}})
+                    continue
+                choices = [
+                    {"index": i, "message": {"role": "assistant", "content": stand_in_text(request["body"]["messages"])}, "finish_reason": "stop"}
+                    for i in range(request["body"].get("n", 1))
+                ]
+                output.append({
+                    "custom_id": request["custom_id"],
+                    "response": {"status_code": 200, "body": {"object": "chat.completion", "model": request["body"]["model"], "choices": choices}},
+                })
+            with self.state.lock:
+                for key, lines in (("output_file_id", output), ("error_file_id", errors)):
+                    if lines:
+                        file_id = f"file-{uuid.uuid4().hex}"
+                        self.state.files[file_id] = "".join(json.dumps(line) + "\n" for line in lines)
+                        batch[key] = file_id
+                    else:
+                        batch[key] = None
+        return {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": "/v1/chat/completions",
+            "input_file_id": batch["input_file_id"],
+            "completion_window": "24h",
+            "status": "completed" if done else "in_progress",
+            "output_file_id": batch.get("output_file_id"),
+            "error_file_id": batch.get("error_file_id"),
+            "created_at": int(batch["created_at"]),
+        }
+
+    def _anthropic_batch(self, batch_id):
+        batch = self.state.batches[batch_id]
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if self.state.is_done(batch) else "in_progress",
+            "results_url": f"/v1/messages/batches/{batch_id}/results",
+        }
+
+    def _anthropic_results(self, batch_id):
+        lines = []
+        for index, request in enumerate(self.state.batches[batch_id]["requests"]):
+            if self.state.should_fail(index):
+                result = {"type": "errored", "error": {"type": "api_error", "message": "Stand-in failure."}}
+            else:
+                text = stand_in_text(request["params"]["messages"])
+                result = {"type": "succeeded", "message": {"role": "assistant", "content": [{"type": "text", "text": text}]}}
+            lines.append(json.dumps({"custom_id": request["custom_id"], "result": result}) + "\n")
+        return "".join(lines)
+
+
+def serve(host="127.0.0.1", port=8000, delay=0.0, fail_every=0):
+    """
+    Starts the stand-in server in a background thread.
+
+    :return: The server (call `shutdown()` to stop it).
+    """
+    handler = type("Handler", (BatchAPIHandler,), {"state": BatchAPIState(delay, fail_every)})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="The address to listen on.")
+    parser.add_argument("--port", type=int, default=8000, help="The port to listen on.")
+    parser.add_argument("--delay", type=float, default=0.0, help="The time (in seconds) a batch takes to finish.")
+    parser.add_argument("--fail_every", type=int, default=0, help="Make every n-th request of a batch fail (0 for never).")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.delay, args.fail_every)
+    print(f"Stand-in batch API listening on http://{args.host}:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,340 @@
+import os
+import time
+import atexit
+import asyncio
+import threading
+from contextlib import contextmanager
+from playwright.sync_api import sync_playwright, Error as PlaywrightError
+from playwright.async_api import async_playwright
+
+# Restart the browser after this many pages to keep Chromium's memory usage bounded
+MAX_PAGES_PER_BROWSER = int(os.environ.get("BROWSER_MAX_PAGES", 200))
+
+# How to decide that a page has finished rendering: "ready" waits for the page to settle, "fixed" always sleeps
+RENDER_WAIT_MODE = os.environ.get("HTML_RENDER_WAIT_MODE", "ready")
+# The longest time (in milliseconds) to wait for a page to finish rendering
+RENDER_MAX_WAIT = int(os.environ.get("HTML_RENDER_MAX_WAIT", 2000))
+
+# The number of pages the asynchronous renderer renders concurrently inside one browser
+RENDER_CONCURRENCY = int(os.environ.get("HTML_RENDER_CONCURRENCY", 8))
+# The longest time (in seconds) a single page of a batch may take before it is abandoned
+RENDER_TIMEOUT = 20
+
+# Resolves once the web fonts are loaded and two consecutive animation frames passed without any
+# DOM mutation, running animation, or canvas change (charts drawn on a canvas don't mutate the DOM)
+WAIT_FOR_STABLE_LAYOUT_JS = """
+async (maxWait) => {
+    const deadline = performance.now() + maxWait;
+    const withDeadline = (promise) => Promise.race([
+        promise,
+        new Promise((resolve) => setTimeout(resolve, Math.max(0, deadline - performance.now()))),
+    ]);
+    const nextFrame = () => new Promise((resolve) => requestAnimationFrame(() => resolve()));
+    const canvasSignature = () => Array.from(document.querySelectorAll("canvas")).map((canvas) => {
+        try { return canvas.toDataURL(); } catch (e) { return ""; }
+    }).join("|");
+    const isAnimating = () => document.getAnimations
+        ? document.getAnimations().some((animation) => animation.playState === "running")
+        : false;
+
+    await withDeadline(document.fonts.ready);
+
+    let mutated = true;
+    const observer = new MutationObserver(() => { mutated = true; });
+    observer.observe(document, { subtree: true, childList: true, attributes: true, characterData: true });
+
+    let lastCanvas = canvasSignature();
+    while (performance.now() < deadline) {
+        mutated = false;
+        await withDeadline(nextFrame());
+        await withDeadline(nextFrame());
+        const canvas = canvasSignature();
+        const stable = !mutated && canvas === lastCanvas && !isAnimating();
+        lastCanvas = canvas;
+        if (stable) break;
+    }
+    observer.disconnect();
+}
+"""
+
+
+class BrowserPool:
+    """
+    A long-lived Chromium instance shared by all HTML renders of one thread (the synchronous Playwright API
+    can only be used from the thread that started it).
+
+    Pages are recycled between renders and the browser is restarted after
+    `max_pages` renders, when it stops responding, or when a render was interrupted.
+
+    :param max_pages: The number of pages to render before restarting the browser.
+    :param launch_kwargs: Keyword arguments passed to `chromium.launch()`.
+    """
+
+    def __init__(self, max_pages=MAX_PAGES_PER_BROWSER, launch_kwargs=None):
+        self.max_pages = max_pages
+        self.launch_kwargs = launch_kwargs or {}
+        self._pid = None
+        self._thread = None
+        self._playwright = None
+        self._browser = None
+        self._page = None
+        self._num_pages = 0
+
+    def is_healthy(self):
+        # A browser inherited from a parent process (e.g. after a fork) belongs to the parent
+        if self._browser is None or self._pid != os.getpid():
+            return False
+        try:
+            return self._browser.is_connected() and (self._page is None or not self._page.is_closed())
+        except Exception:
+            return False
+
+    def start(self):
+        self._pid = os.getpid()
+        self._thread = threading.get_ident()
+        self._playwright = sync_playwright().start()
+        self._browser = self._playwright.chromium.launch(**self.launch_kwargs)
+        self._page = None
+        self._num_pages = 0
+
+    def close(self):
+        # Never talk to a browser owned by another process (or thread), just drop the references
+        if self._pid == os.getpid() and self._thread == threading.get_ident():
+            for resource in (self._page, self._browser):
+                try:
+                    if resource is not None: resource.close()
+                except Exception:
+                    pass
+            try:
+                if self._playwright is not None: self._playwright.stop()
+            except Exception:
+                pass
+        self._pid = None
+        self._thread = None
+        self._playwright = None
+        self._browser = None
+        self._page = None
+        self._num_pages = 0
+
+    def restart(self):
+        self.close()
+        self.start()
+
+    @contextmanager
+    def page(self, viewport, reset=True):
+        if not self.is_healthy() or self._num_pages >= self.max_pages:
+            self.restart()
+
+        if self._page is None:
+            self._page = self._browser.new_page(viewport=viewport)
+        else:
+            # Navigating away resets the document and the JavaScript globals of the previous render
+            if reset: self._page.goto("about:blank")
+            self._page.set_viewport_size(viewport)
+        self._num_pages += 1
+
+        try:
+            yield self._page
+        except PlaywrightError:
+            # The page may be left in an unknown state, so start the next render with a fresh one
+            try:
+                self._page.close()
+            except Exception:
+                pass
+            self._page = None
+            raise
+        except BaseException:
+            # The render was interrupted (e.g. by a timeout) in the middle of a browser call
+            self.close()
+            raise
+
+
+def wait_for_render(page, wait_mode=RENDER_WAIT_MODE, max_wait=RENDER_MAX_WAIT):
+    """
+    Waits until the content of the page has finished rendering.
+
+    :param page: A Playwright page with its content already set.
+    :param wait_mode: "ready" to wait for the network, the fonts, and the layout to settle, or "fixed" to
+        always wait for `max_wait` milliseconds.
+    :param max_wait: The longest time to wait, in milliseconds.
+    """
+    if wait_mode == "fixed":
+        page.wait_for_timeout(max_wait)
+        return
+
+    deadline = time.monotonic() + max_wait / 1000
+    try:
+        page.wait_for_load_state("networkidle", timeout=max_wait)
+    except PlaywrightError:
+        pass  # Still loading something (e.g. a stalled CDN request), render whatever is there
+
+    remaining = int((deadline - time.monotonic()) * 1000)
+    if remaining > 0:
+        try:
+            page.evaluate(WAIT_FOR_STABLE_LAYOUT_JS, remaining)
+        except PlaywrightError:
+            pass
+
+
+async def async_wait_for_render(page, wait_mode=RENDER_WAIT_MODE, max_wait=RENDER_MAX_WAIT):
+    # Same as `wait_for_render`, for pages of the asynchronous Playwright API
+    if wait_mode == "fixed":
+        await page.wait_for_timeout(max_wait)
+        return
+
+    deadline = time.monotonic() + max_wait / 1000
+    try:
+        await page.wait_for_load_state("networkidle", timeout=max_wait)
+    except PlaywrightError:
+        pass
+
+    remaining = int((deadline - time.monotonic()) * 1000)
+    if remaining > 0:
+        try:
+            await page.evaluate(WAIT_FOR_STABLE_LAYOUT_JS, remaining)
+        except PlaywrightError:
+            pass
+
+
+class AsyncBrowserRenderer:
+    """
+    Renders batches of HTML pages concurrently inside a single Chromium instance.
+
+    The asynchronous Playwright API runs on an event loop in a background thread, so
+    batches can be submitted from synchronous code (e.g. a `.map()` function).
+
+    :param concurrency: The maximum number of pages rendered at the same time.
+    :param max_pages: The number of pages to render before restarting the browser.
+    :param launch_kwargs: Keyword arguments passed to `chromium.launch()`.
+    """
+
+    def __init__(self, concurrency=RENDER_CONCURRENCY, max_pages=MAX_PAGES_PER_BROWSER, launch_kwargs=None):
+        self.concurrency = concurrency
+        self.max_pages = max_pages
+        self.launch_kwargs = launch_kwargs or {}
+        self._pid = None
+        self._loop = None
+        self._thread = None
+        self._playwright = None
+        self._browser = None
+        self._num_pages = 0
+        self._num_batches = 0
+        self._browser_lock = None
+        self._loop_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        # Several threads (e.g. the shards of a pipeline) may submit their first batch at the same time
+        with self._loop_lock:
+            # The event loop thread of a parent process does not exist after a fork
+            if self._loop is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+            self._thread.start()
+            self._playwright = None
+            self._browser = None
+            self._num_pages = 0
+            self._num_batches = 0
+            self._browser_lock = asyncio.Lock()
+
+    async def _close_browser(self):
+        try:
+            if self._browser is not None: await self._browser.close()
+        except Exception:
+            pass
+        try:
+            if self._playwright is not None: await self._playwright.stop()
+        except Exception:
+            pass
+        self._playwright = None
+        self._browser = None
+        self._num_pages = 0
+
+    async def _ensure_browser(self):
+        if self._browser is not None and self._browser.is_connected():
+            # The pages of the batches in flight are still open, they get to finish before the restart
+            if self._num_pages < self.max_pages or self._num_batches > 0:
+                return
+        await self._close_browser()
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(**self.launch_kwargs)
+
+    async def _screenshot(self, html, viewport, full_page, wait_mode, max_wait):
+        page = await self._browser.new_page(viewport=viewport)
+        try:
+            await page.set_content(html)
+            await async_wait_for_render(page, wait_mode=wait_mode, max_wait=max_wait)
+            return await page.screenshot(full_page=full_page)
+        finally:
+            await page.close()
+
+    async def _render_one(self, semaphore, job, timeout):
+        async with semaphore:
+            return await asyncio.wait_for(self._screenshot(**job), timeout)
+
+    async def _render_batch(self, jobs, timeout):
+        # Restart only while no batch is in flight, so no page is closed in the middle of its render
+        async with self._browser_lock:
+            await self._ensure_browser()
+            self._num_batches += 1
+        try:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            return await asyncio.gather(
+                *[self._render_one(semaphore, job, timeout) for job in jobs], return_exceptions=True
+            )
+        finally:
+            self._num_batches -= 1
+            self._num_pages += len(jobs)
+
+    def render_batch(self, jobs, timeout=RENDER_TIMEOUT):
+        """
+        Renders a batch of pages.
+
+        :param jobs: A list of dicts with the `html`, `viewport`, `full_page`, `wait_mode`, and `max_wait` of each page.
+        :param timeout: The longest time (in seconds) to spend on a single page.
+        :return: A list with the PNG screenshot bytes of each page, or the exception raised while rendering it.
+        """
+        self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self._render_batch(jobs, timeout), self._loop)
+        return future.result()
+
+    def close(self):
+        if self._loop is None or self._pid != os.getpid():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_browser(), self._loop).result(timeout=30)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
+
+_BROWSER_POOLS = threading.local()
+_ASYNC_RENDERER = None
+
+
+def get_browser_pool():
+    # One browser per thread: the renders of a map running in the thread of a pipeline (or of a shard) can't
+    # use the browser of another thread
+    pool = getattr(_BROWSER_POOLS, "pool", None)
+    if pool is None:
+        pool = _BROWSER_POOLS.pool = BrowserPool()
+        atexit.register(pool.close)
+    return pool
+
+
+def close_thread_browser():
+    # Closes the browser of the current thread, once the thread won't render anything anymore
+    pool = getattr(_BROWSER_POOLS, "pool", None)
+    if pool is not None:
+        pool.close()
+        _BROWSER_POOLS.pool = None
+
+
+def get_async_renderer():
+    global _ASYNC_RENDERER
+    if _ASYNC_RENDERER is None:
+        _ASYNC_RENDERER = AsyncBrowserRenderer()
+        atexit.register(_ASYNC_RENDERER.close)
+    return _ASYNC_RENDERER
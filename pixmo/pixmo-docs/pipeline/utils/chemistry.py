@@ -0,0 +1,68 @@
+import os
+import threading
+from collections import OrderedDict
+from rdkit import Chem
+from rdkit.Chem import AllChem
+
+# The number of parsed molecules (with their 2D coordinates) kept per process
+MOLECULE_CACHE_SIZE = int(os.environ.get("MOLECULE_CACHE_SIZE", 10000))
+
+
+class LRUCache:
+    """
+    A dictionary that forgets the least recently used entries once it holds `max_size` of them.
+
+    :param max_size: The number of entries to keep.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries: return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+# SMILES as written -> molecule (None if it doesn't parse), keyed on the spelling because the atoms of a
+# molecule are numbered in the order of its SMILES (e.g. for the atom indices drawn on it)
+_MOLECULES = LRUCache(MOLECULE_CACHE_SIZE)
+
+
+def get_molecule(smiles, with_coords=False):
+    """
+    Parses a SMILES string, at most once per process: the molecule is cached under the SMILES as written,
+    so it keeps the atom order of that spelling.
+
+    :param smiles: The SMILES string.
+    :param with_coords: Whether the molecule needs 2D coordinates (computed once, on first use).
+    :return: The RDKit molecule, or None if the SMILES is not valid.
+    """
+    molecule = _MOLECULES.get(smiles, default=False)
+    if molecule is False:
+        try:
+            molecule = Chem.MolFromSmiles(smiles)
+        except Exception:
+            molecule = None
+        _MOLECULES.put(smiles, molecule)
+    if molecule is None:
+        return None
+
+    if with_coords and molecule.GetNumConformers() == 0:
+        AllChem.Compute2DCoords(molecule)
+    return molecule
+
@@ -0,0 +1,196 @@
+import os
+import re
+import time
+import signal
+import hashlib
+import tempfile
+import subprocess
+from filelock import FileLock
+
+COMPILERS = ["pdflatex", "xelatex", "lualatex"]
+
+# Packages and commands that only work (or only work well) with one engine
+XELATEX_FEATURES = re.compile(r"\\usepackage(\[[^\]]*\])?\{[^}]*\b(fontspec|unicode-math|xeCJK|polyglossia|xunicode|xltxtra)\b")
+LUALATEX_FEATURES = re.compile(r"\\directlua|\\usepackage(\[[^\]]*\])?\{[^}]*\b(luacode|luatexbase|luaotfload|luatextra|luamplib)\b")
+CJK_CHARACTERS = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+
+# Where the precompiled preambles (format files) are stored, shared by all workers on the machine
+LATEX_FORMAT_DIR = os.environ.get("LATEX_FORMAT_DIR", os.path.join(tempfile.gettempdir(), "pixmo_latex_formats"))
+# Precompile a preamble once a worker has seen it this many times
+LATEX_FORMAT_MIN_USES = int(os.environ.get("LATEX_FORMAT_MIN_USES", 2))
+# The longest time (in seconds) a single compilation may take
+LATEX_TIMEOUT = 60
+# Try again to build a format whose build timed out after this many seconds (e.g. the machine was just busy)
+LATEX_FORMAT_RETRY_AFTER = int(os.environ.get("LATEX_FORMAT_RETRY_AFTER", 3600))
+
+# How many times each preamble was seen by this worker
+_PREAMBLE_USES = {}
+
+
+def choose_compilers(latex_source):
+    """
+    Orders the LaTeX compilers by how likely they are to compile the source.
+
+    :param latex_source: The LaTeX source code.
+    :return: The list of compilers to try, the one matching the features of the source first.
+    """
+    if LUALATEX_FEATURES.search(latex_source):
+        preferred = "lualatex"
+    elif XELATEX_FEATURES.search(latex_source) or CJK_CHARACTERS.search(latex_source):
+        preferred = "xelatex"
+    else:
+        preferred = "pdflatex"
+    return [preferred] + [compiler for compiler in COMPILERS if compiler != preferred]
+
+
+def split_preamble(latex_source):
+    # Split the source into the preamble and the document body
+    index = latex_source.find("\\begin{document}")
+    if index == -1: return None, latex_source
+    return latex_source[:index], latex_source[index:]
+
+
+def _run(args, cwd, env=None, timeout=LATEX_TIMEOUT):
+    # The engine runs in its own process group, so a timeout also kills what it started (e.g. shell escapes)
+    # The return code is None if the compilation timed out
+    process = subprocess.Popen(
+        args, cwd=cwd, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True
+    )
+    try:
+        stdout, _ = process.communicate(timeout=timeout)
+        return process.returncode, stdout
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        stdout, _ = process.communicate()
+        return None, (stdout or b"") + f"\nTimed out after {timeout:.0f} seconds.".encode("utf-8")
+
+
+def _format_env():
+    # Let the engines find the format files by name (the trailing separator keeps the default search path)
+    env = dict(os.environ)
+    env["TEXFORMATS"] = LATEX_FORMAT_DIR + os.pathsep + env.get("TEXFORMATS", "")
+    return env
+
+
+def _mark_failed(name, timed_out):
+    # A format that doesn't compile never will, one that timed out may build once the machine is less busy
+    with open(os.path.join(LATEX_FORMAT_DIR, name + ".failed"), "w") as f:
+        f.write("timeout" if timed_out else "error")
+
+
+def _is_marked_failed(name):
+    failed_file = os.path.join(LATEX_FORMAT_DIR, name + ".failed")
+    try:
+        with open(failed_file) as f:
+            reason = f.read().strip()
+        modified = os.path.getmtime(failed_file)
+    except FileNotFoundError:
+        return False
+    return reason != "timeout" or time.time() - modified < LATEX_FORMAT_RETRY_AFTER
+
+
+def get_preamble_format(compiler, preamble):
+    """
+    Gets the name of a format file with the given preamble precompiled (using mylatexformat).
+
+    Only pdflatex formats are built: XeTeX can't dump the fonts loaded by fontspec and LuaTeX can't dump its Lua state.
+    A format is only built once its preamble was seen `LATEX_FORMAT_MIN_USES` times, and never again after it failed to
+    compile (after a timeout, it is tried again `LATEX_FORMAT_RETRY_AFTER` seconds later).
+
+    :param compiler: The LaTeX compiler that will use the format.
+    :param preamble: The preamble of the document, up to `\\begin{document}`.
+    :return: The name of the format, or None if there is no usable format for this preamble.
+    """
+    if compiler != "pdflatex" or preamble is None:
+        return None
+
+    name = f"{compiler}-{hashlib.sha256(preamble.encode('utf-8')).hexdigest()[:24]}"
+    format_file = os.path.join(LATEX_FORMAT_DIR, name + ".fmt")
+
+    if os.path.exists(format_file): return name
+    if _is_marked_failed(name): return None
+
+    _PREAMBLE_USES[name] = _PREAMBLE_USES.get(name, 0) + 1
+    if _PREAMBLE_USES[name] < LATEX_FORMAT_MIN_USES: return None
+
+    os.makedirs(LATEX_FORMAT_DIR, exist_ok=True)
+    with FileLock(os.path.join(LATEX_FORMAT_DIR, name + ".lock")):
+        # Another worker may have built (or failed to build) it while we were waiting
+        if os.path.exists(format_file): return name
+        if _is_marked_failed(name): return None
+
+        build_dir = tempfile.mkdtemp(dir=LATEX_FORMAT_DIR)
+        try:
+            with open(os.path.join(build_dir, "preamble.tex"), "w", encoding="utf-8") as f:
+                f.write(preamble + "\\begin{document}\n\\end{document}\n")
+            returncode, _ = _run(
+                [compiler, "-ini", "-interaction=nonstopmode", f"-jobname={name}", f"&{compiler}", "mylatexformat.ltx", "preamble.tex"],
+                cwd=build_dir,
+            )
+            built_file = os.path.join(build_dir, name + ".fmt")
+            if returncode == 0 and os.path.exists(built_file):
+                os.replace(built_file, format_file)  # atomic, other workers never see a partial format
+                return name
+            _mark_failed(name, timed_out=returncode is None)
+            return None
+        finally:
+            for file in os.listdir(build_dir):
+                os.remove(os.path.join(build_dir, file))
+            os.rmdir(build_dir)
+
+
+def mark_format_failed(name):
+    # Stop using a format that can't compile documents that compile without it
+    _mark_failed(name, timed_out=False)
+    try:
+        os.remove(os.path.join(LATEX_FORMAT_DIR, name + ".fmt"))
+    except FileNotFoundError:
+        pass
+
+
+def compile_latex(latex_file, output_dir, timeout=None):
+    """
+    Compiles a LaTeX file to PDF, picking the compiler from the features of the source and
+    loading the preamble from a precompiled format when there is one.
+
+    :param latex_file: The path of the LaTeX file.
+    :param output_dir: The directory to write the PDF (and the intermediate files) to.
+    :param timeout: The longest time (in seconds) all the compilations together may take, or None for no limit
+        besides the `LATEX_TIMEOUT` of each one.
+    :return: The return code (None if it timed out) and the output of the last compilation.
+    """
+    with open(latex_file, "r", encoding="utf-8") as f:
+        latex_source = f.read()
+    preamble, _ = split_preamble(latex_source)
+    deadline = time.monotonic() + timeout if timeout is not None else None
+
+    def remaining():
+        # The time the next compilation gets
+        if deadline is None: return LATEX_TIMEOUT
+        return min(LATEX_TIMEOUT, deadline - time.monotonic())
+
+    returncode, stdout = None, b""
+    for compiler in choose_compilers(latex_source):
+        args = [compiler, "-interaction=nonstopmode", "-output-directory", output_dir, latex_file]
+
+        format_name = get_preamble_format(compiler, preamble)
+        format_failed = False
+        if format_name is not None and remaining() > 0:
+            # With a mylatexformat format, the engine skips the preamble of the file and loads the dumped one
+            returncode, stdout = _run(args[:1] + [f"-fmt={format_name}"] + args[1:], cwd=output_dir, env=_format_env(), timeout=remaining())
+            if returncode == 0: return returncode, stdout
+            # A timeout says nothing about the format
+            format_failed = returncode is not None
+
+        if remaining() <= 0:
+            if returncode is not None: stdout += f"\nTimed out after {timeout} seconds.".encode("utf-8")
+            return None, stdout
+        returncode, stdout = _run(args, cwd=output_dir, timeout=remaining())
+        if returncode == 0:
+            if format_failed: mark_format_failed(format_name)
+            return returncode, stdout
+
+    return returncode, stdout
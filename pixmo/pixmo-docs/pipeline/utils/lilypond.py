@@ -0,0 +1,138 @@
+import os
+import re
+import atexit
+import signal
+import subprocess
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+from .workspace import get_workspace
+
+# The number of LilyPond processes a worker process runs at the same time
+LILYPOND_CONCURRENCY = int(os.environ.get("LILYPOND_CONCURRENCY", min(4, os.cpu_count() or 1)))
+# The longest time (in seconds) a single score may take to compile
+LILYPOND_TIMEOUT = 20
+
+
+class LilyPondError(RuntimeError):
+    pass
+
+
+class LilyPondTimeout(LilyPondError):
+    pass
+
+
+@lru_cache(maxsize=None)
+def lilypond_version():
+    # The version of the installed LilyPond, e.g. (2, 24, 3), or None if it can't be determined
+    try:
+        process = subprocess.run(["lilypond", "--version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(rb"LilyPond (\d+)\.(\d+)\.(\d+)", process.stdout)
+    return tuple(int(part) for part in match.groups()) if match else None
+
+
+def supports_crop():
+    # `-dcrop` (a single image cropped to the music, without rasterizing full pages) exists since LilyPond 2.24
+    version = lilypond_version()
+    return version is not None and version >= (2, 24, 0)
+
+
+def compile_lilypond(lilypond_code, temp_dir, timeout=LILYPOND_TIMEOUT):
+    """
+    Compiles a score to PNG, cropped to the music when LilyPond supports it.
+
+    :param lilypond_code: The LilyPond source.
+    :param temp_dir: An empty directory to compile in.
+    :param timeout: The longest time (in seconds) the compilation may take.
+    :return: The PNG bytes of the score (its first page, without `-dcrop`).
+    """
+    lilypond_file = os.path.join(temp_dir, "music.ly")
+    with open(lilypond_file, "w") as f:
+        f.write(lilypond_code)
+
+    crop = supports_crop()
+    args = ["lilypond", "--png", "-dno-point-and-click"]
+    if crop:
+        args += ["-dcrop", "-dno-print-pages"]
+
+    process = subprocess.Popen(
+        args + ["-o", "music", lilypond_file],
+        cwd=temp_dir,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        start_new_session=True,
+    )
+    try:
+        stdout, _ = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # Also kill Ghostscript, which LilyPond runs to rasterize the pages
+        os.killpg(process.pid, signal.SIGKILL)
+        process.communicate()
+        raise LilyPondTimeout(f"LilyPond rendering exceeded {timeout} seconds.")
+
+    if process.returncode != 0:
+        raise LilyPondError(f"Error encountered during LilyPond rendering:\n{stdout.decode('utf-8', errors='replace')[-2000:]}")
+
+    # Scores longer than a page are written as music-page1.png, music-page2.png, ...
+    candidates = ["music.cropped.png"] if crop else ["music.png", "music-page1.png"]
+    for candidate in candidates:
+        png_file = os.path.join(temp_dir, candidate)
+        if os.path.exists(png_file):
+            with open(png_file, "rb") as f:
+                return f.read()
+    raise LilyPondError("LilyPond did not generate an image.")
+
+
+class LilyPondRenderer:
+    """
+    Renders batches of scores with parallel LilyPond processes, each in its own scratch directory.
+
+    :param concurrency: The number of LilyPond processes to run at the same time.
+    """
+
+    def __init__(self, concurrency=LILYPOND_CONCURRENCY):
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="lilypond")
+
+    def _render(self, lilypond_code, timeout):
+        # Every thread has its own scratch directory, so the compilations never see each other's files
+        with get_workspace().job("lilypond") as temp_dir:
+            return compile_lilypond(lilypond_code, temp_dir, timeout)
+
+    def render_batch(self, scores, timeout=LILYPOND_TIMEOUT):
+        """
+        Renders a batch of scores.
+
+        :param scores: A list of LilyPond sources.
+        :param timeout: The longest time (in seconds) a single score may take to compile.
+        :return: A list with the PNG bytes of each score, or the exception raised while rendering it.
+        """
+        futures = [self.executor.submit(self._render, lilypond_code, timeout) for lilypond_code in scores]
+
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_LILYPOND_RENDERER = None
+_LILYPOND_RENDERER_PID = None
+
+
+def get_lilypond_renderer():
+    # The thread pool of a parent process does not exist after a fork
+    global _LILYPOND_RENDERER, _LILYPOND_RENDERER_PID
+    if _LILYPOND_RENDERER is None or _LILYPOND_RENDERER_PID != os.getpid():
+        _LILYPOND_RENDERER = LilyPondRenderer()
+        _LILYPOND_RENDERER_PID = os.getpid()
+        atexit.register(_LILYPOND_RENDERER.close)
+    return _LILYPOND_RENDERER
@@ -0,0 +1,132 @@
+import os
+import itertools
+import subprocess
+from functools import lru_cache
+
+from .browser import get_browser_pool, PlaywrightError
+
+# The longest time (in seconds) a single diagram may take to render
+MERMAID_TIMEOUT = 20
+
+RENDER_DIAGRAM_JS = """
+async ({ code, id, scale, timeout }) => {
+    const container = document.getElementById("container");
+    container.innerHTML = "";
+    document.body.style.zoom = scale;
+    try {
+        const render = mermaid.render(id, code);
+        const expired = new Promise((_, reject) => setTimeout(() => reject(new Error(`Timed out after ${timeout} ms`)), timeout));
+        const { svg } = await Promise.race([render, expired]);
+        container.innerHTML = svg;
+    } finally {
+        // mermaid leaves its scratch element (and error diagrams) in the body when rendering fails
+        const scratch = document.getElementById("d" + id);
+        if (scratch) scratch.remove();
+    }
+}
+"""
+
+
+class MermaidError(RuntimeError):
+    pass
+
+
+@lru_cache(maxsize=None)
+def find_mermaid_js():
+    """
+    Finds mermaid.js, either from the `MERMAID_JS` environment variable or in the global npm packages
+    (the copy installed with the Mermaid CLI).
+
+    :return: The path of `mermaid.min.js`, or None if it can't be found.
+    """
+    candidates = [os.environ.get("MERMAID_JS")]
+    try:
+        npm_root = subprocess.run(["npm", "root", "-g"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=30).stdout.decode("utf-8").strip()
+        candidates += [
+            os.path.join(npm_root, "@mermaid-js", "mermaid-cli", "node_modules", "mermaid", "dist", "mermaid.min.js"),
+            os.path.join(npm_root, "mermaid", "dist", "mermaid.min.js"),
+        ]
+    except (OSError, subprocess.SubprocessError):
+        pass
+
+    for candidate in candidates:
+        if candidate and os.path.exists(candidate): return candidate
+    return None
+
+
+class MermaidRenderer:
+    """
+    Renders Mermaid diagrams in a long-lived Chromium page with mermaid.js loaded once, in the browser of the
+    thread rendering them (see `get_browser_pool`).
+
+    :param mermaid_js: The path of `mermaid.min.js`.
+    """
+
+    def __init__(self, mermaid_js):
+        self.mermaid_js = mermaid_js
+        self._diagram_ids = itertools.count(1)
+
+    def _load(self, page):
+        if page.evaluate("typeof mermaid !== 'undefined'"): return
+        page.set_content('<html><body style="margin: 0; background: white;"><div id="container" style="display: inline-block;"></div></body></html>')
+        page.add_script_tag(path=self.mermaid_js)
+        page.evaluate("mermaid.initialize({ startOnLoad: false })")
+
+    def render_batch(self, diagrams, timeout=MERMAID_TIMEOUT):
+        """
+        Renders a batch of diagrams.
+
+        :param diagrams: A list of `(mermaid_code, scale)` tuples.
+        :param timeout: The longest time (in seconds) to spend on a single diagram.
+        :return: A list with the PNG bytes of each diagram, or the exception raised while rendering it.
+        """
+        results = []
+        for code, scale in diagrams:
+            try:
+                # The error leaves the page of a failed diagram, so the pool replaces it (and mermaid.js is loaded
+                # again) instead of the next diagrams failing on a crashed or hung page
+                with get_browser_pool().page(viewport={"width": 1200, "height": 800}, reset=False) as page:
+                    self._load(page)
+                    page.evaluate(RENDER_DIAGRAM_JS, {"code": code, "id": f"diagram{next(self._diagram_ids)}", "scale": scale, "timeout": timeout * 1000})
+                    results.append(page.locator("#container > svg").screenshot(timeout=timeout * 1000))
+            except PlaywrightError as e:
+                results.append(MermaidError(str(e)))
+        return results
+
+
+def render_mermaid_cli(mermaid_code, scale, workdir, timeout=MERMAID_TIMEOUT):
+    # Render a diagram with the Mermaid CLI (a new Node and Chromium per diagram)
+    output_mmd = os.path.join(workdir, "diagram.mmd")
+    output_image = os.path.join(workdir, "diagram.png")
+
+    # Save the Mermaid code to a temporary file
+    with open(output_mmd, "w") as file:
+        file.write(mermaid_code)
+
+    # Call the Mermaid CLI to generate the diagram with the specified scale
+    try:
+        process = subprocess.run(
+            ["mmdc", "-i", output_mmd, "-o", output_image, "-s", str(scale)],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise MermaidError(f"Mermaid CLI timed out after {timeout} seconds.")
+    if process.returncode != 0 or not os.path.exists(output_image):
+        raise MermaidError(f"Error encountered during Mermaid rendering:\n{process.stdout.decode('utf-8', errors='replace')}")
+
+    # Read the generated image
+    with open(output_image, "rb") as file:
+        return file.read()
+
+
+_MERMAID_RENDERER = None
+
+
+def get_mermaid_renderer():
+    # The renderer of this worker process, or None if mermaid.js is not available (use the Mermaid CLI instead)
+    global _MERMAID_RENDERER
+    if _MERMAID_RENDERER is None:
+        mermaid_js = find_mermaid_js()
+        if mermaid_js is None: return None
+        _MERMAID_RENDERER = MermaidRenderer(mermaid_js)
+    return _MERMAID_RENDERER
@@ -0,0 +1,231 @@
+import os
+import time
+import queue
+import atexit
+import signal
+import shutil
+import socket
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from .workspace import get_workspace
+
+# The number of LibreOffice listeners per worker process
+OFFICE_LISTENERS = int(os.environ.get("OFFICE_LISTENERS", 1))
+# Restart a listener after this many conversions, LibreOffice's memory usage keeps growing
+OFFICE_MAX_CONVERSIONS = int(os.environ.get("OFFICE_MAX_CONVERSIONS", 200))
+# The longest time (in seconds) a listener may take to start
+OFFICE_STARTUP_TIMEOUT = 60
+# The longest time (in seconds) a single document may take to convert
+OFFICE_TIMEOUT = 30
+
+
+class OfficeError(RuntimeError):
+    pass
+
+
+class OfficeStartupError(OfficeError):
+    pass
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _kill(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+class OfficeListener:
+    """
+    A headless LibreOffice kept running behind unoserver, converting documents sent over its XML-RPC port.
+
+    Every listener has its own LibreOffice profile, so several of them can run on the same machine.
+    """
+
+    def __init__(self):
+        self.process = None
+        self.client = None
+        self.profile_dir = None
+        self.num_conversions = 0
+
+    def start(self):
+        from unoserver.client import UnoClient
+
+        self.profile_dir = get_workspace().directory(f"office-profile-{id(self)}")
+        port, uno_port = _free_port(), _free_port()
+        self.process = subprocess.Popen(
+            [
+                "unoserver", "--interface", "127.0.0.1", "--port", str(port), "--uno-port", str(uno_port),
+                "--user-installation", f"file://{self.profile_dir}",
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,  # so LibreOffice and its helpers are killed together
+        )
+
+        # Wait until the XML-RPC server accepts connections
+        deadline = time.monotonic() + OFFICE_STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                self.close()
+                raise OfficeStartupError("unoserver exited while starting.")
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=1):
+                    break
+            except OSError:
+                time.sleep(0.2)
+        else:
+            self.close()
+            raise OfficeStartupError(f"unoserver did not start within {OFFICE_STARTUP_TIMEOUT} seconds.")
+
+        self.client = UnoClient(server="127.0.0.1", port=str(port))
+        self.num_conversions = 0
+
+    def is_healthy(self):
+        return self.process is not None and self.process.poll() is None and self.num_conversions < OFFICE_MAX_CONVERSIONS
+
+    def ensure_started(self):
+        if not self.is_healthy():
+            self.close()
+            self.start()
+
+    def convert(self, document_bytes, convert_to="pdf"):
+        self.ensure_started()
+        self.num_conversions += 1
+        # The document goes in and the PDF comes out as bytes, nothing is written to disk
+        return self.client.convert(indata=document_bytes, convert_to=convert_to)
+
+    def close(self):
+        if self.process is not None:
+            _kill(self.process)
+        if self.profile_dir is not None:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+        self.process = None
+        self.client = None
+        self.profile_dir = None
+
+
+def convert_with_soffice(document_bytes, extension="docx", convert_to="pdf", timeout=OFFICE_TIMEOUT):
+    # Without unoserver, start a LibreOffice per document (slow, but it still runs in parallel with its own profile)
+    with get_workspace().job("office") as temp_dir:
+        input_file = os.path.join(temp_dir, f"document.{extension}")
+        with open(input_file, "wb") as f:
+            f.write(document_bytes)
+
+        process = subprocess.Popen(
+            [
+                "soffice", f"-env:UserInstallation=file://{os.path.join(temp_dir, 'profile')}",
+                "--headless", "--convert-to", convert_to, "--outdir", temp_dir, input_file,
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+        try:
+            stdout, _ = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill(process)
+            raise OfficeError(f"LibreOffice conversion exceeded {timeout} seconds.")
+
+        output_file = os.path.join(temp_dir, f"document.{convert_to}")
+        if process.returncode != 0 or not os.path.exists(output_file):
+            raise OfficeError(f"Error encountered during LibreOffice conversion:\n{stdout.decode('utf-8', errors='replace')[-2000:]}")
+        with open(output_file, "rb") as f:
+            return f.read()
+
+
+class OfficePool:
+    """
+    A pool of LibreOffice listeners converting office documents (e.g. DOCX) to PDF in memory.
+
+    Listeners are started lazily, restarted when they die or time out, and recycled after
+    `OFFICE_MAX_CONVERSIONS` conversions. Falls back to one `soffice` per document if unoserver
+    is not installed, or if a listener fails to start (e.g. unoserver can't import `uno` in a venv).
+
+    :param num_listeners: The number of listeners, i.e. of documents converted at the same time.
+    """
+
+    def __init__(self, num_listeners=OFFICE_LISTENERS):
+        try:
+            import unoserver  # noqa: F401
+            self.use_unoserver = shutil.which("unoserver") is not None
+        except ImportError:
+            self.use_unoserver = False
+
+        self._pid = os.getpid()
+        self._listeners = queue.Queue()
+        for _ in range(num_listeners):
+            self._listeners.put(OfficeListener())
+        self._all_listeners = list(self._listeners.queue)
+        # The conversion calls of unoserver have no timeout, so they run in a thread that can be abandoned
+        self.executor = ThreadPoolExecutor(max_workers=num_listeners, thread_name_prefix="office")
+
+    def convert(self, document_bytes, extension="docx", convert_to="pdf", timeout=OFFICE_TIMEOUT):
+        """
+        Converts a document.
+
+        :param document_bytes: The content of the document.
+        :param extension: The file extension of the document (used by the `soffice` fallback).
+        :param convert_to: The format to convert to.
+        :param timeout: The longest time (in seconds) the conversion may take.
+        :return: The content of the converted document.
+        """
+        if not self.use_unoserver:
+            return convert_with_soffice(document_bytes, extension, convert_to, timeout)
+
+        listener = self._listeners.get()
+        try:
+            # Started in this thread, the startup has its own (longer) timeout
+            try:
+                listener.ensure_started()
+            except Exception as e:
+                print(f"Error: {e}, converting with soffice from now on.")
+                self.use_unoserver = False
+                return convert_with_soffice(document_bytes, extension, convert_to, timeout)
+
+            future = self.executor.submit(listener.convert, document_bytes, convert_to)
+            try:
+                return future.result(timeout=timeout)
+            except FutureTimeoutError:
+                # Killing LibreOffice also makes the abandoned call fail
+                listener.close()
+                raise OfficeError(f"LibreOffice conversion exceeded {timeout} seconds.")
+            except OfficeError:
+                raise
+            except Exception as e:
+                # The listener may be left in a bad state, start the next conversion with a fresh one
+                listener.close()
+                raise OfficeError(f"Error encountered during LibreOffice conversion: {e}")
+        finally:
+            self._listeners.put(listener)
+
+    def close(self):
+        # Never kill the listeners of another process (e.g. after a fork)
+        if self._pid != os.getpid():
+            return
+        for listener in self._all_listeners:
+            listener.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_OFFICE_POOL = None
+_OFFICE_POOL_PID = None
+
+
+def get_office_pool():
+    # The listeners of a parent process belong to the parent
+    global _OFFICE_POOL, _OFFICE_POOL_PID
+    if _OFFICE_POOL is None or _OFFICE_POOL_PID != os.getpid():
+        _OFFICE_POOL = OfficePool()
+        _OFFICE_POOL_PID = os.getpid()
+        atexit.register(_OFFICE_POOL.close)
+    return _OFFICE_POOL
@@ -0,0 +1,48 @@
+import openai
+from functools import cached_property
+from datadreamer.llms import OpenAI
+
+from .scheduler import get_scheduler
+from .rate_limiter import run_rate_limited, estimate_tokens, used_tokens
+from .response_cache import cached_request
+
+
+class CustomOpenAI(OpenAI):
+
+    @cached_property
+    def retry_wrapper(self):
+        # DataDreamer's retries, around requests that wait for a slot shared with the other pipelines
+        openai_retry_wrapper = OpenAI.retry_wrapper.func(self)
+
+        def scheduled(func):
+            # The raw response has the rate limit headers
+            raw_func = getattr(getattr(func, "__self__", None), "with_raw_response", None)
+            raw_func = getattr(raw_func, func.__name__, None)
+
+            def request(**kwargs):
+                with get_scheduler().llm_slot(self):
+                    if raw_func is None:
+                        response, headers = func(**kwargs), None
+                    else:
+                        raw_response = raw_func(**kwargs)
+                        response, headers = raw_response.parse(), raw_response.headers
+                return response, headers, used_tokens(response)
+
+            def _scheduled(**kwargs):
+                # Paced under the rate limits of the model, the 429s are waited out by the limiter
+                return run_rate_limited(
+                    self.model_name, lambda: request(**kwargs), estimate_tokens(kwargs), (openai.RateLimitError,)
+                )
+            return _scheduled
+
+        def _retry_wrapper(func, **kwargs):
+            # Every attempt waits for its own slot, backing off doesn't hold one. The cache is looked up
+            # once per request, outside the retries, so retrying doesn't count as another sample
+            return cached_request(self.model_name, kwargs, lambda: openai_retry_wrapper(func=scheduled(func), **kwargs))
+
+        return _retry_wrapper
+
+    @cached_property
+    def client(self):
+        # The client would retry 429s on its own, hiding them from the rate limiter
+        return OpenAI.client.func(self).with_options(max_retries=0)
@@ -0,0 +1,246 @@
+import os
+import re
+import json
+import time
+import fcntl
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# Where the state of the limiters is kept, shared by every process (and run) of the machine using the same API keys
+RATE_LIMIT_DIR = os.environ.get("RATE_LIMIT_DIR", os.path.join(tempfile.gettempdir(), "pixmo_rate_limits"))
+# The requests and tokens per minute of a model, until the headers of its responses tell the real limits
+RATE_LIMIT_RPM = int(os.environ.get("RATE_LIMIT_RPM", 500))
+RATE_LIMIT_TPM = int(os.environ.get("RATE_LIMIT_TPM", 200000))
+# The fraction of the limits to aim for
+RATE_LIMIT_TARGET = float(os.environ.get("RATE_LIMIT_TARGET", 0.95))
+# The buckets hold at most this many seconds of traffic, the largest burst sent at once
+RATE_LIMIT_BURST_SECONDS = 5
+# AIMD: the rate is multiplied by RATE_LIMIT_DECREASE after a 429, and grows back by RATE_LIMIT_INCREASE (of the
+# target) per minute without one
+RATE_LIMIT_DECREASE = 0.5
+RATE_LIMIT_INCREASE = 0.1
+RATE_LIMIT_MIN_FACTOR = 0.05
+# The 429s of the requests in flight when the rate is decreased are answers to the old rate, not to the new one
+RATE_LIMIT_STORM_SECONDS = 10
+# The number of 429s a request waits out before raising the error (to the retries of the LLM)
+RATE_LIMIT_MAX_RETRIES = 20
+# The number of tokens a request is assumed to generate when it doesn't set `max_tokens`
+DEFAULT_MAX_TOKENS = 1024
+
+
+def parse_rate_limit_headers(headers):
+    """
+    Reads the rate limit headers of an OpenAI or Anthropic response (also as forwarded by LiteLLM, with a
+    `llm_provider-` prefix).
+
+    :param headers: The headers of the response (any mapping).
+    :return: A dictionary with the known values of `rpm`, `tpm`, `remaining_requests`, `remaining_tokens`
+        and `retry_after` (in seconds).
+    """
+    values = {}
+    for name, value in (headers or {}).items():
+        name = name.lower()
+        if name.startswith("llm_provider-"):
+            name = name[len("llm_provider-"):]
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            continue
+        if name in ("x-ratelimit-limit-requests", "anthropic-ratelimit-requests-limit"):
+            values["rpm"] = value
+        elif name in ("x-ratelimit-limit-tokens", "anthropic-ratelimit-tokens-limit"):
+            values["tpm"] = value
+        elif name in ("x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining"):
+            values["remaining_requests"] = value
+        elif name in ("x-ratelimit-remaining-tokens", "anthropic-ratelimit-tokens-remaining"):
+            values["remaining_tokens"] = value
+        elif name == "retry-after":
+            values["retry_after"] = value
+    return values
+
+
+def estimate_tokens(request_kwargs):
+    # The tokens a request counts against the limit: its prompt (about 4 characters per token) and `max_tokens`
+    prompt = request_kwargs.get("messages") or request_kwargs.get("prompt") or ""
+    return len(str(prompt)) // 4 + (request_kwargs.get("max_tokens") or DEFAULT_MAX_TOKENS)
+
+
+class RateLimiter:
+    """
+    Paces the requests to a model with two token buckets, one for requests and one for tokens per minute,
+    refilled at just under the limits of the model. The limits are learned from the rate limit headers of the
+    responses, and the rate adapts to the 429s that still happen (AIMD): halved after one, then increased
+    slowly while there are none, so the throughput stays just under the quota instead of oscillating.
+
+    The buckets live in a file locked with `fcntl`, so every thread and process sending requests to the
+    model shares them.
+
+    :param model_name: The name of the model.
+    """
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        os.makedirs(RATE_LIMIT_DIR, exist_ok=True)
+        self.path = os.path.join(RATE_LIMIT_DIR, re.sub(r"[^\w.-]", "_", model_name) + ".json")
+
+    def _initial_state(self, now):
+        return {
+            "rpm": RATE_LIMIT_RPM, "tpm": RATE_LIMIT_TPM, "factor": 1.0,
+            "requests": 0.0, "tokens": 0.0, "updated": now,
+            "cooldown_until": 0.0, "last_decrease": 0.0, "last_increase": now, "num_rate_limited": 0,
+        }
+
+    @contextmanager
+    def _state(self):
+        # The state is read, changed and written back under an exclusive lock of the file
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            now = time.time()
+            content = os.read(fd, 1 << 16)
+            try:
+                state = json.loads(content)
+            except ValueError:
+                state = self._initial_state(now)
+            self._refill(state, now)
+            yield state, now
+            content = json.dumps(state).encode("utf-8")
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, content)
+        finally:
+            os.close(fd)  # also releases the lock
+
+    def _rates(self, state):
+        # The requests and tokens per second to aim for
+        scale = RATE_LIMIT_TARGET * state["factor"] / 60
+        return max(state["rpm"] * scale, 1e-3), max(state["tpm"] * scale, 1e-3)
+
+    def _refill(self, state, now):
+        request_rate, token_rate = self._rates(state)
+        elapsed = max(0.0, now - state["updated"])
+        state["requests"] = min(max(1.0, request_rate * RATE_LIMIT_BURST_SECONDS), state["requests"] + elapsed * request_rate)
+        state["tokens"] = min(token_rate * RATE_LIMIT_BURST_SECONDS, state["tokens"] + elapsed * token_rate)
+        state["updated"] = now
+
+    def acquire(self, tokens):
+        """
+        Waits until a request of `tokens` tokens may be sent, and takes it from the buckets.
+
+        :param tokens: The estimated number of tokens of the request.
+        """
+        while True:
+            with self._state() as (state, now):
+                request_rate, token_rate = self._rates(state)
+                # A request larger than the bucket is sent once the bucket is full
+                tokens = min(tokens, token_rate * RATE_LIMIT_BURST_SECONDS)
+                if now >= state["cooldown_until"] and state["requests"] >= 1 and state["tokens"] >= tokens:
+                    state["requests"] -= 1
+                    state["tokens"] -= tokens
+                    return
+                wait = max(
+                    state["cooldown_until"] - now,
+                    (1 - state["requests"]) / request_rate,
+                    (tokens - state["tokens"]) / token_rate,
+                )
+            time.sleep(min(max(wait, 0.01), 1.0))
+
+    def record_response(self, headers=None, used_tokens=None, estimated_tokens=None):
+        """
+        Updates the limiter after a successful request.
+
+        :param headers: The headers of the response.
+        :param used_tokens: The tokens the request actually used (to correct the estimate).
+        :param estimated_tokens: The tokens taken from the bucket for the request.
+        """
+        values = parse_rate_limit_headers(headers)
+        with self._state() as (state, now):
+            state["rpm"] = values.get("rpm", state["rpm"])
+            state["tpm"] = values.get("tpm", state["tpm"])
+            # The server knows better how much is left (e.g. other clients use the same key)
+            if "remaining_requests" in values:
+                state["requests"] = min(state["requests"], values["remaining_requests"])
+            if "remaining_tokens" in values:
+                state["tokens"] = min(state["tokens"], values["remaining_tokens"])
+            if used_tokens is not None and estimated_tokens is not None:
+                state["tokens"] -= used_tokens - estimated_tokens
+
+            # Additive increase, for the time since the last decrease or increase
+            since = now - max(state["last_decrease"] + RATE_LIMIT_STORM_SECONDS, state["last_increase"])
+            if since > 0 and state["factor"] < 1.0:
+                state["factor"] = min(1.0, state["factor"] + RATE_LIMIT_INCREASE * since / 60)
+                state["last_increase"] = now
+
+    def record_rate_limit(self, headers=None):
+        """
+        Updates the limiter after a 429.
+
+        :param headers: The headers of the 429 response, if any.
+        """
+        values = parse_rate_limit_headers(headers)
+        with self._state() as (state, now):
+            state["num_rate_limited"] += 1
+            state["requests"] = min(state["requests"], 0.0)
+            state["tokens"] = min(state["tokens"], 0.0)
+            if "retry_after" in values:
+                state["cooldown_until"] = max(state["cooldown_until"], now + values["retry_after"])
+            # Multiplicative decrease, once per storm
+            if now - state["last_decrease"] > RATE_LIMIT_STORM_SECONDS:
+                state["factor"] = max(RATE_LIMIT_MIN_FACTOR, state["factor"] * RATE_LIMIT_DECREASE)
+                state["last_decrease"] = now
+
+    def stats(self):
+        # The current limits and rate factor of the model
+        with self._state() as (state, _):
+            return dict(state)
+
+
+def run_rate_limited(model_name, request, estimated_tokens, rate_limit_errors):
+    """
+    Sends a request once the limiter of the model allows it, and waits out its 429s with the limiter
+    (which slows every other request to the model down too) instead of sleeping in each thread.
+
+    :param model_name: The name of the model.
+    :param request: A function sending the request, returning `(result, headers, used_tokens)`.
+    :param estimated_tokens: The estimated number of tokens of the request.
+    :param rate_limit_errors: The exception types of a 429.
+    :return: The result of the request.
+    """
+    limiter = get_rate_limiter(model_name)
+    for attempt in range(RATE_LIMIT_MAX_RETRIES):
+        limiter.acquire(estimated_tokens)
+        try:
+            result, headers, used_tokens = request()
+        except rate_limit_errors as e:
+            limiter.record_rate_limit(error_headers(e))
+            if attempt + 1 == RATE_LIMIT_MAX_RETRIES:
+                raise
+            continue
+        limiter.record_response(headers, used_tokens, estimated_tokens)
+        return result
+
+
+def error_headers(error):
+    # The headers of the response of an API error (OpenAI and LiteLLM keep them in different places)
+    headers = getattr(error, "litellm_response_headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    return headers
+
+
+def used_tokens(response):
+    # The tokens a completion used, if the response says
+    return getattr(getattr(response, "usage", None), "total_tokens", None)
+
+
+_RATE_LIMITERS = {}
+_RATE_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(model_name):
+    # The limiters only hold the path of their state, which is shared through the file
+    with _RATE_LIMITERS_LOCK:
+        if model_name not in _RATE_LIMITERS:
+            _RATE_LIMITERS[model_name] = RateLimiter(model_name)
+        return _RATE_LIMITERS[model_name]
@@ -1,31 +1,48 @@
 import os
 import re
 import random
+import threading
 import subprocess
-import tempfile
+import numpy as np
 from io import BytesIO
-from shutil import rmtree
-from PIL import ImageOps, Image
-import vl_convert as vlc
-from rdkit import Chem
-from rdkit.Chem import AllChem, Draw
-from pdf2image import convert_from_bytes
-from playwright.sync_api import sync_playwright
-
-
-def crop_whitespace(image):
-    # Invert the image (assuming white background)
-    inverted_image = ImageOps.invert(image.convert("RGB"))
-
-    # Convert image to grayscale
-    grayscale_image = inverted_image.convert("L")
-
-    # Get bounding box of non-white pixels
-    bbox = grayscale_image.getbbox()
+from PIL import Image
+from rdkit.Chem import Draw
+
+from .latex import compile_latex, LATEX_TIMEOUT
+from .chemistry import get_molecule
+from .vegalite import get_vegalite_renderer, VegaLiteError
+from .svg import get_svg_renderer, rasterize_svg
+from .asymptote import get_asymptote_renderer, AsymptoteError
+from .lilypond import get_lilypond_renderer, LilyPondError
+from .mermaid import get_mermaid_renderer, render_mermaid_cli, MermaidError
+from .workspace import get_workspace
+from .browser import get_browser_pool, get_async_renderer, wait_for_render, RENDER_WAIT_MODE, RENDER_MAX_WAIT
+
+# The resolution PDFs are rasterized at (the default of pdf2image)
+PDF_DPI = 200
+# pdfium is not thread-safe, and pipelines (and their shards) render in threads of the same process
+_PDFIUM_LOCK = threading.Lock()
+
+
+def content_bbox(image, bg_color=(255, 255, 255), tolerance=0):
+    # Get the bounding box of the pixels that differ from the background color by more than `tolerance` in any channel
+    if image.mode != "RGB": image = image.convert("RGB")
+    image_array = np.asarray(image, dtype=np.int16)
+    mask = np.any(np.abs(image_array - np.array(bg_color[:3], dtype=np.int16)) > tolerance, axis=-1)
+
+    rows = np.flatnonzero(mask.any(axis=1))
+    columns = np.flatnonzero(mask.any(axis=0))
+    if rows.size == 0: return None
+    return (int(columns[0]), int(rows[0]), int(columns[-1]) + 1, int(rows[-1]) + 1)
+
+
+def crop_to_content(image, bg_color=(255, 255, 255), tolerance=0, buffer_range=(50, 100)):
+    # Get bounding box of non-background pixels
+    bbox = content_bbox(image, bg_color, tolerance)
 
     if bbox:
-        # Expand bounding box with a 50px-100px buffer
-        buffer_size = random.randint(50, 100)
+        # Expand bounding box with a random buffer (50px-100px by default)
+        buffer_size = random.randint(*buffer_range)
         left = max(0, bbox[0] - buffer_size)
         upper = max(0, bbox[1] - buffer_size)
         right = min(image.width, bbox[2] + buffer_size)
@@ -35,44 +52,24 @@ def crop_whitespace(image):
         cropped_image = image.crop((left, upper, right, lower))
         return cropped_image
 
-    # If no bounding box found (all white image), return original image
+    # If no bounding box found (all background color), return original image
     return image
 
 
-def crop_background(image):
-    # Get the background color from the top-left corner pixel
-    bg_color = image.getpixel((0, 0))
+def crop_whitespace(image, tolerance=0):
+    # Crop the white margins of the image
+    return crop_to_content(image, (255, 255, 255), tolerance)
+
 
+def crop_background(image, tolerance=0):
     # Convert image to RGB mode if it's not already
     image = image.convert("RGB")
 
-    # Create a mask where background color pixels are white, others are black
-    mask = Image.new('L', image.size, 0)
-    for x in range(image.width):
-        for y in range(image.height):
-            if image.getpixel((x, y)) == bg_color:
-                mask.putpixel((x, y), 255)
-
-    # Invert the mask
-    mask = ImageOps.invert(mask)
-
-    # Get bounding box of non-background pixels
-    bbox = mask.getbbox()
-
-    if bbox:
-        # Expand bounding box with a 50px-100px buffer
-        buffer_size = random.randint(50, 100)
-        left = max(0, bbox[0] - buffer_size)
-        upper = max(0, bbox[1] - buffer_size)
-        right = min(image.width, bbox[2] + buffer_size)
-        lower = min(image.height, bbox[3] + buffer_size)
+    # Get the background color from the top-left corner pixel
+    bg_color = image.getpixel((0, 0))
 
-        # Crop image using calculated bounding box
-        cropped_image = image.crop((left, upper, right, lower))
-        return cropped_image
-
-    # If no bounding box found (all background color), return original image
-    return image
+    # Crop the margins with the background color
+    return crop_to_content(image, bg_color, tolerance)
 
 
 def extract_html_width(html):
@@ -83,34 +80,34 @@ def extract_html_width(html):
     else: return None
 
 
-def render_html(html, full_page=True, random_width=True):
-    html = html.replace("initial-scale=1.0", "initial-scale=2.0")
-    with sync_playwright() as p:
-        browser = p.chromium.launch()
-        
-        height = 800
-        # Extract the width of the HTML content
-        width = extract_html_width(html)
-        if width is None: width = 1200
+def html_viewport(html, random_width=True):
+    height = 800
+    # Extract the width of the HTML content
+    width = extract_html_width(html)
+    if width is None: width = 1200
+    else:
+        # if random_width is an integer, add a random value to the width
+        if isinstance(random_width, int):
+            width += random_width
         else:
-            # if random_width is an integer, add a random value to the width
-            if isinstance(random_width, int):
-                width += random_width
+            if random_width: 
+                width += random.randint(50, 150)  # Add some buffer to the width
             else:
-                if random_width: 
-                    width += random.randint(50, 150)  # Add some buffer to the width
-                else:
-                    width += 100  # Add a fixed buffer to the width
+                width += 100  # Add a fixed buffer to the width
 
-        # Set the resolution of the browser
-        page = browser.new_page(viewport={"width": width, "height": height})
-        
+    return {"width": width, "height": height}
+
+
+def render_html(html, full_page=True, random_width=True, wait_mode=RENDER_WAIT_MODE, max_wait=RENDER_MAX_WAIT):
+    html = html.replace("initial-scale=1.0", "initial-scale=2.0")
+
+    # Set the resolution of the browser, reusing the browser of this worker process
+    with get_browser_pool().page(viewport=html_viewport(html, random_width)) as page:
         page.set_content(html)
-        page.wait_for_timeout(2000)  # wait for the content to render
+        wait_for_render(page, wait_mode=wait_mode, max_wait=max_wait)  # wait for the content to render
 
         # Take a screenshot of the full page
         screenshot_bytes = page.screenshot(full_page=full_page)
-        browser.close()
 
     image = Image.open(BytesIO(screenshot_bytes))
     return image
@@ -122,133 +119,213 @@ def extract_screen_width(html):
     if match: return int(match.group(1))
     else: return None
 
-def render_screen(html, full_page=True, random_width=True):
-    html = html.replace("initial-scale=1.0", "initial-scale=2.0")
-    with sync_playwright() as p:
-        browser = p.chromium.launch()
-        
-        height = 800
-        # Extract the width of the HTML content
-        width = extract_screen_width(html)
-        if width is None: width = 800
+def screen_viewport(html, random_width=True):
+    height = 800
+    # Extract the width of the HTML content
+    width = extract_screen_width(html)
+    if width is None: width = 800
+    else:
+        # if random_width is an integer, add a random value to the width
+        if isinstance(random_width, int):
+            width += random_width
         else:
-            # if random_width is an integer, add a random value to the width
-            if isinstance(random_width, int):
-                width += random_width
-            else:
-                if random_width: 
-                    width += random.randint(0, 100)
-        
-        # Set the resolution of the browser
-        page = browser.new_page(viewport={"width": width, "height": height})
-        
+            if random_width: 
+                width += random.randint(0, 100)
+
+    return {"width": width, "height": height}
+
+
+def render_screen(html, full_page=True, random_width=True, wait_mode=RENDER_WAIT_MODE, max_wait=RENDER_MAX_WAIT):
+    html = html.replace("initial-scale=1.0", "initial-scale=2.0")
+
+    # Set the resolution of the browser, reusing the browser of this worker process
+    with get_browser_pool().page(viewport=screen_viewport(html, random_width)) as page:
         page.set_content(html)
-        page.wait_for_timeout(2000)  # wait for the content to render
+        wait_for_render(page, wait_mode=wait_mode, max_wait=max_wait)  # wait for the content to render
 
         # Take a screenshot of the full page
         screenshot_bytes = page.screenshot(full_page=full_page)
-        browser.close()
 
     image = Image.open(BytesIO(screenshot_bytes))
     return image
 
 
-def render_latex(latex_source):
-    def compile_latex(compiler, latex_file, temp_dir):
-        process = subprocess.Popen(
-            [
-                compiler,
-                "-interaction=nonstopmode",
-                "-output-directory",
-                temp_dir,
-                latex_file,
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-        )
-        stdout, stderr = process.communicate()
-        return process.returncode, stdout
-
-    # Create temporary directory
-    temp_dir = tempfile.mkdtemp()
-
-    # Prepare paths
-    latex_file = os.path.join(temp_dir, "temp.tex")
-    pdf_file = os.path.join(temp_dir, "temp.pdf")
-
-    # Write LaTeX content to a file
-    with open(latex_file, "w", encoding="utf-8") as f:
-        f.write(latex_source)
-
-    # Try to compile with pdflatex, xelatex, and lualatex
-    compilers = ["pdflatex", "xelatex", "lualatex"]
-    for compiler in compilers:
-        returncode, stdout = compile_latex(compiler, latex_file, temp_dir)
-        if returncode == 0:
-            break
-    else:
-        rmtree(temp_dir, ignore_errors=True)
-        raise RuntimeError(f'Error encountered during LaTeX rendering with all compilers:\n{stdout.decode("utf-8")}')
+def _render_html_jobs(list_of_html, get_viewport, full_page, random_width, wait_mode, max_wait):
+    images = [None] * len(list_of_html)
+    indices, jobs = [], []
+    for index, html in enumerate(list_of_html):
+        # A page without code (e.g. no HTML could be extracted from the generation) only fails its own row
+        try:
+            html = html.replace("initial-scale=1.0", "initial-scale=2.0")
+            viewport = get_viewport(html, random_width)
+        except Exception as e:
+            print(f"Error: {e!r}")
+            continue
+        indices.append(index)
+        jobs.append({
+            "html": html,
+            "viewport": viewport,
+            "full_page": full_page,
+            "wait_mode": wait_mode,
+            "max_wait": max_wait,
+        })
+    if not jobs:
+        return images
+
+    # Render all pages concurrently inside the browser of this worker process
+    try:
+        results = get_async_renderer().render_batch(jobs)
+    except Exception as e:
+        # The browser could not be started (or was lost), which fails every page of the batch but not the step
+        print(f"Error: {e!r}")
+        return images
+
+    for index, result in zip(indices, results):
+        if isinstance(result, BaseException):
+            print(f"Error: {result!r}")
+        else:
+            images[index] = Image.open(BytesIO(result))
+    return images
 
-    # Convert PDF bytes to images using pdf2image
-    images = convert_from_bytes(open(pdf_file, "rb").read())
 
-    # Cleanup temporary files (optional)
-    os.remove(latex_file)
-    os.remove(pdf_file)
-    rmtree(temp_dir, ignore_errors=True)
+def render_html_batch(list_of_html, full_page=True, random_width=True, wait_mode=RENDER_WAIT_MODE, max_wait=RENDER_MAX_WAIT):
+    # Same as `render_html` for a list of pages, returns None for the pages that failed to render
+    return _render_html_jobs(list_of_html, html_viewport, full_page, random_width, wait_mode, max_wait)
 
-    # Return the PIL image (assuming single-page PDF)
-    if images:
-        return crop_whitespace(images[0])  # Return the first page as a PIL image
 
-    raise RuntimeError("PDF did not generate anything.")
+def render_screen_batch(list_of_html, full_page=True, random_width=True, wait_mode=RENDER_WAIT_MODE, max_wait=RENDER_MAX_WAIT):
+    # Same as `render_screen` for a list of pages, returns None for the pages that failed to render
+    return _render_html_jobs(list_of_html, screen_viewport, full_page, random_width, wait_mode, max_wait)
 
 
-def render_vegalite(vegalite_json):
-    png_data = vlc.vegalite_to_png(vl_spec=vegalite_json, scale=random.choice([1.5, 2, 2.5, 3]))
-    img_buffer = BytesIO(png_data)
-    return Image.open(img_buffer)
+def rasterize_pdf(pdf, dpi=PDF_DPI):
+    """
+    Rasterizes the first page of a PDF, without rendering the other pages.
 
+    Uses pypdfium2 in-process when it is installed (one call at a time per process, pdfium is not
+    thread-safe), otherwise poppler's `pdftoppm` writing the single page to a memory buffer.
 
-def render_mermaid(mermaid_code):
-    scale = random.choice([2, 3])
+    :param pdf: The path of the PDF file, or its bytes.
+    :param dpi: The resolution to render the page at.
+    :return: The PIL image of the first page, or None if the PDF has no pages.
+    """
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        pdfium = None
+
+    if pdfium is not None:
+        with _PDFIUM_LOCK:
+            document = pdfium.PdfDocument(pdf)
+            try:
+                if len(document) == 0: return None
+                page = document[0]
+                image = page.render(scale=dpi / 72).to_pil().convert("RGB")
+                page.close()
+                return image
+            finally:
+                document.close()
+
+    # Without an output file, pdftoppm writes the page to stdout, and with "-" it reads the PDF from stdin
+    process = subprocess.run(
+        ["pdftoppm", "-f", "1", "-l", "1", "-r", str(dpi), "-png", "-singlefile", "-" if isinstance(pdf, bytes) else pdf],
+        input=pdf if isinstance(pdf, bytes) else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if process.returncode != 0 or not process.stdout: return None
+    return Image.open(BytesIO(process.stdout))
+
+
+def render_latex(latex_source, timeout=None):
+    # Compile in the reusable scratch directory of this thread, wiped once the job is done. `timeout` bounds all
+    # the compilations together (the compilers run in subprocesses, so this works in any thread)
+    with get_workspace().job("latex") as temp_dir:
+        # Prepare paths
+        latex_file = os.path.join(temp_dir, "temp.tex")
+        pdf_file = os.path.join(temp_dir, "temp.pdf")
+
+        # Write LaTeX content to a file
+        with open(latex_file, "w", encoding="utf-8") as f:
+            f.write(latex_source)
+
+        # Compile with the compiler that fits the source best (falling back to the others), reusing precompiled preambles
+        returncode, stdout = compile_latex(latex_file, temp_dir, timeout=timeout)
+        if returncode is None:
+            raise TimeoutError(f"LaTeX compilation exceeded {timeout or LATEX_TIMEOUT} seconds.")
+        if returncode != 0:
+            raise RuntimeError(f'Error encountered during LaTeX rendering with all compilers:\n{stdout.decode("utf-8", errors="replace")}')
+
+        # Rasterize only the first page of the PDF
+        image = rasterize_pdf(pdf_file)
+
+    # Return the PIL image of the first page
+    if image is not None:
+        return crop_whitespace(image)
 
-    temp_dir = tempfile.mkdtemp()
-    output_mmd = os.path.join(temp_dir, "diagram.mmd")
-    output_image = os.path.join(temp_dir, "diagram.png")
+    raise RuntimeError("PDF did not generate anything.")
 
-    # Save the Mermaid code to a temporary file
-    with open(output_mmd, "w") as file:
-        file.write(mermaid_code)
 
-    # Call the Mermaid CLI to generate the diagram with the specified scale
-    subprocess.run(["mmdc", "-i", output_mmd, "-o", output_image, "-s", str(scale)])
+def render_vegalite_batch(list_of_vegalite_json):
+    # Validate and render the specs concurrently in the vl-convert context of this worker process, returns None for the specs that failed to render
+    specs = [(vegalite_json, random.choice([1.5, 2, 2.5, 3])) for vegalite_json in list_of_vegalite_json]
 
-    # Read the generated image
-    with open(output_image, "rb") as file:
-        image_data = file.read()
+    images = []
+    for result in get_vegalite_renderer().render_batch(specs):
+        if isinstance(result, BaseException):
+            print(f"Error: {result}")
+            images.append(None)
+        else:
+            images.append(Image.open(BytesIO(result)))
+    return images
 
-    # Clean up the temporary files
-    os.remove(output_mmd)
-    os.remove(output_image)
-    os.rmdir(temp_dir)
 
-    # Load the image from the data
-    img = Image.open(BytesIO(image_data))
+def render_vegalite(vegalite_json):
+    image = render_vegalite_batch([vegalite_json])[0]
+    if image is None:
+        raise VegaLiteError("Error encountered during Vega-Lite rendering.")
+    return image
 
-    return img
 
+def render_mermaid_batch(list_of_mermaid_code):
+    # Render the diagrams in the warm Mermaid page of this worker process, returns None for the diagrams that failed to render
+    diagrams = [(mermaid_code, random.choice([2, 3])) for mermaid_code in list_of_mermaid_code]
 
-def render_chemical(smiles, dpi=300):
-    # Create a molecule object from SMILES
-    mol = Chem.MolFromSmiles(smiles)
-    
-    if mol is None: return None
+    renderer = get_mermaid_renderer()
+    if renderer is not None:
+        results = renderer.render_batch(diagrams)
+    else:
+        # mermaid.js is not available, fall back to the Mermaid CLI
+        results = []
+        for mermaid_code, scale in diagrams:
+            with get_workspace().job("mermaid") as temp_dir:
+                try:
+                    results.append(render_mermaid_cli(mermaid_code, scale, temp_dir))
+                except MermaidError as e:
+                    results.append(e)
+                except Exception as e:
+                    # e.g. no code could be extracted from the generation
+                    results.append(MermaidError(f"Error encountered during Mermaid rendering: {e!r}"))
+
+    images = []
+    for result in results:
+        if isinstance(result, BaseException):
+            print(f"Error: {result}")
+            images.append(None)
+        else:
+            images.append(Image.open(BytesIO(result)))
+    return images
+
+
+def render_mermaid(mermaid_code):
+    image = render_mermaid_batch([mermaid_code])[0]
+    if image is None:
+        raise MermaidError("Error encountered during Mermaid rendering.")
+    return image
 
-    # Add 2D coordinates to the molecule
-    AllChem.Compute2DCoords(mol)
 
+def draw_molecule(mol, dpi=300):
+    # mol is an RDKit molecule with 2D coordinates
     # Set a base size based on the length of the molecule
     base_size_inches = 1 + (mol.GetNumAtoms() * 0.1)
     
@@ -299,64 +376,68 @@ def render_chemical(smiles, dpi=300):
     return crop_whitespace(img)
 
 
-def render_music(lilypound_code):
-    # make the temp directory under the current working directory TODO: Change this to a more permanent location
-    temp_dir = "/Users/yueyang1/Documents/github/Sci-Fi-dev/pipeline/lilypond_music_pipeline/temp"
+def render_chemical(smiles, dpi=300):
+    # Get the molecule with its 2D coordinates, parsed (and laid out) at most once per process
+    mol = get_molecule(smiles, with_coords=True)
 
-    # make sure the temp directory exists and is empty
-    os.makedirs(temp_dir, exist_ok=True)
+    if mol is None: return None
 
-    # Clean up the intermediate files in the temp directory
-    for file in os.listdir(temp_dir):
-        file_path = os.path.join(temp_dir, file)
-        os.remove(file_path)
+    return draw_molecule(mol, dpi)
 
-    # Write LilyPond code to a file
-    lilypond_file = os.path.join(temp_dir, "music.ly")
-    with open(lilypond_file, "w") as f:
-        f.write(lilypound_code)
 
-    # Compile LilyPond code to create PNG
-    try:
-        subprocess.run(
-            ["lilypond", "--png", "-dno-point-and-click", "-o", "music", lilypond_file],
-            check=True,
-            cwd=temp_dir,
-        )
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Error encountered during LilyPond rendering: {e}")
-    
-    # Read the generated PNG image
-    png_file = os.path.join(temp_dir, "music.png")
-    with open(png_file, "rb") as f:
-        image_data = f.read()
-
-    # Clean up the intermediate files in the temp directory
-    for file in os.listdir(temp_dir):
-        file_path = os.path.join(temp_dir, file)
-        os.remove(file_path)
-    
-    # Load the image from the data
-    img = Image.open(BytesIO(image_data))
+def render_chemical_batch(list_of_smiles, dpi=300):
+    # Same as `render_chemical` for a list of SMILES, returns None for the molecules that failed to render
+    images = []
+    for smiles in list_of_smiles:
+        try:
+            images.append(render_chemical(smiles, dpi))
+        except Exception as e:
+            print(f"Error: {e}")
+            images.append(None)
+    return images
+
+
+def render_music_batch(list_of_lilypond_code):
+    # Compile the scores with parallel LilyPond processes, each in its own scratch directory, returns None for the scores that failed to render
+    images = []
+    for result in get_lilypond_renderer().render_batch(list_of_lilypond_code):
+        if isinstance(result, BaseException):
+            print(f"Error: {result}")
+            images.append(None)
+        else:
+            images.append(crop_background(Image.open(BytesIO(result))))
+    return images
+
 
-    return crop_background(img)
+def render_music(lilypound_code):
+    image = render_music_batch([lilypound_code])[0]
+    if image is None:
+        raise LilyPondError("Error encountered during LilyPond rendering.")
+    return image
 
 
 def render_circuit(circuit):
     # circuit is a schemdraw.Drawing object
-    temp_dir = tempfile.mkdtemp()
-    output_image = os.path.join(temp_dir, "circuit.png")
-
     # randomly get a dpi value ranging from 100 to 300
-    circuit.save(output_image, dpi=random.randint(100, 300))
-
-    # Read the generated image
-    with open(output_image, "rb") as file:
-        image_data = file.read()
+    dpi = random.randint(100, 300)
 
-    # Clean up the temporary files
-    os.remove(output_image)
-    os.rmdir(temp_dir)
+    try:
+        # The matplotlib backend saves straight into a buffer (as PNG, matplotlib's default format)
+        buffer = BytesIO()
+        circuit.save(buffer, dpi=dpi)
+        image_data = buffer.getvalue()
+    except Exception:
+        image_data = None
+
+    if not image_data:
+        # Other backends need a file name with an extension
+        with get_workspace().job("circuit") as temp_dir:
+            output_image = os.path.join(temp_dir, "circuit.png")
+            circuit.save(output_image, dpi=dpi)
+
+            # Read the generated image
+            with open(output_image, "rb") as file:
+                image_data = file.read()
 
     # Load the image from the data
     img = Image.open(BytesIO(image_data))
@@ -364,45 +445,43 @@ def render_circuit(circuit):
     return img
 
 
+def render_svg_batch(list_of_svg_string):
+    # Convert SVG strings to PNG images with enough resolution for OCR, concurrently, returns None for the SVGs that failed to render
+    svgs = [(svg_string, random.randint(150, 300)) for svg_string in list_of_svg_string]
+
+    images = []
+    for result in get_svg_renderer().render_batch(svgs):
+        if isinstance(result, BaseException):
+            print(f"Error: {result}")
+            images.append(None)
+        else:
+            images.append(Image.open(BytesIO(result)))
+    return images
+
+
 def render_svg(svg_string):
     # Convert SVG string to PNG image with enough resolution for OCR
-    import cairosvg
-    png_data = cairosvg.svg2png(bytestring=svg_string.encode("utf-8"), dpi=random.randint(150, 300))
+    png_data = rasterize_svg(svg_string, dpi=random.randint(150, 300))
     img_buffer = BytesIO(png_data)
     return Image.open(img_buffer)
 
 
-def render_asymptote(asymptote_code):
-    temp_dir = tempfile.mkdtemp()
-    output_asy = os.path.join(temp_dir, "diagram.asy")
-    output_image = os.path.join(temp_dir, "diagram")
-
-    # Save the Asymptote code to a temporary file
-    with open(output_asy, "w") as file:
-        file.write(asymptote_code)
-
-    # Call the Asymptote CLI to generate the diagram TODO: CHANGE RESOLUTION
-    resolution = random.randint(3, 6)
-    subprocess.run([
-        "asy",
-        "-f", "png",
-        "-render", str(resolution),
-        "-o", output_image,
-        output_asy
-    ])
-
-    # Read the generated image
-    with open(output_image + ".png", "rb") as file:
-        image_data = file.read()
-
-    # Clean up the intermediate files in the temp directory
-    for file in os.listdir(temp_dir):
-        file_path = os.path.join(temp_dir, file)
-        os.remove(file_path)
-
-    os.rmdir(temp_dir)
+def render_asymptote_batch(list_of_asymptote_code):
+    # Compile the figures with a bounded number of Asymptote processes, several figures per process, returns None for the figures that failed to render
+    figures = [(asymptote_code, random.randint(3, 6)) for asymptote_code in list_of_asymptote_code]
 
-    # Load the image from the data
-    img = Image.open(BytesIO(image_data))
+    images = []
+    for result in get_asymptote_renderer().render_batch(figures):
+        if isinstance(result, BaseException):
+            print(f"Error: {result}")
+            images.append(None)
+        else:
+            images.append(Image.open(BytesIO(result)))
+    return images
 
-    return img
\ No newline at end of file
+
+def render_asymptote(asymptote_code):
+    image = render_asymptote_batch([asymptote_code])[0]
+    if image is None:
+        raise AsymptoteError("Error encountered during Asymptote rendering.")
+    return image
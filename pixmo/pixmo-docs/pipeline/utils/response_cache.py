@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import hashlib
+import threading
+from types import SimpleNamespace
+from collections import Counter
+
+# Whether LLM responses are cached across steps, runs and pipelines (set to "false" to always call the APIs)
+LLM_CACHE = os.environ.get("LLM_CACHE", "true").lower() != "false"
+# The cache database, shared by every pipeline and run of the machine
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "pixmo-docs", "llm_responses.sqlite"))
+# The size (in MB) of the cached responses, the least recently used ones are evicted beyond it
+LLM_CACHE_MAX_SIZE = int(os.environ.get("LLM_CACHE_MAX_SIZE", 4096))
+# Check the size of the cache after this many new responses
+LLM_CACHE_EVICT_EVERY = 1000
+
+
+def normalize_prompt(text):
+    # Differences in line endings and trailing whitespace don't make a different prompt
+    return "\n".join(line.rstrip() for line in text.replace("\r\n", "\n").strip().split("\n"))
+
+
+def request_key(model_name, request_kwargs):
+    """
+    The part of the cache key of a request that doesn't depend on how many times it was sent.
+
+    :param model_name: The name of the model.
+    :param request_kwargs: The arguments of the completion request.
+    :return: The key, as a string.
+    """
+    if request_kwargs.get("messages") is not None:
+        prompt = [
+            {"role": message["role"], "content": normalize_prompt(str(message["content"]))}
+            for message in request_kwargs["messages"]
+        ]
+    else:
+        prompt = normalize_prompt(str(request_kwargs.get("prompt", "")))
+    return json.dumps(
+        [model_name, prompt, request_kwargs.get("temperature"), request_kwargs.get("top_p"), request_kwargs.get("n", 1)],
+        sort_keys=True,
+    )
+
+
+def response_contents(response):
+    # The generated texts of a completion (chat or not)
+    return [
+        choice.message.content if getattr(choice, "message", None) is not None else choice.text
+        for choice in response.choices
+    ]
+
+
+def response_from_contents(contents):
+    # A response with the fields DataDreamer reads from a chat or text completion
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content), text=content) for content in contents]
+    )
+
+
+class ResponseCache:
+    """
+    A content-addressed cache of LLM responses, keyed on the model, the normalized prompt, the sampling
+    parameters and the sample index: the n-th request with the same prompt and parameters gets the n-th
+    cached sample, so repeated prompts still get different samples and a re-run gets the same ones.
+
+    Unlike the caches of DataDreamer's steps (keyed by step fingerprint), the responses are reused after
+    a prompt template, `-n` or the seed changes, for every prompt that stayed the same. The cache is a
+    SQLite database in WAL mode, shared safely by concurrent threads, pipelines and processes, and evicts
+    the least recently used responses beyond `max_size` MB.
+
+    :param path: The path of the database.
+    :param max_size: The size (in MB) of the cached responses to keep.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, max_size=LLM_CACHE_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size * 1024 * 1024
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._occurrences = Counter()
+        self._reserved = {}
+        self._num_puts = 0
+        self.hits = 0
+        self.misses = 0
+
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, contents TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def _connection(self):
+        # SQLite connections can't be shared between threads
+        if getattr(self._local, "connection", None) is None:
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return self._local.connection
+
+    def next_key(self, model_name, request_kwargs):
+        """
+        The cache key of a request, counting how many times the same request was sent by this process.
+
+        :param model_name: The name of the model.
+        :param request_kwargs: The arguments of the completion request.
+        :return: The key.
+        """
+        key = request_key(model_name, request_kwargs)
+        with self._lock:
+            # A request sent again (e.g. after failing in a batch) gets the key it already counted for
+            if self._reserved.get(key):
+                return self._reserved[key].pop(0)
+            # Without sampling, every request gets the same response
+            greedy = request_kwargs.get("temperature") == 0 or request_kwargs.get("top_p") == 0
+            sample_index = 0 if greedy else self._occurrences[key]
+            self._occurrences[key] += 1
+        return hashlib.sha256(f"{key}\n{sample_index}".encode("utf-8")).hexdigest()
+
+    def reserve(self, model_name, request_kwargs, key):
+        """
+        Hands `key` (from `next_key()`) to the next request like this one, instead of counting it as another
+        sample.
+
+        :param model_name: The name of the model.
+        :param request_kwargs: The arguments of the completion request.
+        :param key: The key.
+        """
+        with self._lock:
+            self._reserved.setdefault(request_key(model_name, request_kwargs), []).append(key)
+
+    def get(self, key):
+        # The cached texts of a request, or None
+        connection = self._connection()
+        row = connection.execute("SELECT contents FROM responses WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, contents):
+        contents = json.dumps(contents)
+        self._connection().execute(
+            "INSERT OR REPLACE INTO responses (key, contents, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, contents, len(contents), time.time()),
+        )
+        with self._lock:
+            self._num_puts += 1
+            evict = self._num_puts % LLM_CACHE_EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        # Removes the least recently used responses until the cache is 90% of its maximum size
+        connection = self._connection()
+        size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if size <= self.max_size:
+            return
+        excess = size - int(self.max_size * 0.9)
+        connection.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY last_used) - size AS preceding FROM responses) "
+            "WHERE preceding < ?)",
+            (excess,),
+        )
+
+    def stats(self):
+        # The hit rate of this process and the size of the cache
+        entries, size = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "entries": entries,
+            "size_mb": round(size / 1024 / 1024, 1),
+        }
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def cached_request(model_name, request_kwargs, send):
+    """
+    Sends a request, unless the cache has its response.
+
+    :param model_name: The name of the model.
+    :param request_kwargs: The arguments of the completion request.
+    :param send: A function sending the request and returning the response.
+    :return: The response, or a stand-in with its texts if it was cached.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return send()
+
+    key = cache.next_key(model_name, request_kwargs)
+    contents = cache.get(key)
+    if contents is not None:
+        return response_from_contents(contents)
+
+    response = send()
+    # Responses standing in for a failed request are not worth keeping
+    if not getattr(response, "error", False):
+        cache.put(key, response_contents(response))
+    return response
+
+
+_RESPONSE_CACHE = None
+_RESPONSE_CACHE_PID = None
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache():
+    # The connections of a parent process must not be used after a fork
+    global _RESPONSE_CACHE, _RESPONSE_CACHE_PID
+    if not LLM_CACHE:
+        return None
+    with _RESPONSE_CACHE_LOCK:
+        if _RESPONSE_CACHE is None or _RESPONSE_CACHE_PID != os.getpid():
+            _RESPONSE_CACHE = ResponseCache()
+            _RESPONSE_CACHE_PID = os.getpid()
+            atexit.register(_RESPONSE_CACHE.close)
+        return _RESPONSE_CACHE
@@ -0,0 +1,431 @@
+import os
+import sys
+import time
+import atexit
+import signal
+import resource
+import importlib
+import subprocess
+import threading
+import warnings
+from io import BytesIO
+from multiprocessing import get_context
+
+from .workspace import remove_workspace
+
+# The longest time (in seconds) the generated code of a single row may run
+SANDBOX_TIMEOUT = 20
+# The most memory (in bytes) a sandbox worker may allocate (RLIMIT_DATA, so Chromium's address space reservations don't count)
+SANDBOX_MEMORY_LIMIT = int(os.environ.get("SANDBOX_MEMORY_LIMIT", 4 * 1024 ** 3))
+# Replace a sandbox worker with a fresh one after it ran this many jobs (leaked figures, fonts, file handles, ...)
+SANDBOX_MAX_JOBS = int(os.environ.get("SANDBOX_MAX_JOBS", 50))
+# Pre-import the plotting libraries and warm them up before the workers take their first job (set to 0 to disable)
+SANDBOX_WARM = os.environ.get("SANDBOX_WARM", "1") == "1"
+# The longest time (in seconds) a worker may take to warm up (starting kaleido's Chromium is the slow part)
+SANDBOX_WARMUP_TIMEOUT = 60
+
+# Imported once in the process that forks the workers, so every worker starts with them already loaded
+PRELOAD_MODULES = [
+    "numpy",
+    "pandas",
+    "scipy",
+    "matplotlib",
+    "matplotlib.pyplot",
+    "seaborn",
+    "plotly.express",
+    "plotly.graph_objects",
+    "plotly.io",
+    "graphviz",
+    "schemdraw",
+    "networkx",
+    "squarify",
+    "docx",
+    "PIL.Image",
+]
+
+# The names generated code could use without importing them when it was executed in the module of its pipeline
+NAMESPACE_PRELUDE = [
+    "import os",
+    "import tempfile",
+    "import platform",
+    "import subprocess",
+    "import json",
+    "import random",
+    "import warnings",
+    "import signal",
+    "import pandas as pd",
+    "from io import StringIO",
+    "from PIL import Image",
+]
+
+# The workers are forked by multiprocessing's fork server, a fresh single-threaded process: forking this process
+# (which runs the browser's event loop, the pipelines, ...) could copy a lock held by another thread into a worker
+_CONTEXT = get_context("forkserver")
+
+
+class SandboxError(RuntimeError):
+    pass
+
+
+class SandboxTimeout(SandboxError):
+    pass
+
+
+def preload_modules(modules=PRELOAD_MODULES):
+    """
+    Imports the given modules in the current process, skipping the ones that are not installed.
+
+    :param modules: The names of the modules to import.
+    """
+    if "matplotlib" in modules:
+        try:
+            # Pick the non-interactive backend before anything imports pyplot
+            importlib.import_module("matplotlib").use("Agg")
+        except ImportError:
+            pass
+    for module in modules:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                importlib.import_module(module)
+        except Exception:
+            pass
+
+
+def warm_up_worker():
+    # Runs once in every worker after the fork, pays the first-use costs that can't be inherited from the parent
+    if "matplotlib.pyplot" in sys.modules:
+        import matplotlib
+        import matplotlib.pyplot as plt
+        try:
+            # Loads the font cache and the Agg renderer
+            fig, ax = plt.subplots(figsize=(1, 1))
+            ax.plot([0, 1], [0, 1])
+            ax.set_title("warm up")
+            fig.savefig(BytesIO(), format="png")
+            plt.close("all")
+        except Exception:
+            pass
+
+    if "plotly.io" in sys.modules:
+        import plotly.io as pio
+        import plotly.graph_objects as go
+        try:
+            # Starts kaleido's Chromium, which then stays up for all the exports of this worker
+            go.Figure(go.Scatter(x=[0, 1], y=[0, 1])).to_image(format="png", width=50, height=50)
+        except Exception:
+            pass
+
+
+def _snapshot_global_state():
+    # The library settings generated code tends to change (styles, themes, templates)
+    state = {}
+    if "matplotlib" in sys.modules:
+        state["rcParams"] = dict(sys.modules["matplotlib"].rcParams)
+    if "plotly.io" in sys.modules:
+        state["template"] = sys.modules["plotly.io"].templates.default
+    return state
+
+
+def _reset_global_state(state):
+    # Undo what the previous job did to the shared library state, so it doesn't leak into the next row
+    if "matplotlib.pyplot" in sys.modules:
+        sys.modules["matplotlib.pyplot"].close("all")
+    if "rcParams" in state:
+        sys.modules["matplotlib"].rcParams.update(state["rcParams"])
+    if "template" in state:
+        sys.modules["plotly.io"].templates.default = state["template"]
+
+
+def _base_namespace():
+    # The namespace every job starts from, skipping the imports that are not installed
+    namespace = {"__name__": "__sandbox__", "__builtins__": __builtins__}
+    for statement in NAMESPACE_PRELUDE:
+        try:
+            exec(statement, namespace)
+        except ImportError:
+            pass
+    return namespace
+
+
+def _worker_main(connection, memory_limit, preload, initializer):
+    # Put the worker (and everything the generated code starts, e.g. kaleido or dot) in its own process group
+    os.setsid()
+    if memory_limit is not None:
+        resource.setrlimit(resource.RLIMIT_DATA, (memory_limit, memory_limit))
+    warnings.simplefilter("ignore")
+
+    # The fork server already imported them, this only sets up what importing doesn't (e.g. the Agg backend)
+    if preload:
+        preload_modules(preload)
+    if initializer is not None:
+        try:
+            initializer()
+        except Exception:
+            pass
+    state = _snapshot_global_state()
+    base_namespace = _base_namespace()
+    connection.send("ready")
+
+    while True:
+        try:
+            job = connection.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+
+        code, function, args, cwd = job
+        try:
+            os.chdir(cwd)
+            # Every job gets its own namespace, nothing leaks from one row's code to the next
+            namespace = dict(base_namespace)
+            exec(code, namespace)
+            result = (True, function(namespace, *args))
+        except BaseException as e:
+            result = (False, f"{type(e).__name__}: {e}")
+        finally:
+            try:
+                _reset_global_state(state)
+            except Exception:
+                pass
+
+        try:
+            connection.send(result)
+        except Exception as e:
+            connection.send((False, f"The result could not be sent back: {e}"))
+
+
+class SandboxWorker:
+    """
+    A process forked by the fork server that runs generated code, one job at a time.
+
+    :param memory_limit: The most memory (in bytes) the process may allocate, or None for no limit.
+    :param preload: The modules the fork server imported for the workers, or None.
+    :param initializer: A function called once in the process before its first job, or None.
+    """
+
+    def __init__(self, memory_limit=SANDBOX_MEMORY_LIMIT, preload=None, initializer=None):
+        parent_connection, child_connection = _CONTEXT.Pipe()
+        self.process = _CONTEXT.Process(
+            target=_worker_main, args=(child_connection, memory_limit, preload, initializer), name="sandbox"
+        )
+        self.process.start()
+        child_connection.close()
+        self.pid = self.process.pid
+        self.connection = parent_connection
+        self.num_jobs = 0
+        self.ready = False
+
+    def wait_until_ready(self, timeout=SANDBOX_WARMUP_TIMEOUT):
+        # The warm up doesn't count towards the timeout of the first job
+        if self.ready:
+            return
+        try:
+            ready = self.connection.poll(timeout) and self.connection.recv() == "ready"
+        except (EOFError, OSError):
+            ready = False
+        if not ready:
+            self.kill()
+            raise SandboxError("The sandbox worker failed to start.")
+        self.ready = True
+
+    def run(self, code, function, args, timeout, cwd):
+        self.wait_until_ready()
+        self.num_jobs += 1
+        self.connection.send((code, function, args, cwd))
+
+        if not self.connection.poll(timeout):
+            self.kill()
+            raise SandboxTimeout(f"Code execution exceeded {timeout} seconds.")
+        try:
+            success, result = self.connection.recv()
+        except (EOFError, OSError):
+            self.kill()
+            raise SandboxError("The sandbox worker died while running the code (e.g. it ran out of memory).")
+
+        if not success:
+            raise SandboxError(result)
+        return result
+
+    def is_alive(self):
+        return self.pid is not None
+
+    def kill(self):
+        if self.pid is None:
+            return
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            # The worker may not have created its process group yet
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.process.join()
+        remove_workspace(self.pid)
+        self.connection.close()
+        self.pid = None
+
+    def close(self):
+        if self.pid is None:
+            return
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.kill()
+
+
+class SandboxPool:
+    """
+    A pool of pre-forked worker processes that run generated code in isolated namespaces, with a
+    wall-clock timeout and a memory limit. Runaway workers are killed, and workers are recycled
+    after `max_jobs` jobs.
+
+    :param num_workers: The number of workers to pre-fork.
+    :param max_jobs: The number of jobs after which a worker is replaced.
+    :param memory_limit: The most memory (in bytes) a worker may allocate, or None for no limit.
+    :param preload: The modules the fork server imports before forking the workers, so they are shared by all of them.
+    :param initializer: A function called once in every worker before its first job (e.g. `warm_up_worker`).
+    """
+
+    def __init__(self, num_workers=1, max_jobs=SANDBOX_MAX_JOBS, memory_limit=SANDBOX_MEMORY_LIMIT, preload=None, initializer=None):
+        self.num_workers = num_workers
+        self.max_jobs = max_jobs
+        self.memory_limit = memory_limit
+        self.preload = preload
+        self.initializer = initializer
+        # The workers run `_worker_main` of this module (which imports the pipelines), the fork server imports it once
+        # for all of them. Only takes effect before the fork server starts, i.e. before the first pool's workers
+        _CONTEXT.set_forkserver_preload(list(preload or []) + [__name__])
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._idle_workers = [self._spawn() for _ in range(num_workers)]
+
+    def _spawn(self):
+        # Forking is cheap, the worker warms up in the background until it is handed its first job
+        return SandboxWorker(memory_limit=self.memory_limit, preload=self.preload, initializer=self.initializer)
+
+    def _acquire(self):
+        with self._lock:
+            # Workers inherited from a parent process (e.g. after a fork) belong to the parent
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._idle_workers = []
+            if self._idle_workers:
+                return self._idle_workers.pop()
+        return self._spawn()
+
+    def _release(self, worker):
+        if not worker.is_alive():
+            worker = self._spawn()
+        elif worker.num_jobs >= self.max_jobs:
+            # Recycle now, so the next job gets a fresh worker without waiting for the fork
+            worker.close()
+            worker = self._spawn()
+        with self._lock:
+            if len(self._idle_workers) < self.num_workers:
+                self._idle_workers.append(worker)
+                return
+        worker.close()
+
+    def run(self, code, function, *args, timeout=SANDBOX_TIMEOUT, cwd=None):
+        """
+        Runs generated code in a worker.
+
+        :param code: The generated code, executed in a fresh namespace.
+        :param function: A module-level function called as `function(namespace, *args)` in the worker after the
+            code ran, its return value (which must be picklable) is returned.
+        :param args: The arguments passed to `function`.
+        :param timeout: The longest time (in seconds) the code and `function` may run.
+        :param cwd: The working directory of the code (e.g. a scratch directory for the files it writes), by default
+            the one of this process. Only the worker changes directory, so this is safe to call from any thread.
+        :return: The return value of `function`.
+        """
+        worker = self._acquire()
+        try:
+            return worker.run(code, function, args, timeout, cwd or os.getcwd())
+        finally:
+            self._release(worker)
+
+    def close(self):
+        with self._lock:
+            workers, self._idle_workers = self._idle_workers, []
+        if self._pid == os.getpid():
+            for worker in workers:
+                worker.close()
+
+
+_SANDBOX_POOL = None
+
+
+def get_sandbox_pool():
+    global _SANDBOX_POOL
+    if _SANDBOX_POOL is None:
+        if SANDBOX_WARM:
+            _SANDBOX_POOL = SandboxPool(preload=PRELOAD_MODULES, initializer=warm_up_worker)
+        else:
+            _SANDBOX_POOL = SandboxPool()
+        atexit.register(_SANDBOX_POOL.close)
+    return _SANDBOX_POOL
+
+
+BENCHMARK_CODE = """
+import pandas as pd
+import matplotlib.pyplot as plt
+import seaborn as sns
+from io import BytesIO
+from PIL import Image
+
+def generate_plot(df):
+    sns.set_theme(style="whitegrid")
+    fig, ax = plt.subplots(figsize=(6, 4))
+    sns.barplot(data=df, x="label", y="value", ax=ax)
+    ax.set_title("Benchmark")
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    buffer.seek(0)
+    return Image.open(buffer).convert("RGB")
+
+def benchmark_data():
+    return pd.DataFrame({"label": list("abcde"), "value": [3, 1, 4, 1, 5]})
+"""
+
+
+def _benchmark_plot(namespace):
+    return namespace["generate_plot"](namespace["benchmark_data"]()).size
+
+
+def _benchmark_cold_row():
+    # A row without a pool: a fresh interpreter (not a fork of this one, which imported the pipelines and
+    # with them the plotting libraries) runs the code and pays for every import and first use itself
+    code = BENCHMARK_CODE + "\ngenerate_plot(benchmark_data())\n"
+    subprocess.run([sys.executable, "-c", code], check=True, env={**os.environ, "MPLBACKEND": "Agg"})
+
+
+if __name__ == "__main__":
+    # Compares cold rows (every row starts in a fresh interpreter and imports everything itself) with a warm
+    # pool (imports and first-use setup done once in the fork server and the workers, before their first job)
+    # Run with `python -m pipeline.utils.sandbox`
+    num_rows = 20
+    start = time.perf_counter()
+    pool = SandboxPool(preload=PRELOAD_MODULES, initializer=warm_up_worker)
+    pool._idle_workers[0].wait_until_ready()
+    warm_startup = time.perf_counter() - start
+
+    for name, run_row, startup in [
+        ("cold", _benchmark_cold_row, 0.0),
+        ("warm", lambda: pool.run(BENCHMARK_CODE, _benchmark_plot, timeout=60), warm_startup),
+    ]:
+        timings = []
+        for _ in range(num_rows):
+            start = time.perf_counter()
+            run_row()
+            timings.append(time.perf_counter() - start)
+
+        print(
+            f"{name}: startup {startup:.2f}s, first row {timings[0] * 1000:.0f}ms, "
+            f"mean row {sum(timings) / len(timings) * 1000:.0f}ms, median row {sorted(timings)[len(timings) // 2] * 1000:.0f}ms"
+        )
+    pool.close()
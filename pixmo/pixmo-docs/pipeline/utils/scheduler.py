@@ -0,0 +1,186 @@
+import os
+import heapq
+import itertools
+import threading
+import contextvars
+from dataclasses import dataclass
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+from datadreamer.utils.background_utils import get_thread_id
+
+from .streaming import run_in_step_thread
+
+# The number of pipelines running at the same time (1 runs them one after the other, as without the scheduler)
+PIPELINE_CONCURRENCY = int(os.environ.get("PIPELINE_CONCURRENCY", 1))
+# The number of requests in flight to the same model, across all pipelines (keep the API under its rate limit)
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", 64))
+# The number of render worker processes running at the same time, across all pipelines
+RENDER_SLOTS = int(os.environ.get("RENDER_SLOTS", os.cpu_count() or 1))
+
+# The pipeline a thread works for (copied into the threads of its shards, see `streaming.py`)
+_CURRENT_JOB = contextvars.ContextVar("pipeline_job", default=None)
+
+
+class Budget:
+    """
+    A number of units (e.g. requests in flight, worker processes) shared by threads, which acquire one or
+    more of them at a time. Waiting threads are served by priority, then first come first served, and a
+    waiting thread is never overtaken by a lower priority one (so large requests don't starve).
+
+    :param capacity: The number of units.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = max(1, capacity)
+        self.available = self.capacity
+        self._waiting = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def acquire(self, units=1, priority=0):
+        units = min(units, self.capacity)
+        entry = (-priority, next(self._order), units)
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            self._condition.wait_for(lambda: self._waiting[0] is entry and self.available >= units)
+            heapq.heappop(self._waiting)
+            self.available -= units
+            # The next waiting thread may fit in what's left
+            self._condition.notify_all()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.available += units
+                self._condition.notify_all()
+
+
+@dataclass
+class PipelineJob:
+    """
+    A pipeline to run with the scheduler.
+
+    :param name: The name of the pipeline.
+    :param run: A function running the pipeline and returning its result.
+    :param priority: Pipelines with a higher priority start first, and go first for API requests and render workers.
+    :param quota: The most API requests the pipeline may have in flight (None for no limit besides `LLM_CONCURRENCY`).
+    """
+
+    name: str
+    run: object
+    priority: int = 0
+    quota: None | int = None
+
+
+class Scheduler:
+    """
+    Runs pipelines at the same time, sharing one budget of API requests per model and one budget of render
+    worker processes between all of them, so a run is bound by the throughput of the APIs rather than by
+    running the pipelines one after another.
+
+    The LLMs must call `llm_slot()` around every API request (see `CustomAnthropic` and `CustomOpenAI`) and
+    the render steps `render_slots()` around their `.map()`.
+
+    :param max_concurrent_pipelines: The number of pipelines running at the same time.
+    :param llm_concurrency: The number of requests in flight to the same model, across all pipelines.
+    :param render_slots: The number of render worker processes running at the same time, across all pipelines.
+    """
+
+    def __init__(self, max_concurrent_pipelines=PIPELINE_CONCURRENCY, llm_concurrency=LLM_CONCURRENCY, render_slots=RENDER_SLOTS):
+        self.max_concurrent_pipelines = max_concurrent_pipelines
+        self.llm_concurrency = llm_concurrency
+        self.render_budget = Budget(render_slots)
+        self._llm_budgets = {}
+        self._quotas = {}
+        self._lock = threading.Lock()
+
+    def _llm_budget(self, model_name):
+        with self._lock:
+            if model_name not in self._llm_budgets:
+                self._llm_budgets[model_name] = Budget(self.llm_concurrency)
+            return self._llm_budgets[model_name]
+
+    @contextmanager
+    def llm_slot(self, llm):
+        """
+        Holds a request slot of the model of `llm` (and of the quota of its pipeline) while a request is made.
+        Acquire it for every attempt, never around the retries, so backing off doesn't hold a slot.
+
+        :param llm: The LLM making the request, its `pipeline_name` and `priority` attributes (if any) tell
+            which pipeline it belongs to.
+        """
+        priority = getattr(llm, "priority", 0)
+        quota = self._quotas.get(getattr(llm, "pipeline_name", None))
+        with quota.acquire(priority=priority) if quota is not None else nullcontext():
+            with self._llm_budget(llm.model_name).acquire(priority=priority):
+                yield
+
+    @contextmanager
+    def render_slots(self, num_workers):
+        """
+        Holds `num_workers` render worker slots while the rows of a step are rendered.
+
+        :param num_workers: The number of worker processes the render step starts.
+        """
+        job = _CURRENT_JOB.get()
+        with self.render_budget.acquire(num_workers, priority=job.priority if job is not None else 0):
+            yield
+
+    def _run_job(self, job):
+        token = _CURRENT_JOB.set(job)
+        try:
+            return job.run()
+        finally:
+            _CURRENT_JOB.reset(token)
+
+    def run(self, jobs, max_concurrent_pipelines=None):
+        """
+        Runs pipelines, at most `max_concurrent_pipelines` at a time, starting them by priority.
+
+        :param jobs: A list of `PipelineJob`.
+        :param max_concurrent_pipelines: Overrides the number of pipelines running at the same time.
+        :return: The results of the jobs, in the order of `jobs`.
+        """
+        max_concurrent_pipelines = max_concurrent_pipelines or self.max_concurrent_pipelines
+        for job in jobs:
+            if job.quota is not None:
+                self._quotas[job.name] = Budget(job.quota)
+
+        # The executor starts the jobs in the order they were submitted
+        by_priority = sorted(range(len(jobs)), key=lambda index: -jobs[index].priority)
+        if len(jobs) <= 1 or max_concurrent_pipelines <= 1:
+            # One at a time, the pipelines run in this thread as they did without the scheduler
+            results = {index: self._run_job(jobs[index]) for index in by_priority}
+            return [results[index] for index in range(len(jobs))]
+
+        parent_thread_id = get_thread_id()
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrent_pipelines), thread_name_prefix="pipeline") as executor:
+            futures = {
+                index: executor.submit(
+                    contextvars.copy_context().run, run_in_step_thread, parent_thread_id, self._run_job, jobs[index]
+                )
+                for index in by_priority
+            }
+            return [futures[index].result() for index in range(len(jobs))]
+
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_scheduler():
+    # One scheduler per process, the LLMs and render steps of every pipeline share its budgets
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = Scheduler()
+        return _SCHEDULER
+
+
+@contextmanager
+def render_slots(num_workers):
+    # Holds render worker slots of the scheduler while the rows of a step are rendered
+    with get_scheduler().render_slots(num_workers):
+        yield
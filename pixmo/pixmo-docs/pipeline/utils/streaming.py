@@ -0,0 +1,123 @@
+import os
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from datadreamer import DataDreamer
+from datadreamer.steps import concat
+from datadreamer.utils.background_utils import get_thread_id
+
+from .browser import close_thread_browser
+
+# Split the rows of a pipeline into this many shards after its first stage, so the later stages of one shard
+# (e.g. rendering, Q&A) overlap with the LLM calls of the next ones (1 runs every stage on all rows at once)
+STREAM_NUM_SHARDS = int(os.environ.get("STREAM_NUM_SHARDS", 1))
+# The most shards going through the stages at the same time
+STREAM_MAX_IN_FLIGHT = int(os.environ.get("STREAM_MAX_IN_FLIGHT", 4))
+
+
+def run_in_step_thread(parent_thread_id, func, *args):
+    # Like DataDreamer's `concurrent()`, but every thread gets its own copy of the step stack, so the
+    # SuperSteps running at the same time (e.g. of different shards) don't nest into each other
+    DataDreamer._register_child_thread(parent_thread_id)
+    DataDreamer.ctx.step_stack[get_thread_id()] = list(DataDreamer.ctx.step_stack[parent_thread_id])
+    try:
+        return func(*args)
+    finally:
+        # The maps that ran in this thread (instead of forked workers) started its own browser
+        close_thread_browser()
+
+
+def run_streaming(source, run_stages, name, num_shards=STREAM_NUM_SHARDS, max_in_flight=STREAM_MAX_IN_FLIGHT):
+    """
+    Runs the stages of a pipeline after `source`, shard by shard, with up to `max_in_flight` shards in
+    the stages at the same time. Rows reach the renderers (and the Q&A stage) as soon as the code of
+    their shard is generated, instead of after the code of every row is, and the wall-clock time gets
+    close to the one of the slowest stage instead of the sum of all of them.
+
+    With a single shard the stages run on `source` directly, under their usual names (so the cached
+    results of earlier runs are reused).
+
+    The stages of every shard run in a thread of this process, and so do their maps when they end up
+    with a single process (e.g. for shards of one row): the map functions must not use signals or
+    change the working directory. `python -m pipeline.utils.streaming` checks the renderers for that.
+
+    :param source: The step with the rows to run through the stages (e.g. the generated topics).
+    :param run_stages: A function `run_stages(step, suffix)` that runs the stages on the rows of `step` and
+        returns the last step. `suffix` must be appended to the names of the steps it creates.
+    :param name: The name of the step combining the shards.
+    :param num_shards: The number of shards.
+    :param max_in_flight: The most shards in the stages at the same time.
+    :return: The last step, with the rows of all shards.
+    """
+    num_shards = min(num_shards, source.output.num_rows)
+    if num_shards <= 1:
+        return run_stages(source, "")
+
+    shards = [
+        source.shard(num_shards, index, contiguous=True, name=f"Shard {index + 1} of {num_shards}")
+        for index in range(num_shards)
+    ]
+
+    parent_thread_id = get_thread_id()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        futures = [
+            # The shards run on behalf of the same pipeline (see `scheduler.py`), so they keep its context
+            executor.submit(
+                contextvars.copy_context().run,
+                run_in_step_thread, parent_thread_id, run_stages, shard, f" (Shard {index + 1} of {num_shards})",
+            )
+            for index, shard in enumerate(shards)
+        ]
+        results = [future.result() for future in futures]
+
+    return concat(*results, name=name, lazy=False)
+
+
+if __name__ == "__main__":
+    # Runs a render of each kind (LaTeX, sandboxed code, HTML) through shards of one row, so every map runs
+    # in a shard thread instead of forked workers. Run with `python -m pipeline.utils.streaming`
+    import tempfile
+    import threading
+    from operator import itemgetter
+    from datadreamer.steps import DataSource
+
+    from .render import render_latex, render_html
+    from .sandbox import get_sandbox_pool
+    from .workspace import get_workspace
+
+    num_rows = 4
+    cwd = os.getcwd()
+    sandbox_code = "open('row.txt', 'w').close()\npath = os.path.realpath('row.txt')\n"
+
+    def render_row(row):
+        errors = []
+        try:
+            render_latex(r"\documentclass{article}\begin{document}Row " + str(row["index"]) + r"\end{document}", timeout=20)
+        except Exception as e:
+            errors.append(f"LaTeX: {e!r}")
+        try:
+            directory = get_workspace().directory("row")
+            path = get_sandbox_pool().run(sandbox_code, itemgetter("path"), cwd=directory)
+            if os.path.dirname(path) != os.path.realpath(directory): errors.append(f"Sandbox: wrote {path} outside of {directory}")
+        except Exception as e:
+            errors.append(f"Sandbox: {e!r}")
+        try:
+            render_html(f"<html><body><p>Row {row['index']}</p></body></html>")
+        except Exception as e:
+            errors.append(f"HTML: {e!r}")
+        return {"index": row["index"], "in_main_thread": threading.current_thread() is threading.main_thread(), "errors": errors}
+
+    def run_stages(rows, suffix):
+        return rows.map(render_row, lazy=False, save_num_proc=4, name=f"Render{suffix}")
+
+    with tempfile.TemporaryDirectory() as output_folder, DataDreamer(output_folder):
+        source = DataSource("Rows", {"index": list(range(num_rows))})
+        result = run_streaming(source, run_stages, name="Combine Shards", num_shards=num_rows, max_in_flight=num_rows)
+        rows = list(result.output)
+
+    assert len(rows) == num_rows, f"Expected {num_rows} rows, got {len(rows)}"
+    assert not any(row["in_main_thread"] for row in rows), "The maps of the shards ran in the main thread"
+    assert os.getcwd() == cwd, f"The working directory changed to {os.getcwd()}"
+    errors = [f"Row {row['index']}: {error}" for row in rows for error in row["errors"]]
+    assert not errors, "\n".join(errors)
+    print(f"OK: {num_rows} shards of one row rendered in shard threads")
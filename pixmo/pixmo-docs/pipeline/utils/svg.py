@@ -0,0 +1,89 @@
+import os
+import atexit
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# The number of SVGs a worker process rasterizes concurrently (cairo releases the GIL while it draws)
+SVG_THREADS = int(os.environ.get("SVG_THREADS", min(8, os.cpu_count() or 1)))
+# The largest SVG (in bytes) to rasterize, bigger ones are almost always embedded bitmaps or runaway generations
+SVG_MAX_SIZE = int(os.environ.get("SVG_MAX_SIZE", 2 * 1024 ** 2))
+# The longest time (in seconds) a single SVG may take to rasterize
+SVG_TIMEOUT = 20
+
+
+class SVGError(RuntimeError):
+    pass
+
+
+@lru_cache(maxsize=None)
+def get_cairosvg():
+    # Imported once per process (and only by the pipelines that need it, it requires the cairo library)
+    import cairosvg
+    return cairosvg
+
+
+def rasterize_svg(svg_string, dpi):
+    """
+    Rasterizes an SVG to PNG.
+
+    :param svg_string: The SVG source.
+    :param dpi: The resolution to rasterize at.
+    :return: The PNG bytes.
+    """
+    svg_bytes = svg_string.encode("utf-8") if isinstance(svg_string, str) else svg_string
+    if len(svg_bytes) > SVG_MAX_SIZE:
+        raise SVGError(f"The SVG is too large ({len(svg_bytes)} bytes, the limit is {SVG_MAX_SIZE}).")
+    return get_cairosvg().svg2png(bytestring=svg_bytes, dpi=dpi)
+
+
+class SVGRenderer:
+    """
+    Rasterizes batches of SVGs concurrently on a thread pool.
+
+    :param num_threads: The number of SVGs rasterized at the same time.
+    """
+
+    def __init__(self, num_threads=SVG_THREADS):
+        self.num_threads = num_threads
+        self.executor = ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix="svg")
+        get_cairosvg()
+
+    def render_batch(self, svgs, timeout=SVG_TIMEOUT):
+        """
+        Rasterizes a batch of SVGs.
+
+        :param svgs: A list of `(svg_string, dpi)` tuples.
+        :param timeout: The longest time (in seconds) to wait for a single SVG.
+        :return: A list with the PNG bytes of each SVG, or the exception raised while rasterizing it.
+        """
+        futures = [self.executor.submit(rasterize_svg, svg_string, dpi) for svg_string, dpi in svgs]
+        # Every SVG gets `timeout` seconds of the thread pool on average
+        wait(futures, timeout=timeout * max(1, len(futures) / self.num_threads))
+
+        results = []
+        for future in futures:
+            if not future.done():
+                future.cancel()
+                results.append(SVGError(f"Rasterizing exceeded {timeout} seconds."))
+            elif future.exception() is not None:
+                results.append(future.exception())
+            else:
+                results.append(future.result())
+        return results
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_SVG_RENDERER = None
+_SVG_RENDERER_PID = None
+
+
+def get_svg_renderer():
+    # The thread pool of a parent process does not exist after a fork
+    global _SVG_RENDERER, _SVG_RENDERER_PID
+    if _SVG_RENDERER is None or _SVG_RENDERER_PID != os.getpid():
+        _SVG_RENDERER = SVGRenderer()
+        _SVG_RENDERER_PID = os.getpid()
+        atexit.register(_SVG_RENDERER.close)
+    return _SVG_RENDERER
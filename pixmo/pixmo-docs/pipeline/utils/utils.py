@@ -4,6 +4,7 @@ import copy
 import random
 import numpy as np
 import pandas as pd
+from scipy import ndimage
 from PIL import Image, ImageColor, ImageDraw
 from io import StringIO
 import matplotlib.pyplot as plt
@@ -229,7 +230,7 @@ def extract_SMILES(input_string):
             return None
 
 
-from rdkit import Chem
+from .chemistry import get_molecule
 def is_SMILE_valid(smiles):
     """
     Check if the given SMILES representation is valid.
@@ -240,8 +241,9 @@ def is_SMILE_valid(smiles):
     Returns:
     bool: True if the SMILES is valid, False otherwise.
     """
+    # The parsed molecule is cached, so rendering the SMILES later doesn't parse it again
     try:
-        mol = Chem.MolFromSmiles(smiles)
+        mol = get_molecule(smiles)
         return mol is not None
     except:
         return False
@@ -364,28 +366,43 @@ def extract_point_html(input_string):
     return point_examples
 
 
+def pack_rgb(image):
+    # pack the pixels of the image into one uint32 per pixel (0xRRGGBB), so colors can be compared with a single vectorized op
+    if image.mode != "RGB": image = image.convert("RGB")
+    image_array = np.asarray(image, dtype=np.uint32)
+    return (image_array[..., 0] << 16) | (image_array[..., 1] << 8) | image_array[..., 2]
+
+
+def pack_color(color):
+    # pack a hex color code or an RGB tuple the same way as `pack_rgb`
+    r, g, b = ImageColor.getcolor(color, "RGB") if isinstance(color, str) else color
+    return (r << 16) | (g << 8) | b
+
+
 def compute_white_px_ratio(image):
     # Compute the ratio of white pixels in the image
-    white_px = 0
-    total_px = 0
-    for px in image.getdata():
-        if px == (255, 255, 255):
-            white_px += 1
-        total_px += 1
-    return white_px / total_px
+    packed_image = pack_rgb(image)
+    return np.count_nonzero(packed_image == 0xFFFFFF) / packed_image.size
 
 
-def compute_major_px_ratio(image):
+def compute_major_px_ratio(image, sample_step=4):
     # Compute the ratio of the most common pixel in the image
-    px_count = {}
-    for px in image.getdata():
-        if px in px_count:
-            px_count[px] += 1
-        else:
-            px_count[px] = 1
-    
-    max_px = max(px_count, key=px_count.get)
-    return px_count[max_px] / len(image.getdata())
+    packed_image = pack_rgb(image)
+
+    # Find the most common pixel on a uniform random sample (1 / sample_step^2 of the pixels, drawn with replacement, so a
+    # fixed stride can't line up with grid lines or dithering), then count it exactly on the full image. The result is exact
+    # whenever the sample has the same most common pixel as the image. With p the share of that pixel and q the share of the
+    # runner-up, the sample picks another pixel with probability below exp(-n (p - q)^2 / 2) over n sampled pixels (Hoeffding),
+    # i.e. never in practice when p is near the 0.95+ thresholds we filter on. Use sample_step=1 for an exact mode.
+    if sample_step > 1:
+        # A fixed seed keeps the sample (and the result) the same for the same image
+        pixels = packed_image.ravel()
+        sample = pixels[np.random.default_rng(0).integers(0, pixels.size, max(1, pixels.size // sample_step ** 2))]
+    else:
+        sample = packed_image
+    colors, counts = np.unique(sample, return_counts=True)
+    major_px = colors[np.argmax(counts)]
+    return np.count_nonzero(packed_image == major_px) / packed_image.size
 
 
 def process_image(image, max_size=(2560, 1440), major_px_threshold=0.95, aspect_ratio_threshold=5, filter_small=True):
@@ -393,7 +410,7 @@ def process_image(image, max_size=(2560, 1440), major_px_threshold=0.95, aspect_
     if image.size[0] * image.size[1] > max_size[0] * max_size[1]:
         image.thumbnail(max_size, Image.Resampling.LANCZOS)
     
-    # Convert alpha channel to white background
+    # Convert alpha channel to white background (convert always returns a new image, detached from the input)
     if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
         alpha = image.convert('RGBA').split()[-1]
         bg = Image.new("RGBA", image.size, (255, 255, 255, 255))
@@ -401,11 +418,8 @@ def process_image(image, max_size=(2560, 1440), major_px_threshold=0.95, aspect_
         image = bg.convert("RGB")
     else:
         image = image.convert("RGB")
-    
-    major_px_ratio = compute_major_px_ratio(image)
-    if major_px_ratio > major_px_threshold: print("Warning: Image is monochromatic.", major_px_ratio); return None
 
-    byte_array = image.tobytes()
+    # Check the cheap properties first, before looking at the pixels
     width, height = image.size
 
     aspect_ratio = max(width, height) / min(width, height)
@@ -413,9 +427,10 @@ def process_image(image, max_size=(2560, 1440), major_px_threshold=0.95, aspect_
 
     if min(width, height) < 128 and filter_small: print("Warning: Image is too small."); return None
 
-    image_from_byte_array = Image.frombytes("RGB", (width, height), byte_array)
+    major_px_ratio = compute_major_px_ratio(image)
+    if major_px_ratio > major_px_threshold: print("Warning: Image is monochromatic.", major_px_ratio); return None
     
-    return image_from_byte_array
+    return image
 
 
 def fix_latex_white_text(code):
@@ -454,81 +469,143 @@ def fix_latex_white_text(code):
     return code, fix
 
 
-def extract_points(image, point_color="#FF69B4"):
+# The fewest pixels a point can have, smaller components of the point color are anti-aliasing or stray pixels
+# (a point is a 10x10 square, rendered at twice the scale)
+POINT_MIN_PIXELS = 16
+
+
+def extract_points(image, point_color="#FF69B4", max_points=None):
     # Bug with numpy causes process to freeze when using multiple threads for parallel processing due to buggy OpenBLAS implementation installed
     # https://github.com/numpy/numpy/issues/17752#issuecomment-1359079118
     with threadpool_limits(limits=1, user_api='blas'): 
-        # input is a image with some points with the color of point_color
-        # output is a list of (x, y) coordinates of the points
-        # the idea is to do some clustering that pixels with the color of point_color that are connected will be considered as one point
+        # input is a image with some points with the color of point_color (or a list of colors to extract in one pass)
+        # output is a list of (y, x) coordinates of the points, and the same points normalized to (x, y) in [0, 100]
+        # the pixels with the color of point_color that are connected (4-connectivity) will be considered as one point
+        # max_points is the number of points inserted with each color (an int, or a list with one per color): more
+        # points than that means other elements of the page have the color too, and the color is rejected
+        packed_image = pack_rgb(image)
+        height, width = packed_image.shape
+
+        point_colors = [point_color] if isinstance(point_color, str) else point_color
+        if max_points is None or isinstance(max_points, int): max_points = [max_points] * len(point_colors)
+        results = []
+        for color, color_max_points in zip(point_colors, max_points):
+            # turn the image to a binary image and label its connected components
+            binary_image = packed_image == pack_color(color)
+            labels, num_components = ndimage.label(binary_image)
+
+            # keep the components that are large enough to be a point
+            sizes = ndimage.sum(binary_image, labels, range(1, num_components + 1)) if num_components > 0 else []
+            components = [label for label, size in zip(range(1, num_components + 1), sizes) if size >= POINT_MIN_PIXELS]
+
+            if len(components) == 0 or (color_max_points is not None and len(components) > color_max_points):
+                if len(components) == 0:
+                    message = f"Skip the current point because no point matches the point's color {color}."
+                else:
+                    message = f"Skip the current point because {len(components)} points match the point's color {color}, more than the {color_max_points} inserted."
+                if isinstance(point_color, str):
+                    raise RuntimeError(message)
+                print(f"Warning: {message}")
+                results.append(None)
+                continue
 
-        # convert the image to a numpy array
-        image = image.convert("RGB")
-        image_array = np.array(image)
-        width, height = image_array.shape[:2]
-
-        # turn the image to a binary image
-        binary_image = np.all(image_array == np.array(ImageColor.getcolor(point_color, "RGB")), axis=-1)
-
-        # get the coordinates of the points
-        points = np.argwhere(binary_image)
-
-        def check_connected(target_point, grounp_points):
-            # check if any point in the group is connected to the target point
-            for point in grounp_points:
-                if np.linalg.norm(target_point - point) == 1:
-                    return True
-
-        # group the points that are connected
-        points = list(map(tuple, points))
-        groups = [[points[0]]]
-        if len(points) > 1500:
-            print(f"Warning: Extracted {len(points)} pixels for the point color from the image. Too many random pixels match the point color {point_color} in {image}, so this point for this image will be skipped.")
-            raise RuntimeError("Skip the current point because too many random pixels match the point's color.")
-
-        for point in points[1:]:
-            connected = False
-            for group in groups:
-                if check_connected(np.array(point), np.array(group)):
-                    group.append(point)
-                    connected = True
-                    break
-            if not connected:
-                groups.append([point])
-        
-        # get the center of each group
-        centers = []
-        for group in groups:
-            group = np.array(group)
-            center = np.mean(group, axis=0)
-            centers.append(center.tolist())
-        
-        # normalized points will be (x,y) coordinates in the range of [0, 100], upper left corner is (0, 0)
-        normalized_centers = [{"x": round(center[1] / height * 100, 1), "y": round(center[0] / width * 100, 1)} for center in centers]
-        return centers, normalized_centers
+            # get the center of each connected component
+            centers = ndimage.center_of_mass(binary_image, labels, components)
+            centers = [[float(y), float(x)] for y, x in centers]
 
+            # normalized points will be (x,y) coordinates in the range of [0, 100], upper left corner is (0, 0)
+            normalized_centers = [{"x": round(center[1] / width * 100, 1), "y": round(center[0] / height * 100, 1)} for center in centers]
+            results.append((centers, normalized_centers))
 
-def get_a_different_color(image):
-    # Convert the image to RGB and then to a NumPy array
-    image = image.convert("RGB")
-    image_array = np.array(image)
+        # for a list of colors, return the points of each color (None for the colors that are not in the image)
+        return results[0] if isinstance(point_color, str) else results
 
-    # Get all unique colors in the image in hex format
-    unique_colors = set(
-        "#{:02x}{:02x}{:02x}".format(r, g, b)
-        for r, g, b in image_array.reshape(-1, 3)
-    )
 
-    # Load CSS4 colors from Matplotlib
-    available_colors = list(mcolors.CSS4_COLORS.values())
+class ColorIndex:
+    """
+    A bitmap over all 2^24 RGB colors that marks the colors used by an image (2 MB per image).
+
+    :param image: A PIL.Image object.
+    """
+
+    # Candidates for maximally distinct colors: a 9x9x9 lattice over the RGB cube
+    LATTICE = np.stack(np.meshgrid(*[np.linspace(0, 255, 9).astype(np.int64)] * 3, indexing="ij"), axis=-1).reshape(-1, 3)
+
+    def __init__(self, image):
+        occupied = np.zeros(1 << 24, dtype=bool)
+        occupied[pack_rgb(image).ravel()] = True
+        self.bitmap = np.packbits(occupied, bitorder="little")
+
+    def is_used(self, packed_colors):
+        # look up an array of packed colors in the bitmap
+        packed_colors = np.asarray(packed_colors, dtype=np.int64)
+        return ((self.bitmap[packed_colors >> 3] >> (packed_colors & 7)) & 1).astype(bool)
+
+    def __contains__(self, color):
+        return bool(self.is_used(pack_color(color)))
+
+    def nearest_unused(self, color):
+        """
+        Finds the unused color closest to the given color.
+
+        :param color: A hex color code or an RGB tuple.
+        :return: The hex color code of the closest (euclidean distance in RGB) unused color.
+        """
+        rgb = np.array(ImageColor.getcolor(color, "RGB") if isinstance(color, str) else color, dtype=np.int64)
+
+        # search the surfaces of growing cubes around the color, an image has at most a few million colors
+        # so a free one is almost always found within the first few cubes
+        for radius in range(256):
+            offsets = np.arange(-radius, radius + 1)
+            cube = np.stack(np.meshgrid(offsets, offsets, offsets, indexing="ij"), axis=-1).reshape(-1, 3)
+            candidates = rgb + cube[np.abs(cube).max(axis=1) == radius]
+            candidates = candidates[np.all((candidates >= 0) & (candidates <= 255), axis=1)]
+
+            free = candidates[~self.is_used((candidates[:, 0] << 16) | (candidates[:, 1] << 8) | candidates[:, 2])]
+            if len(free) > 0:
+                closest = free[np.argmin(((free - rgb) ** 2).sum(axis=1))]
+                return "#{:02x}{:02x}{:02x}".format(*closest)
+
+        raise RuntimeError("Every color is used by the image.")
+
+    def distinct_unused(self, k, exclude=()):
+        """
+        Finds k unused colors that are as far apart from each other as possible.
+
+        :param k: The number of colors to find.
+        :param exclude: Colors (hex codes or RGB tuples) the chosen colors should also be far from.
+        :return: A list of k hex color codes (strings) that are not present in the image.
+        """
+        candidates = self.LATTICE[~self.is_used((self.LATTICE[:, 0] << 16) | (self.LATTICE[:, 1] << 8) | self.LATTICE[:, 2])]
+        if len(candidates) < k:
+            # the lattice is (almost) fully used, take the unused colors closest to the lattice points instead
+            candidates = np.array([ImageColor.getcolor(self.nearest_unused(tuple(c)), "RGB") for c in self.LATTICE])
+            candidates = np.unique(candidates, axis=0)
+
+        # greedily pick the candidate farthest from all the colors picked so far (farthest-point sampling)
+        distances = np.full(len(candidates), np.inf)
+        for color in exclude:
+            rgb = np.array(ImageColor.getcolor(color, "RGB") if isinstance(color, str) else color)
+            distances = np.minimum(distances, ((candidates - rgb) ** 2).sum(axis=1))
+
+        colors = []
+        index = random.randrange(len(candidates)) if len(exclude) == 0 else int(np.argmax(distances))
+        for _ in range(min(k, len(candidates))):
+            colors.append("#{:02x}{:02x}{:02x}".format(*candidates[index]))
+            distances = np.minimum(distances, ((candidates - candidates[index]) ** 2).sum(axis=1))
+            index = int(np.argmax(distances))
+        return colors
+
 
-    # Find the first color in available_colors not in unique_colors
-    for color in available_colors:
-        if color not in unique_colors:
+def get_a_different_color(image):
+    # Find the first CSS4 color (from Matplotlib) that is not in the image
+    color_index = ColorIndex(image)
+    for color in mcolors.CSS4_COLORS.values():
+        if color not in color_index:
             return color
 
     # Fallback if all predefined colors are in the image
-    return "#000000" if "#000000" not in unique_colors else "#FFFFFF"
+    return "#000000" if "#000000" not in color_index else "#FFFFFF"
 
 
 def find_unused_color(image):
@@ -538,17 +615,21 @@ def find_unused_color(image):
     :param image: A PIL.Image object.
     :return: A hex color code (string) that is not present in the image.
     """
-    # Convert the image to RGB and get all pixel colors
-    image = image.convert("RGB")
-    pixels = set(image.getdata())
+    # Take the unused color closest to a random color
+    random_color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
+    return ColorIndex(image).nearest_unused(random_color)
 
-    # Generate random colors until we find one that is not in the image
-    while True:
-        # Generate a random RGB color
-        random_color = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
-        if random_color not in pixels:
-            # Convert to hex code and return
-            return "#{:02x}{:02x}{:02x}".format(*random_color)
+
+def find_unused_colors(image, k, exclude=()):
+    """
+    Finds k distinct colors (hex codes) that do not exist in the given PIL image.
+
+    :param image: A PIL.Image object.
+    :param k: The number of colors to find.
+    :param exclude: Colors the chosen colors should be far from.
+    :return: A list of hex color codes (strings) that are not present in the image, as far apart as possible.
+    """
+    return ColorIndex(image).distinct_unused(k, exclude=exclude)
 
 
 def insert_point_style_to_html(html_code, color="#FF69B4"):
@@ -577,6 +658,21 @@ def insert_point_style_to_html(html_code, color="#FF69B4"):
     return html_code
 
 
+def tag_point_lines(modified_lines, index):
+    # mark the points added by the modified lines with an extra class, so they can be colored per intent
+    return [(original, re.sub(r"\blocation-point\b", f"location-point location-point-{index}", modified))
+            for original, modified in modified_lines]
+
+
+def insert_point_colors_to_html(html_code, colors):
+    # color the points of each intent (tagged with `tag_point_lines`) with its own color
+    pointing_style = "\n".join(
+        f".location-point.location-point-{index} {{ background-color: {color}; }}"
+        for index, color in enumerate(colors)
+    )
+    return html_code.replace("</style>", pointing_style + "\n</style>")
+
+
 def modify_html(html_code, modified_lines):
     updated_html = []
     for line in html_code.split("\n"):
@@ -0,0 +1,138 @@
+import os
+import json
+import atexit
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait
+import vl_convert as vlc
+
+# The number of specs a worker process renders concurrently (vl-convert runs the conversion in native code)
+VEGALITE_THREADS = int(os.environ.get("VEGALITE_THREADS", min(8, os.cpu_count() or 1)))
+# Check the specs against the Vega-Lite schema before rendering them (set to 0 to disable)
+VEGALITE_VALIDATE = os.environ.get("VEGALITE_VALIDATE", "1") == "1"
+# The longest time (in seconds) a single spec may take to render
+VEGALITE_TIMEOUT = 20
+
+WARM_UP_SPEC = {
+    "data": {"values": [{"a": "A", "b": 1}]},
+    "mark": "bar",
+    "encoding": {"x": {"field": "a", "type": "nominal"}, "y": {"field": "b", "type": "quantitative"}},
+}
+
+
+class VegaLiteError(RuntimeError):
+    pass
+
+
+@lru_cache(maxsize=None)
+def get_schema_validator():
+    # The Vega-Lite schema bundled with Altair, or None if Altair or jsonschema are not installed
+    try:
+        from jsonschema.validators import validator_for
+        from altair.vegalite.v5.schema.core import load_schema
+    except ImportError:
+        return None
+    schema = load_schema()
+    return validator_for(schema)(schema)
+
+
+def validate_vegalite(spec):
+    """
+    Checks a spec against the Vega-Lite schema, so invalid specs fail fast instead of rendering a broken chart.
+
+    :param spec: The Vega-Lite spec, as a dict.
+    :raises VegaLiteError: If the spec is not valid.
+    """
+    validator = get_schema_validator()
+    if validator is None: return
+
+    from jsonschema.exceptions import best_match
+    error = best_match(validator.iter_errors(spec))
+    if error is not None:
+        path = "/".join(str(part) for part in error.absolute_path)
+        raise VegaLiteError(f"Invalid Vega-Lite spec at '{path}': {error.message[:500]}")
+
+
+class VegaLiteRenderer:
+    """
+    Renders batches of Vega-Lite specs concurrently on a thread pool, sharing the vl-convert
+    context (its JavaScript runtime and fonts) of the worker process, which is warmed up once.
+
+    A conversion that is already running can't be stopped: a spec that times out keeps its thread
+    until vl-convert returns, so the pool is replaced by a new one and the stuck threads are left to
+    finish on their own.
+
+    :param num_threads: The number of specs rendered at the same time.
+    :param validate: Whether to validate the specs against the Vega-Lite schema first.
+    """
+
+    def __init__(self, num_threads=VEGALITE_THREADS, validate=VEGALITE_VALIDATE):
+        self.num_threads = num_threads
+        self.validate = validate
+        self.executor = ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix="vegalite")
+        self._executor_lock = threading.Lock()
+        # The first conversion starts the JavaScript runtime and loads the fonts, if it fails every spec
+        # still gets its own attempt (and error)
+        try:
+            vlc.vegalite_to_png(vl_spec=WARM_UP_SPEC)
+        except Exception as e:
+            print(f"Error: Could not warm up vl-convert: {e}")
+        if self.validate: get_schema_validator()
+
+    def _render(self, spec, scale):
+        if isinstance(spec, str):
+            spec = json.loads(spec)
+        if self.validate:
+            validate_vegalite(spec)
+        return vlc.vegalite_to_png(vl_spec=spec, scale=scale)
+
+    def render_batch(self, specs, timeout=VEGALITE_TIMEOUT):
+        """
+        Renders a batch of specs.
+
+        :param specs: A list of `(spec, scale)` tuples, the spec either as a dict or as a JSON string.
+        :param timeout: The longest time (in seconds) to wait for a single spec.
+        :return: A list with the PNG bytes of each spec, or the exception raised while rendering it.
+        """
+        with self._executor_lock:
+            executor = self.executor
+            futures = [executor.submit(self._render, spec, scale) for spec, scale in specs]
+        # Every spec gets `timeout` seconds of the thread pool on average
+        wait(futures, timeout=timeout * max(1, len(futures) / self.num_threads))
+
+        results = []
+        stuck = False
+        for future in futures:
+            if not future.done():
+                # Only the specs still queued are cancelled, the running ones hold their thread
+                if not future.cancel(): stuck = True
+                results.append(VegaLiteError(f"Rendering exceeded {timeout} seconds."))
+            elif future.exception() is not None:
+                results.append(future.exception())
+            else:
+                results.append(future.result())
+
+        if stuck:
+            # Later batches get a pool with all of its threads, the old one finishes the specs it already has
+            with self._executor_lock:
+                if self.executor is executor:
+                    self.executor = ThreadPoolExecutor(max_workers=self.num_threads, thread_name_prefix="vegalite")
+                    executor.shutdown(wait=False)
+        return results
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_VEGALITE_RENDERER = None
+_VEGALITE_RENDERER_PID = None
+
+
+def get_vegalite_renderer():
+    # The thread pool of a parent process does not exist after a fork
+    global _VEGALITE_RENDERER, _VEGALITE_RENDERER_PID
+    if _VEGALITE_RENDERER is None or _VEGALITE_RENDERER_PID != os.getpid():
+        _VEGALITE_RENDERER = VegaLiteRenderer()
+        _VEGALITE_RENDERER_PID = os.getpid()
+        atexit.register(_VEGALITE_RENDERER.close)
+    return _VEGALITE_RENDERER
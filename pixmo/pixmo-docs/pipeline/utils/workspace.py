@@ -0,0 +1,144 @@
+import os
+import atexit
+import socket
+import hashlib
+import tempfile
+import threading
+from shutil import rmtree
+from contextlib import contextmanager
+
+# Use /dev/shm only if it has this much free space (in MB), Docker's default of 64 MB fills up with a few PDFs
+WORKSPACE_MIN_SHM_SIZE = int(os.environ.get("RENDER_WORKSPACE_MIN_SHM_SIZE", 1024))
+
+
+def _default_root():
+    # Prefer tmpfs, the intermediate files of a render never need to hit the disk
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        stats = os.statvfs("/dev/shm")
+        if stats.f_bavail * stats.f_frsize >= WORKSPACE_MIN_SHM_SIZE * 1024 * 1024:
+            return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def _host_tag():
+    # The pids of the scratch areas only mean something on the machine (and in the PID namespace) that created them,
+    # and the root may be shared with other containers or hosts
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            boot_id = f.read().strip()
+    except OSError:
+        boot_id = ""
+    return hashlib.sha256(f"{socket.gethostname()}-{boot_id}".encode("utf-8")).hexdigest()[:12]
+
+
+# Where the scratch directories of the render workers are created
+WORKSPACE_ROOT = os.environ.get("RENDER_WORKSPACE_ROOT", _default_root())
+WORKSPACE_PREFIX = f"pixmo_render_{_host_tag()}_"
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove_workspace(pid):
+    # Remove the scratch area of a worker process that was killed (it can't clean up after itself)
+    rmtree(os.path.join(WORKSPACE_ROOT, f"{WORKSPACE_PREFIX}{pid}"), ignore_errors=True)
+
+
+def clear_directory(path):
+    # Remove the contents of a directory, keeping the directory itself
+    try:
+        entries = list(os.scandir(path))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                rmtree(entry.path, ignore_errors=True)
+            else:
+                os.unlink(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+class Workspace:
+    """
+    The scratch area of one worker process: a directory on tmpfs with one reusable subdirectory per
+    kind of job, wiped between jobs instead of creating (and leaking) a new temporary directory per row.
+
+    :param root: The directory the scratch area is created in.
+    """
+
+    def __init__(self, root=WORKSPACE_ROOT):
+        self.root = root
+        self.path = None
+        self._pid = None
+
+    def _ensure_path(self):
+        # A workspace inherited from a parent process (e.g. a forked sandbox worker) belongs to the parent
+        if self.path is not None and self._pid == os.getpid():
+            return self.path
+        self._pid = os.getpid()
+        self.path = os.path.join(self.root, f"{WORKSPACE_PREFIX}{self._pid}")
+        os.makedirs(self.path, exist_ok=True)
+        self.remove_stale()
+        return self.path
+
+    def remove_stale(self):
+        # Remove the scratch areas of workers of this machine that were killed before they could clean up
+        for entry in os.scandir(self.root):
+            if not entry.name.startswith(WORKSPACE_PREFIX) or not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                pid = int(entry.name[len(WORKSPACE_PREFIX):])
+            except ValueError:
+                continue
+            if pid != os.getpid() and not _is_running(pid):
+                rmtree(entry.path, ignore_errors=True)
+
+    def directory(self, name="job"):
+        """
+        Gets an empty scratch directory, reused by every job of the same name in this thread.
+
+        :param name: The kind of job (e.g. "latex"), jobs with different names can be nested.
+        :return: The path of the directory.
+        """
+        path = os.path.join(self._ensure_path(), f"{name}-{threading.get_ident()}")
+        os.makedirs(path, exist_ok=True)
+        clear_directory(path)
+        return path
+
+    @contextmanager
+    def job(self, name="job"):
+        """
+        Runs a job in an empty scratch directory, which is wiped again once the job is done.
+
+        :param name: The kind of job (e.g. "latex"), jobs with different names can be nested.
+        """
+        path = self.directory(name)
+        try:
+            yield path
+        finally:
+            clear_directory(path)
+
+    def close(self):
+        if self.path is not None and self._pid == os.getpid():
+            rmtree(self.path, ignore_errors=True)
+        self.path = None
+
+
+_WORKSPACE = None
+
+
+def get_workspace():
+    global _WORKSPACE
+    if _WORKSPACE is None:
+        _WORKSPACE = Workspace()
+        atexit.register(_WORKSPACE.close)
+    return _WORKSPACE
@@ -5,6 +5,7 @@ from .generate_chart_topics import GenerateChartTopics
 from .generate_chart_data import GenerateChartData
 from .generate_chart import GenerateChart
 from .generate_qa import GenerateChartQA
+from ..utils.streaming import run_streaming
 
 
 class VegaLiteChartPipeline(SuperStep):
@@ -41,45 +42,13 @@ class VegaLiteChartPipeline(SuperStep):
             },
         )
 
-        # Generate Data
-        generated_data = GenerateChartData(
-            "Generate Data",
-            inputs={
-                "metadata": generated_chart_topics.output["metadata"],
-                "topic": generated_chart_topics.output["topic"],
-            },
-            args={
-                "llm": self.args["llm"],
-                "batch_size": self.args["batch_size"],
-            },
-        )
-
-        # Generate Charts
-        generated_charts = GenerateChart(
-            "Generate Code",
-            inputs={
-                "metadata": generated_data.output["metadata"],
-                "topic": generated_data.output["topic"],
-                "data": generated_data.output["data"],
-            },
-            args={
-                "llm": self.args["code_llm"],
-                "batch_size": self.args["batch_size"],
-            },
-        )
-
-        if not self.args["qa"]:
-            return generated_charts.output
-        else:
-            # Generate Q&A
-            generated_qa = GenerateChartQA(
-                "Generate Q&A",
+        def run_stages(topics, suffix):
+            # Generate Data
+            generated_data = GenerateChartData(
+                f"Generate Data{suffix}",
                 inputs={
-                    "metadata": generated_charts.output["metadata"],
-                    "topic": generated_charts.output["topic"],
-                    "data": generated_charts.output["data"],
-                    "code": generated_charts.output["code"],
-                    "image": generated_charts.output["image"],
+                    "metadata": topics.output["metadata"],
+                    "topic": topics.output["topic"],
                 },
                 args={
                     "llm": self.args["llm"],
@@ -87,8 +56,44 @@ class VegaLiteChartPipeline(SuperStep):
                 },
             )
 
-            # Return result
-            return generated_qa.output
+            # Generate Charts
+            generated_charts = GenerateChart(
+                f"Generate Code{suffix}",
+                inputs={
+                    "metadata": generated_data.output["metadata"],
+                    "topic": generated_data.output["topic"],
+                    "data": generated_data.output["data"],
+                },
+                args={
+                    "llm": self.args["code_llm"],
+                    "batch_size": self.args["batch_size"],
+                },
+            )
+
+            if not self.args["qa"]:
+                return generated_charts
+            else:
+                # Generate Q&A
+                generated_qa = GenerateChartQA(
+                    f"Generate Q&A{suffix}",
+                    inputs={
+                        "metadata": generated_charts.output["metadata"],
+                        "topic": generated_charts.output["topic"],
+                        "data": generated_charts.output["data"],
+                        "code": generated_charts.output["code"],
+                        "image": generated_charts.output["image"],
+                    },
+                    args={
+                        "llm": self.args["llm"],
+                        "batch_size": self.args["batch_size"],
+                    },
+                )
+
+                # Return result
+                return generated_qa
+
+        # Run the stages after the topics, shard by shard when streaming is enabled
+        return run_streaming(generated_chart_topics, run_stages, name="Combine Shards").output
 
     @property
     def version(self):